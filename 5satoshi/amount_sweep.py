@@ -0,0 +1,352 @@
+#!/usr/bin/python
+
+import argparse
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse import csgraph
+
+import tracing
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+)
+logger = logging.getLogger("AmountSweep")
+
+CHUNK = 128
+TOLERANCE = 1e-6
+
+# -----------------------------
+# Edges
+# -----------------------------
+def prepare(channels, nodes, seed=0):
+    """
+    Active channels as edge arrays over the node index. Fees are in msat and
+    affine in the amount: base + amount_sat * ppm * 1000 + jitter, with one
+    fixed jitter per edge so shortest paths are unique at every amount.
+    """
+    ch = channels[channels['active'].astype(bool)]
+    index = pd.Index(nodes['nodeid'])
+    src = index.get_indexer(ch['source'])
+    dst = index.get_indexer(ch['destination'])
+    keep = (src >= 0) & (dst >= 0)
+    ch = ch[keep]
+    rng = np.random.default_rng(seed)
+    return {
+        'nodeids': index,
+        'src': src[keep],
+        'dst': dst[keep],
+        'base': ch['base_fee_millisatoshi'].to_numpy(dtype=float),
+        'ppm': ch['fee_per_millionth'].to_numpy(dtype=float) / 1_000_000,
+        'jitter': rng.uniform(1e-3, 1, keep.sum()),
+        'htlc_min': ch['htlc_minimum_msat'].astype('int64').to_numpy(),
+        'htlc_max': ch['htlc_maximum_msat'].astype('int64').to_numpy(),
+        'short_channel_id': ch['short_channel_id'].to_numpy(),
+        'direction': ch['direction'].to_numpy() if 'direction' in ch else np.zeros(len(ch), dtype=int),
+    }
+
+
+class AmountGraph:
+    """
+    The filtered graph at one amount: edge mask, weights, the cheapest edge
+    per (source, destination) pair as a CSR matrix and the largest SCC.
+    """
+
+    def __init__(self, edges, amount_sat):
+        n = len(edges['nodeids'])
+        msat = amount_sat * 1000
+        self.amount = amount_sat
+        self.mask = (edges['htlc_max'] > msat) & (edges['htlc_min'] < msat)
+        self.weight = edges['base'] + amount_sat * edges['ppm'] * 1000 + edges['jitter']
+
+        e = np.flatnonzero(self.mask)
+        order = np.lexsort((self.weight[e], edges['dst'][e], edges['src'][e]))
+        e = e[order]
+        first = np.ones(len(e), dtype=bool)
+        first[1:] = (np.diff(edges['src'][e]) != 0) | (np.diff(edges['dst'][e]) != 0)
+        chosen = e[first]
+
+        u, v = edges['src'][chosen], edges['dst'][chosen]
+        self.matrix = sp.csr_matrix((self.weight[chosen], (u, v)), shape=(n, n))
+        self.edge_ids = sp.csr_matrix((chosen + 1, (u, v)), shape=(n, n))
+
+        _, labels = csgraph.connected_components(self.matrix, directed=True, connection='strong')
+        self.in_scc = labels == np.bincount(labels).argmax()
+
+    def tree_edges(self, pred):
+        """
+        Edge id of every tree edge pred[s, t] -> t (-1 for sources/unreachable).
+        """
+        out = np.full(pred.shape, -1, dtype=np.int64)
+        r, c = np.nonzero(pred >= 0)
+        if len(r):
+            out[r, c] = np.asarray(self.edge_ids[pred[r, c], c]).ravel() - 1
+        return out
+
+# -----------------------------
+# Trees
+# -----------------------------
+class Trees:
+    """
+    Shortest-path trees of a chunk of sources at one amount.
+    """
+
+    def __init__(self, dist, pred, edges):
+        self.dist = dist
+        self.pred = pred
+        self.edges = edges
+
+    def same_as(self, other):
+        return (self.pred == other.pred).all(axis=1) & (self.edges == other.edges).all(axis=1)
+
+
+def subtree_sizes(trees, rows, graph):
+    """
+    Per row of the chunk: which vertices the source reaches, which of them
+    are SCC targets (weight) and how many SCC targets sit at or below each
+    vertex in the source's tree (size).
+    """
+    pred = trees.pred[rows]
+    reached = pred >= 0
+    weight = (reached & graph.in_scc[None, :]).astype(float)
+
+    r_idx = np.arange(len(rows))[:, None]
+    depth = np.zeros(pred.shape, dtype=np.int32)
+    cur = pred
+    while True:
+        active = cur >= 0
+        if not active.any():
+            break
+        depth += active
+        cur = np.where(active, pred[r_idx, np.maximum(cur, 0)], -1)
+
+    size = weight.copy()
+    for d in range(depth.max(), 1, -1):
+        r, c = np.nonzero(depth == d)
+        np.add.at(size, (r, pred[r, c]), size[r, c])
+    return reached, weight, size
+
+
+def accumulate(trees, sources, graph, v_scores, e_scores):
+    """
+    Add the pair counts of one chunk to the score arrays. Paths are unique,
+    so a vertex carries every SCC target below it in the source's tree and
+    a tree edge every SCC target below its head.
+    """
+    rows = np.flatnonzero(graph.in_scc[sources])
+    if not len(rows):
+        return
+    reached, weight, size = subtree_sizes(trees, rows, graph)
+    v_scores += np.where(reached, size - weight, 0).sum(axis=0)
+    edges = trees.edges[rows]
+    np.add.at(e_scores, edges[reached], size[reached])
+
+# -----------------------------
+# Sweep
+# -----------------------------
+class AmountSweep:
+    """
+    Node and edge betweenness over a grid of amounts.
+
+    Fees are affine in the amount, so a path's cost is affine too: a tree
+    that is optimal at two amounts is optimal at every amount in between,
+    unless an edge that only passes the HTLC filter strictly inside the
+    interval cuts it short. Amounts are bisected per chunk of sources and
+    only the sources whose trees differ at the interval ends, or fail that
+    check, get a new Dijkstra at the midpoint.
+    """
+
+    def __init__(self, edges, amounts, chunk=CHUNK, logger=logger):
+        self.edges = edges
+        self.amounts = list(amounts)
+        self.chunk = chunk
+        self.logger = logger
+        self.n = len(edges['nodeids'])
+        self.m = len(edges['src'])
+        with tracing.span("sweep.graphs", amounts=len(self.amounts)):
+            self.graphs = [AmountGraph(edges, a) for a in self.amounts]
+        self.v_scores = np.zeros((len(self.amounts), self.n))
+        self.e_scores = np.zeros((len(self.amounts), self.m))
+        self.dijkstras = 0
+
+    def _solve(self, k, sources):
+        graph = self.graphs[k]
+        dist, pred = csgraph.dijkstra(graph.matrix, directed=True, indices=sources, return_predecessors=True)
+        self.dijkstras += len(sources)
+        return Trees(dist, pred, graph.tree_edges(pred))
+
+    def _interpolate(self, lo, hi, k, t_lo, t_hi, sources):
+        """
+        Trees at amount k from the trees at lo and hi where they agree;
+        the remaining sources are solved directly.
+        """
+        same = t_lo.same_as(t_hi)
+        a_lo, a_hi, a = self.amounts[lo], self.amounts[hi], self.amounts[k]
+        frac = (a - a_lo) / (a_hi - a_lo)
+        with np.errstate(invalid='ignore'):
+            dist = np.where(np.isinf(t_lo.dist), np.inf, t_lo.dist + frac * (t_hi.dist - t_lo.dist))
+
+        # Edges that may exist at k without existing at both ends
+        g = self.graphs[k]
+        new = np.flatnonzero(g.mask & ~(self.graphs[lo].mask & self.graphs[hi].mask))
+        if len(new) and same.any():
+            u, v = self.edges['src'][new], self.edges['dst'][new]
+            rows = np.flatnonzero(same)
+            d = dist[rows]
+            with np.errstate(invalid='ignore'):
+                shorter = d[:, u] + g.weight[new][None, :] < d[:, v] - TOLERANCE * np.maximum(1, d[:, v])
+            same[rows[shorter.any(axis=1)]] = False
+
+        pred = t_lo.pred.copy()
+        edges = t_lo.edges.copy()
+        redo = np.flatnonzero(~same)
+        if len(redo):
+            fresh = self._solve(k, sources[redo])
+            dist[redo], pred[redo], edges[redo] = fresh.dist, fresh.pred, fresh.edges
+        return Trees(dist, pred, edges)
+
+    def _bisect(self, lo, hi, t_lo, t_hi, sources):
+        if hi - lo <= 1:
+            return
+        mid = (lo + hi) // 2
+        t_mid = self._interpolate(lo, hi, mid, t_lo, t_hi, sources)
+        accumulate(t_mid, sources, self.graphs[mid], self.v_scores[mid], self.e_scores[mid])
+        self._bisect(lo, mid, t_lo, t_mid, sources)
+        self._bisect(mid, hi, t_mid, t_hi, sources)
+
+    def run(self, sources=None):
+        if sources is None:
+            sources = np.flatnonzero(np.any([g.in_scc for g in self.graphs], axis=0))
+        last = len(self.amounts) - 1
+        for start in range(0, len(sources), self.chunk):
+            chunk = sources[start:start + self.chunk]
+            with tracing.span("sweep.chunk", sources=len(chunk)):
+                t_first = self._solve(0, chunk)
+                accumulate(t_first, chunk, self.graphs[0], self.v_scores[0], self.e_scores[0])
+                if last > 0:
+                    t_last = self._solve(last, chunk)
+                    accumulate(t_last, chunk, self.graphs[last], self.v_scores[last], self.e_scores[last])
+                    self._bisect(0, last, t_first, t_last, chunk)
+        self.logger.info(
+            f"Sweep over {len(self.amounts)} amounts: {self.dijkstras} single-source Dijkstras "
+            f"({self.dijkstras / max(len(sources), 1):.1f} per source)"
+        )
+        return self
+
+    def run_independent(self, sources=None):
+        """
+        Reference: every amount solved from scratch.
+        """
+        if sources is None:
+            sources = np.flatnonzero(np.any([g.in_scc for g in self.graphs], axis=0))
+        for k, graph in enumerate(self.graphs):
+            for start in range(0, len(sources), self.chunk):
+                chunk = sources[start:start + self.chunk]
+                accumulate(self._solve(k, chunk), chunk, graph, self.v_scores[k], self.e_scores[k])
+        return self
+
+    # -----------------------------
+    # Output
+    # -----------------------------
+    def node_curves(self):
+        """
+        nodeid x amount_sat frame of node betweenness, normalized like
+        graph_tool's betweenness by (n-1)(n-2) over the SCC size.
+        """
+        sizes = np.array([g.in_scc.sum() for g in self.graphs], dtype=float)
+        norm = np.maximum((sizes - 1) * (sizes - 2), 1)
+        return pd.DataFrame((self.v_scores / norm[:, None]).T, index=self.edges['nodeids'], columns=self.amounts)
+
+    def edge_curves(self):
+        sizes = np.array([g.in_scc.sum() for g in self.graphs], dtype=float)
+        norm = np.maximum(sizes * (sizes - 1), 1)
+        index = pd.MultiIndex.from_arrays([self.edges['short_channel_id'], self.edges['direction']],
+                                          names=['short_channel_id', 'direction'])
+        return pd.DataFrame((self.e_scores / norm[:, None]).T, index=index, columns=self.amounts)
+
+
+def amount_grid(lo=100, hi=10_000_000, points=30):
+    return sorted(set(int(round(a)) for a in np.geomspace(lo, hi, points)))
+
+# -----------------------------
+# Loading
+# -----------------------------
+def load_inputs(args):
+    if args.channels_file and args.nodes_file:
+        read = pd.read_parquet if args.channels_file.endswith(".parquet") else pd.read_csv
+        channels, nodes = read(args.channels_file), read(args.nodes_file)
+        channels = channels.sort_values(['source', 'destination', 'short_channel_id'], ignore_index=True)
+        nodes = nodes.sort_values('nodeid', ignore_index=True)
+        return channels, nodes, channels['last_update'].max()
+    from betweenness_centrality import load_data
+    return load_data(logger)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Betweenness centrality swept over payment amounts")
+    parser.add_argument("--channels-file", help="Parquet/CSV of listchannels (default: BigQuery channels)")
+    parser.add_argument("--nodes-file", help="Parquet/CSV of listnodes (default: BigQuery nodes)")
+    parser.add_argument("--min-sat", type=int, default=100)
+    parser.add_argument("--max-sat", type=int, default=10_000_000)
+    parser.add_argument("--points", type=int, default=30, help="Log-spaced amounts between min and max")
+    parser.add_argument("--chunk", type=int, default=CHUNK, help="Sources per chunk")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the fee jitter")
+    parser.add_argument("--sources", type=int, default=None, help="Only use this many random sources (partial sums)")
+    parser.add_argument("--benchmark", action="store_true", help="Also solve every amount independently and compare")
+    parser.add_argument("--output", help="Write node curves to this Parquet file")
+    parser.add_argument("--edge-output", help="Write edge curves to this Parquet file")
+    parser.add_argument("--upload", action="store_true", help="Append node curves to BigQuery betweenness_sweep")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    tracing.configure_from_args("amount_sweep", args)
+
+    channels, nodes, latest_update = load_inputs(args)
+    edges = prepare(channels, nodes, args.seed)
+    amounts = amount_grid(args.min_sat, args.max_sat, args.points)
+
+    sweep = AmountSweep(edges, amounts, args.chunk)
+    sources = np.flatnonzero(np.any([g.in_scc for g in sweep.graphs], axis=0))
+    if args.sources:
+        sources = np.sort(np.random.default_rng(args.seed).choice(sources, min(args.sources, len(sources)), replace=False))
+    logger.info(f"{len(amounts)} amounts, {len(sources)} sources, {sweep.n} nodes, {sweep.m} edges")
+
+    start = time.time()
+    with tracing.span("sweep"):
+        sweep.run(sources)
+    elapsed = time.time() - start
+    logger.info(f"Sweep finished in {elapsed:.1f}s")
+
+    if args.benchmark:
+        reference = AmountSweep(edges, amounts, args.chunk)
+        start = time.time()
+        with tracing.span("sweep.independent"):
+            reference.run_independent(sources)
+        ref_elapsed = time.time() - start
+        diff = np.abs(sweep.v_scores - reference.v_scores).max()
+        logger.info(
+            f"Independent runs: {ref_elapsed:.1f}s, {reference.dijkstras} Dijkstras; "
+            f"sweep: {elapsed:.1f}s, {sweep.dijkstras} Dijkstras "
+            f"({ref_elapsed / max(elapsed, 1e-9):.1f}x faster), max score difference {diff:g}"
+        )
+
+    curves = sweep.node_curves()
+    top = curves.max(axis=1).sort_values(ascending=False).index[:10]
+    print(curves.loc[top].to_string())
+
+    if args.output:
+        out = curves.copy()
+        out.columns = out.columns.astype(str)
+        out.to_parquet(args.output)
+    if args.edge_output:
+        out = sweep.edge_curves()
+        out.columns = out.columns.astype(str)
+        out.reset_index().to_parquet(args.edge_output, index=False)
+    if args.upload:
+        import bqload
+        long = curves.rename_axis('nodeid').reset_index().melt(id_vars='nodeid', var_name='amount_sat', value_name='shortest_path_share')
+        long['timestamp'] = latest_update
+        bqload.upload(long, "lightning-fee-optimizer.version_1.betweenness_sweep", if_exists='append')
@@ -1,39 +1,39 @@
-from pyln.client import LightningRpc
 from datetime import datetime
+import logging
 import os
 
-RPC_PATH = os.environ['HOME']+"/.lightning/bitcoin/lightning-rpc"
+import tracing
+from closure_index import ClosureIndex
 
-def parse_close_info(channel):
-    close_info = channel.get('close_info')
-    if close_info:
-        closed_at = close_info.get('closed_at')
-        closed_at_str = datetime.utcfromtimestamp(closed_at).strftime('%Y-%m-%d %H:%M:%S') if closed_at else "unknown"
-        return {
-            'peer_id': channel.get('peer_id', 'unknown'),
-            'short_channel_id': channel.get('short_channel_id', 'unknown'),
-            'state': channel.get('state'),
-            'closer': close_info.get('closer', 'unknown'),
-            'reason': close_info.get('reason', 'unknown'),
-            'closed_at': closed_at,
-            'closed_at_str': closed_at_str
-        }
-    return None
+RPC_PATH = os.environ['HOME']+"/.lightning/bitcoin/lightning-rpc"
+INDEX_PATH = os.environ.get("CLTOOLS_CLOSURE_INDEX")
+
+def format_closure(row):
+    closed_at = row.get('closed_at')
+    closed_at_str = datetime.utcfromtimestamp(closed_at).strftime('%Y-%m-%d %H:%M:%S') if closed_at else "unknown"
+    return {
+        'peer_id': row.get('peer_id') or 'unknown',
+        'short_channel_id': row.get('short_channel_id') or 'unknown',
+        'state': row.get('state'),
+        'closer': row.get('closer') or 'unknown',
+        'reason': row.get('cause') or 'unknown',
+        'closed_at': closed_at,
+        'closed_at_str': closed_at_str
+    }
 
 def get_recent_closed_channels(rpc, limit=5):
-    channels = rpc.call("listpeerchannels")['channels']
-    closed = []
-
-    for chan in channels:
-        if chan.get('state', '').endswith('CLOSED') or chan.get('state', '') == 'ONCHAIN':
-            info = parse_close_info(chan)
-            if info:
-                closed.append(info)
-
-    closed.sort(key=lambda x: x.get('closed_at', 0), reverse=True)
-    return closed[:limit]
+    # Incremental: only closures lightningd added since the last run are converted
+    index = ClosureIndex(INDEX_PATH) if INDEX_PATH else ClosureIndex()
+    try:
+        index.sync(rpc)
+        return [format_closure(row) for row in index.recent(limit)]
+    finally:
+        index.close()
 
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    tracing.configure("analyse-closure")
+    from pyln.client import LightningRpc
     rpc = LightningRpc(RPC_PATH)
     closures = get_recent_closed_channels(rpc)
 
@@ -0,0 +1,278 @@
+#!/usr/bin/python
+
+import argparse
+import itertools
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+import tracing
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+)
+logger = logging.getLogger("FeeBacktest")
+
+# update_fees in fee-updates.py:        val=1, factor=1,    offset=0, balance_offset=1
+# legacy fee-updates/fee-updates.py:    val=1, factor=0.95, offset=1, balance_offset=1000000
+POLICY_FIELDS = ["exponent", "cap", "factor", "val", "offset", "balance_offset"]
+
+# -----------------------------
+# Policies
+# -----------------------------
+def policy_grid(exponents=(2,), caps=(10000,), factors=(1.0,), vals=(1,), offsets=(0,), balance_offsets=(1,)):
+    """
+    Cartesian product of policy parameters as a DataFrame, one row per policy:
+    ppm = clip(val * floor(1 / (balance * factor)) ** exponent - offset, 0, cap)
+    with balance = (to_us_msat + balance_offset) / total_msat.
+    """
+    rows = itertools.product(exponents, caps, factors, vals, offsets, balance_offsets)
+    return pd.DataFrame(list(rows), columns=POLICY_FIELDS)
+
+
+def policy_ppm(to_us, total, p):
+    """
+    Vectorized policy evaluation; to_us/total broadcast against the
+    (1, policies) parameter rows in p.
+    """
+    balance = np.maximum((to_us + p['balance_offset']) / total, 1e-9)
+    steps = np.minimum(np.floor(1 / (balance * p['factor'])), 1e6)
+    ppm = p['val'] * steps ** p['exponent'] - p['offset']
+    return np.clip(ppm, 0, p['cap'])
+
+# -----------------------------
+# Data preparation
+# -----------------------------
+def prepare(forwards, channels, bucket="1h"):
+    """
+    Index settled forwards by channel and time bucket.
+
+    forwards needs in_channel, out_channel, in_msat, out_msat, fee_msat,
+    received_time; channels needs short_channel_id, to_us_msat, total_msat
+    (current state). Starting balances are backed out from the current
+    ones by undoing the historical flows.
+    """
+    fw = forwards[forwards['status'] == 'settled'] if 'status' in forwards else forwards
+    fw = fw.dropna(subset=['in_channel', 'out_channel', 'in_msat', 'out_msat', 'received_time'])
+
+    channels = channels.dropna(subset=['short_channel_id']).drop_duplicates('short_channel_id')
+    scids = pd.Index(channels['short_channel_id'])
+    in_idx = scids.get_indexer(fw['in_channel'])
+    out_idx = scids.get_indexer(fw['out_channel'])
+    known = (in_idx >= 0) & (out_idx >= 0)
+    if (~known).any():
+        logger.info(f"Skipping {(~known).sum()} forwards on channels without capacity data")
+    fw = fw[known]
+    in_idx, out_idx = in_idx[known], out_idx[known]
+
+    received = pd.to_datetime(fw['received_time'], utc=True)
+    order = np.argsort(received.values, kind='stable')
+    received = received.iloc[order]
+    in_idx, out_idx = in_idx[order], out_idx[order]
+    in_msat = fw['in_msat'].to_numpy(dtype=float)[order]
+    out_msat = fw['out_msat'].to_numpy(dtype=float)[order]
+    fee_msat = fw['fee_msat'].fillna(0).to_numpy(dtype=float)[order]
+
+    bucket_ids = received.dt.floor(bucket)
+    _, starts = np.unique(bucket_ids.values, return_index=True)
+    bounds = np.append(starts, len(bucket_ids))
+    days = received.dt.floor("1D").values
+    day_labels, day_of_bucket = np.unique(days[starts], return_inverse=True)
+
+    total = channels['total_msat'].to_numpy(dtype=float)
+    current = channels['to_us_msat'].to_numpy(dtype=float)
+    net = np.bincount(in_idx, weights=in_msat, minlength=len(scids)) - np.bincount(out_idx, weights=out_msat, minlength=len(scids))
+    initial = np.clip(current - net, 0, total)
+
+    return {
+        'scids': scids,
+        'total': total,
+        'initial': initial,
+        'in_idx': in_idx,
+        'out_idx': out_idx,
+        'in_msat': in_msat,
+        'out_msat': out_msat,
+        # Fee rate the network actually accepted for each forward
+        'observed_ppm': fee_msat / np.maximum(out_msat, 1) * 1e6,
+        'bounds': bounds,
+        'day_of_bucket': day_of_bucket,
+        'days': pd.to_datetime(day_labels),
+    }
+
+# -----------------------------
+# Engine
+# -----------------------------
+def simulate_chunk(data, p, elasticity=1.0, htlc_margin=0.05):
+    """
+    Replay all buckets for one chunk of policies.
+
+    State is a (channels, policies) balance matrix; each bucket's forwards
+    are evaluated as a (forwards, policies) block against the balances at
+    the start of the bucket. A forward is kept with weight
+    exp(-elasticity * relative fee increase over the observed fee), and
+    only if it fits under the policy's expected htlc_max.
+    """
+    k = len(p['cap'])
+    n_days = len(data['days'])
+    total = data['total'][:, None]
+    to_us = np.repeat(data['initial'][:, None], k, axis=1)
+
+    revenue = np.zeros(k)
+    volume = np.zeros(k)
+    count = np.zeros(k)
+    daily_revenue = np.zeros((n_days, k))
+    daily_balance = np.zeros((n_days, k))
+    last_day = -1
+
+    bounds = data['bounds']
+    for b in range(len(bounds) - 1):
+        lo, hi = bounds[b], bounds[b + 1]
+        in_c = data['in_idx'][lo:hi]
+        out_c = data['out_idx'][lo:hi]
+        out_msat = data['out_msat'][lo:hi, None]
+        in_msat = data['in_msat'][lo:hi, None]
+        observed = data['observed_ppm'][lo:hi, None]
+
+        bal = to_us[out_c]
+        cap = total[out_c]
+        ppm = policy_ppm(bal, cap, p)
+
+        fits = out_msat <= bal - htlc_margin * cap
+        increase = np.maximum(ppm - observed, 0) / (observed + 1)
+        weight = np.exp(-elasticity * increase) * fits
+
+        fee = weight * out_msat * ppm / 1e6
+        revenue += fee.sum(axis=0)
+        volume += (weight * out_msat).sum(axis=0)
+        count += weight.sum(axis=0)
+
+        np.add.at(to_us, out_c, -weight * out_msat)
+        np.add.at(to_us, in_c, weight * in_msat)
+        np.clip(to_us, 0, total, out=to_us)
+
+        day = data['day_of_bucket'][b]
+        daily_revenue[day] += fee.sum(axis=0)
+        if day != last_day:
+            daily_balance[day] = (to_us / total).mean(axis=0)
+            last_day = day
+
+    return {
+        'revenue_msat': revenue,
+        'volume_msat': volume,
+        'forwards': count,
+        'final_mean_balance': (to_us / total).mean(axis=0),
+        'final_depleted_channels': (to_us < htlc_margin * total).sum(axis=0),
+        'daily_revenue': daily_revenue,
+        'daily_balance': daily_balance,
+    }
+
+
+def backtest(data, policies, chunk=128, elasticity=1.0, trajectories=False):
+    """
+    Evaluate every policy row, chunk policies at a time so memory stays at
+    O(channels * chunk + forwards_per_bucket * chunk).
+    """
+    summaries = []
+    daily_revenue = []
+    daily_balance = []
+    for start in range(0, len(policies), chunk):
+        part = policies.iloc[start:start + chunk]
+        p = {f: part[f].to_numpy(dtype=float)[None, :] for f in POLICY_FIELDS}
+        with tracing.span("backtest.chunk", policies=len(part), forwards=len(data['out_idx'])):
+            res = simulate_chunk(data, p, elasticity)
+        summaries.append(pd.DataFrame({
+            k: v for k, v in res.items() if k not in ('daily_revenue', 'daily_balance')
+        }, index=part.index))
+        if trajectories:
+            daily_revenue.append(res['daily_revenue'])
+            daily_balance.append(res['daily_balance'])
+
+    result = policies.join(pd.concat(summaries))
+    result['revenue_sat'] = result['revenue_msat'] / 1000
+    result = result.sort_values('revenue_msat', ascending=False)
+
+    if not trajectories:
+        return result, None
+    days = data['days']
+    traj = {
+        'daily_revenue': pd.DataFrame(np.hstack(daily_revenue), index=days, columns=policies.index),
+        'daily_balance': pd.DataFrame(np.hstack(daily_balance), index=days, columns=policies.index),
+    }
+    return result, traj
+
+# -----------------------------
+# Loading
+# -----------------------------
+def read_frame(path):
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def load_inputs(args):
+    if args.forwards_file and args.channels_file:
+        return read_frame(args.forwards_file), read_frame(args.channels_file)
+
+    from google.cloud import bigquery
+    client = bigquery.Client()
+    with tracing.span("fetch.bigquery") as sp:
+        forwards = client.query(f"""
+            SELECT in_channel, out_channel, in_msat, out_msat, fee_msat, status, received_time
+            FROM `lightning-fee-optimizer.version_1.forwardings`
+            WHERE status = 'settled' AND received_time >= TIMESTAMP('{args.since}')
+        """).to_dataframe()
+        channels = client.query("""
+            SELECT short_channel_id, to_us_msat, total_msat
+            FROM `lightning-fee-optimizer.version_1.peers`
+            WHERE state = 'CHANNELD_NORMAL'
+        """).to_dataframe()
+        sp.set(forwards=len(forwards), channels=len(channels))
+    return forwards, channels
+
+
+def floats(text):
+    return [float(x) for x in text.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest fee policies against historical forwards")
+    parser.add_argument("--forwards-file", help="Parquet/CSV of forwards (default: BigQuery forwardings)")
+    parser.add_argument("--channels-file", help="Parquet/CSV with short_channel_id, to_us_msat, total_msat")
+    parser.add_argument("--since", default=str((pd.Timestamp.now() - pd.Timedelta(days=365)).date()), help="Start date of the replay")
+    parser.add_argument("--exponents", type=floats, default=[1, 1.5, 2, 2.5, 3])
+    parser.add_argument("--caps", type=floats, default=[1000, 2500, 5000, 10000])
+    parser.add_argument("--factors", type=floats, default=[0.8, 0.9, 0.95, 1.0])
+    parser.add_argument("--vals", type=floats, default=[1])
+    parser.add_argument("--offsets", type=floats, default=[0, 1])
+    parser.add_argument("--balance-offsets", type=floats, default=[1, 1000000])
+    parser.add_argument("--bucket", default="1h", help="Time step of the replay (pandas offset)")
+    parser.add_argument("--chunk", type=int, default=128, help="Policies evaluated per chunk")
+    parser.add_argument("--elasticity", type=float, default=1.0, help="Demand response to fees above the observed ones")
+    parser.add_argument("--top", type=int, default=20, help="Policies to print")
+    parser.add_argument("--output", help="Write the full result table to this CSV")
+    parser.add_argument("--trajectories", help="Write daily revenue/balance per policy to this Parquet prefix")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    tracing.configure_from_args("backtest", args)
+
+    forwards, channels = load_inputs(args)
+    with tracing.span("backtest.prepare", forwards=len(forwards)):
+        data = prepare(forwards, channels, args.bucket)
+
+    policies = policy_grid(args.exponents, args.caps, args.factors, args.vals, args.offsets, args.balance_offsets)
+    logger.info(f"Replaying {len(data['out_idx'])} forwards over {len(data['scids'])} channels for {len(policies)} policies")
+
+    start = time.time()
+    result, traj = backtest(data, policies, args.chunk, args.elasticity, trajectories=bool(args.trajectories))
+    logger.info(f"Backtest finished in {time.time() - start:.1f}s")
+
+    print(result.head(args.top).to_string())
+    if args.output:
+        result.to_csv(args.output)
+    if traj:
+        for name, df in traj.items():
+            df.columns = df.columns.astype(str)
+            df.to_parquet(f"{args.trajectories}_{name}.parquet")
@@ -3,14 +3,19 @@
 import logging
 import random
 import time
+import numpy as np
 import pandas as pd
-from google.cloud import bigquery
 from graph_tool.all import Graph, GraphView, betweenness
 from graph_tool.search import bfs_search, BFSVisitor
 from graph_tool.topology import label_components
 import os
 import argparse
 
+import edge_scores
+import tracing
+from checkpoint import Checkpoint, DEFAULT_CHECKPOINT_DIR
+from result_cache import ResultCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, cache_key, snapshot_digest
+
 # -----------------------------
 # Graph-tool threads setup
 # -----------------------------
@@ -26,45 +31,48 @@ logging.basicConfig(
 )
 logger = logging.getLogger("LightningCentrality")
 
-# -----------------------------
-# Timing decorator
-# -----------------------------
-def log_time(func):
-    def wrapper(*args, **kwargs):
-        logger_func = kwargs.get("logger", logger)
-        start = time.time()
-        result = func(*args, **kwargs)
-        stop = time.time()
-        logger_func.debug(f"{func.__name__} completed in {stop - start:.2f}s")
-        return result
-    return wrapper
-
 # -----------------------------
 # Data loading
 # -----------------------------
 def load_data(logger):
+    from google.cloud import bigquery
     try:
         client = bigquery.Client()
         logger.info("Connected to BigQuery")
 
-        channels = client.query("SELECT * FROM `lightning-fee-optimizer.version_1.channels`").to_dataframe()
-        nodes = client.query("SELECT * FROM `lightning-fee-optimizer.version_1.nodes`").to_dataframe()
+        with tracing.span("fetch.bigquery") as sp:
+            channels = client.query("SELECT * FROM `lightning-fee-optimizer.version_1.channels`").to_dataframe()
+            nodes = client.query("SELECT * FROM `lightning-fee-optimizer.version_1.nodes`").to_dataframe()
+            sp.set(channels=len(channels), nodes=len(nodes))
         logger.info(f"Loaded {len(channels)} channels and {len(nodes)} nodes")
 
-        channels['htlc_maximum_msat'] = channels['htlc_maximum_msat'].astype(int)
-        channels['htlc_minimum_msat'] = channels['htlc_minimum_msat'].astype(int)
-        latest_update = channels['last_update'].max()
-
-        return channels, nodes, latest_update
+        return prepare_frames(channels, nodes)
 
     except Exception:
         logger.exception("Failed to load BigQuery tables")
         raise
 
+
+@tracing.traced("coerce")
+def prepare_frames(channels, nodes):
+    """
+    Shared by BigQuery loads and in-memory snapshots (see scheduler.py).
+    """
+    # Deterministic row order keeps vertex/edge indices stable across runs
+    channels = channels.sort_values(['source', 'destination', 'short_channel_id'], ignore_index=True)
+    nodes = nodes.sort_values('nodeid', ignore_index=True)
+
+    channels['htlc_maximum_msat'] = channels['htlc_maximum_msat'].astype(int)
+    channels['htlc_minimum_msat'] = channels['htlc_minimum_msat'].astype(int)
+    latest_update = channels['last_update'].max()
+
+    return channels, nodes, latest_update
+
 # -----------------------------
 # Graph building + edge lookup
 # -----------------------------
 
+@tracing.traced("scc")
 def largest_scc_subgraph(g, logger=None):
     comp, hist = label_components(g, directed=True)
     largest_idx = hist.argmax()
@@ -79,6 +87,7 @@ def largest_scc_subgraph(g, logger=None):
     return sub_g
 
 
+@tracing.traced("graph.build")
 def build_graph(channels, nodes, logger):
     try:
         g = Graph(directed=True)
@@ -108,10 +117,28 @@ def build_graph(channels, nodes, logger):
         logger.exception("Failed to build Graph-tool graph")
         raise
 
+def rebuild_lookups(g, channels, nodes):
+    """
+    Recreate the vertex/edge lookups of build_graph for a graph loaded from
+    a checkpoint (vertices were added in nodes order).
+    """
+    vertex_to_id = {g.vertex(i): node_id for i, node_id in enumerate(nodes['nodeid'])}
+    cols = ['source', 'destination', 'base_fee_millisatoshi', 'fee_per_millionth', 'htlc_minimum_msat', 'htlc_maximum_msat']
+    edge_lookup = {}
+    for src, dst, base_fee, ppm, htlc_min, htlc_max in channels.loc[channels.active, cols].itertuples(index=False):
+        edge_lookup[(src, dst)] = {
+            'base_fee': base_fee,
+            'ppm': ppm / 1_000_000,
+            'htlc_min': htlc_min,
+            'htlc_max': htlc_max
+        }
+    return vertex_to_id, edge_lookup
+
 # -----------------------------
 # Update edge fees + HTLC filter
 # -----------------------------
-def update_fees_and_filter(g, edge_lookup, vertex_to_id, tx_sat, tx_type):
+@tracing.traced("graph.fees_filter")
+def update_fees_and_filter(g, edge_lookup, vertex_to_id, tx_sat, tx_type, rng=random):
     edge_filter = g.new_edge_property("bool")
     for e in g.edges():
         src_id = vertex_to_id[e.source()]
@@ -119,7 +146,7 @@ def update_fees_and_filter(g, edge_lookup, vertex_to_id, tx_sat, tx_type):
         edge = edge_lookup[(src_id, dst_id)]
 
         # Compute float fee with small random offset
-        random_offset = random.uniform(0, 1)
+        random_offset = rng.uniform(0, 1)
         g.ep['fee'][e] = edge['base_fee'] + tx_sat * edge['ppm'] * 1000 + random_offset
 
         edge_filter[e] = (edge['htlc_max'] > tx_sat*1000) and (edge['htlc_min'] < tx_sat*1000)
@@ -129,6 +156,28 @@ def update_fees_and_filter(g, edge_lookup, vertex_to_id, tx_sat, tx_type):
     logger.info(f"[{tx_type}] Updated fees and filtered edges")
     return GraphView(g, efilt=edge_filter)
 
+# -----------------------------
+# View masks (checkpointable form of a filtered view)
+# -----------------------------
+def view_masks(g, g_sub):
+    masks = {'fee': g.ep['fee'].a.copy()}
+    vfilt, _ = g_sub.get_vertex_filter()
+    efilt, _ = g_sub.get_edge_filter()
+    if vfilt is not None:
+        masks['vfilt'] = vfilt.a.astype(bool)
+    if efilt is not None:
+        masks['efilt'] = efilt.a.astype(bool)
+    return masks
+
+
+def restore_view(g, masks):
+    g.ep['fee'].a = masks['fee']
+    vfilt = g.new_vertex_property("bool")
+    efilt = g.new_edge_property("bool")
+    vfilt.a = masks['vfilt'] if 'vfilt' in masks else True
+    efilt.a = masks['efilt'] if 'efilt' in masks else True
+    return GraphView(g, vfilt=vfilt, efilt=efilt)
+
 # -----------------------------
 # Test subgraph
 # -----------------------------
@@ -198,16 +247,46 @@ def get_test_subgraph(g_filtered, logger, k_hops=2, max_vertices=200):
 # Betweenness
 # -----------------------------
 
-@log_time
 def compute_betweenness(g_sub, tx_type, logger):
     logger.info(f"[{tx_type}] Computing betweenness (nodes + edges)")
-    v_betw, e_betw = betweenness(g_sub, weight=g_sub.ep['fee'])
+    with tracing.span("betweenness", tx_type=tx_type, nodes=g_sub.num_vertices(), edges=g_sub.num_edges()):
+        v_betw, e_betw = betweenness(g_sub, weight=g_sub.ep['fee'])
     logger.info(f"[{tx_type}] Betweenness computation finished")
     return v_betw, e_betw
 
+
+def scores_to_props(g_sub, arrays):
+    """
+    Wrap unfiltered score arrays (indexed like the full graph) as property maps.
+    """
+    v_betw = g_sub.new_vertex_property("double")
+    e_betw = g_sub.new_edge_property("double")
+    v_betw.a = arrays['vertex']
+    e_betw.a = arrays['edge']
+    return v_betw, e_betw
+
+
+def cached_betweenness(g_sub, tx_type, logger, cache=None, key=None):
+    """
+    Serve betweenness from the result cache when possible, otherwise compute
+    and store it.
+    """
+    if cache is not None:
+        arrays = cache.get(key)
+        if arrays is not None:
+            logger.info(f"[{tx_type}] Betweenness served from cache ({key[:12]})")
+            return scores_to_props(g_sub, arrays)
+
+    start = time.time()
+    v_betw, e_betw = compute_betweenness(g_sub, tx_type, logger)
+    if cache is not None:
+        cache.put(key, time.time() - start, vertex=v_betw.a, edge=e_betw.a)
+    return v_betw, e_betw
+
 # -----------------------------
 # Node betweenness
 # -----------------------------
+@tracing.traced("frame.nodescores")
 def process_node_betweenness(g_sub, v_betw, tx_type, nodes_df, latest_update, vertex_to_id, logger):
     try:
         logger.info(f"[{tx_type}] Computing node betweenness")
@@ -228,6 +307,7 @@ def process_node_betweenness(g_sub, v_betw, tx_type, nodes_df, latest_update, ve
 # -----------------------------
 # Edge betweenness
 # -----------------------------
+@tracing.traced("frame.edgescores")
 def process_edge_betweenness(g_sub, e_betw, tx_type, latest_update, vertex_to_id, channels, logger):
     try:
         logger.info(f"[{tx_type}] Computing edge betweenness")
@@ -243,15 +323,74 @@ def process_edge_betweenness(g_sub, e_betw, tx_type, latest_update, vertex_to_id
         logger.exception(f"[{tx_type}] Edge betweenness failed")
         return pd.DataFrame()
 
+@tracing.traced("frame.edgescores.compact")
+def process_edge_betweenness_compact(g_sub, e_betw, tx_type, snapshot, channels, logger):
+    """
+    edge_scores.compact_frame of the SCC edges; graph edge i is row i of the
+    active channels (see build_graph).
+    """
+    try:
+        active = channels[channels.active]
+        idx = g_sub.get_edges([g_sub.edge_index])[:, 2]
+        direction = active['direction'].to_numpy()[idx] if 'direction' in active else np.zeros(len(idx))
+        df = edge_scores.compact_frame(
+            active['short_channel_id'].to_numpy()[idx], direction, e_betw.a[idx], tx_type, snapshot
+        )
+        logger.info(f"[{tx_type}] Compact edge betweenness for {len(df)} edges")
+        return df
+    except Exception:
+        logger.exception(f"[{tx_type}] Compact edge betweenness failed")
+        return pd.DataFrame()
+
+# -----------------------------
+# Upload
+# -----------------------------
+def upload(df, table):
+    import bqload
+    bqload.upload(df, table, if_exists='append')
+
 # -----------------------------
 # Main pipeline
 # -----------------------------
-def run_pipeline(TEST_MODE=True, logger=logger):
+def run_pipeline(TEST_MODE=True, logger=logger, cache=None, seed=None, checkpoint_dir=None, resume=False, data=None,
+                 compact_edges=None, rank_history=None):
     logger.info("Starting Lightning fee centrality computation")
     logger.info(f"TEST_MODE = {TEST_MODE}")
 
-    channels, nodes, latest_update = load_data(logger)
-    g, vertex_to_id, edge_lookup = build_graph(channels, nodes, logger)
+    # Load; --resume only continues the checkpoint of this snapshot and mode
+    # (the run id holds both), never an older or test run
+    # data: (channels, nodes) already in memory, e.g. the scheduler's snapshot
+    channels, nodes, latest_update = prepare_frames(*data) if data is not None else load_data(logger)
+    snapshot = snapshot_digest(channels, nodes)
+    run_id = f"{pd.Timestamp(latest_update):%Y%m%dT%H%M%S}-{snapshot[:12]}" + ("-test" if TEST_MODE else "")
+    ckpt = Checkpoint(checkpoint_dir, run_id, logger, reset=not resume)
+    if ckpt.done("load"):
+        logger.info(f"Resuming checkpoint run {ckpt.run_id}")
+    else:
+        ckpt.save("load", (channels, nodes, latest_update), kind="frame")
+        ckpt.set_meta(snapshot=snapshot, test_mode=TEST_MODE)
+
+    # A resumed run keeps the jitter of its completed stages
+    stored_seed = ckpt.manifest['meta'].get('seed')
+    if stored_seed is not None:
+        if seed is not None and seed != stored_seed:
+            logger.warning(f"Ignoring seed {seed}: checkpoint run {ckpt.run_id} uses seed {stored_seed}")
+        seed = stored_seed
+    else:
+        if seed is None:
+            # Jitter stays reproducible for a given snapshot
+            seed = int(snapshot[:8], 16)
+        ckpt.set_meta(seed=seed)
+    logger.info(f"Snapshot {snapshot[:12]}, jitter seed {seed}")
+
+    # Build
+    if ckpt.enabled and ckpt.done("graph"):
+        g = ckpt.load("graph")
+        vertex_to_id, edge_lookup = rebuild_lookups(g, channels, nodes)
+        logger.info(f"Graph restored with {g.num_vertices()} nodes and {g.num_edges()} edges")
+    else:
+        g, vertex_to_id, edge_lookup = build_graph(channels, nodes, logger)
+        ckpt.save("graph", g, kind="graph")
 
     tx_types = [
         ("common", 80000),
@@ -259,43 +398,120 @@ def run_pipeline(TEST_MODE=True, logger=logger):
         ("macro", 4000000)
     ]
 
+    failed = False
     for tx_type, tx_sat in tx_types:
         logger.info(f"Processing tx_type={tx_type} ({tx_sat} sat)")
 
         try:
-            g_sub = update_fees_and_filter(g, edge_lookup, vertex_to_id, tx_sat, tx_type)
-            g_sub = largest_scc_subgraph(g_sub, logger)
-            
-            if TEST_MODE:
-                g_sub = get_test_subgraph(g_sub, logger, k_hops=3, max_vertices=200)
-            
+            # Filter + SCC
+            def filter_stage():
+                rng = random.Random(seed + tx_sat)
+                g_sub = update_fees_and_filter(g, edge_lookup, vertex_to_id, tx_sat, tx_type, rng)
+                g_sub = largest_scc_subgraph(g_sub, logger)
+                if TEST_MODE:
+                    g_sub = get_test_subgraph(g_sub, logger, k_hops=3, max_vertices=200)
+                return view_masks(g, g_sub)
+
+            masks = ckpt.stage(f"{tx_type}.view", filter_stage, kind="arrays")
+            g_sub = restore_view(g, masks)
             logger.info(f"[{tx_type}] Largest SCC: {g_sub.num_vertices()} nodes, {g_sub.num_edges()} edges")
-            
+
             # Compute once
-            v_betw, e_betw = compute_betweenness(g_sub, tx_type, logger)
+            def scores_stage():
+                key = cache_key(
+                    snapshot, tx_sat=tx_sat, seed=seed, engine="graph_tool.betweenness",
+                    test_mode=TEST_MODE, k_hops=3, max_vertices=200
+                )
+                v_betw, e_betw = cached_betweenness(g_sub, tx_type, logger, cache, key)
+                return {'vertex': v_betw.a.copy(), 'edge': e_betw.a.copy()}
+
+            scores = ckpt.stage(f"{tx_type}.scores", scores_stage, kind="arrays")
+            v_betw, e_betw = scores_to_props(g_sub, scores)
 
             # Node betweenness
-            nodescores = process_node_betweenness(g_sub, v_betw, tx_type, nodes, latest_update, vertex_to_id, logger)
+            nodescores = ckpt.stage(
+                f"{tx_type}.nodescores",
+                lambda: process_node_betweenness(g_sub, v_betw, tx_type, nodes, latest_update, vertex_to_id, logger)
+            )
             if not nodescores.empty and not TEST_MODE:
-                nodescores.to_gbq(
-                    "lightning-fee-optimizer.version_1.betweenness",
-                    if_exists='append'
+                ckpt.stage(
+                    f"{tx_type}.nodescores.upload",
+                    lambda: upload(nodescores, "lightning-fee-optimizer.version_1.betweenness"),
+                    kind="marker"
                 )
                 logger.info(f"[{tx_type}] Node betweenness written to BigQuery")
+            if not nodescores.empty and not TEST_MODE and rank_history is not None:
+                ckpt.stage(
+                    f"{tx_type}.nodescores.history",
+                    lambda: rank_history.append_nodes(nodescores, tx_type, latest_update),
+                    kind="marker"
+                )
 
             # Edge betweenness for all tx_types, append to BigQuery
-            edgescores = process_edge_betweenness(g_sub, e_betw, tx_type, latest_update, vertex_to_id, channels, logger)
+            if compact_edges is not None:
+                # (snapshot_id, short_channel_id, direction, type, score, rank) only, see edge_scores.py
+                edgescores = ckpt.stage(
+                    f"{tx_type}.edgescores.compact",
+                    lambda: process_edge_betweenness_compact(g_sub, e_betw, tx_type, snapshot, channels, logger)
+                )
+                if not edgescores.empty and not TEST_MODE:
+                    ckpt.stage(
+                        f"{tx_type}.edgescores.compact.upload",
+                        lambda: compact_edges.publish(edgescores, tx_type),
+                        kind="marker"
+                    )
+                    logger.info(f"[{tx_type}] Compact edge betweenness written to BigQuery")
+                if not edgescores.empty and not TEST_MODE and rank_history is not None:
+                    ckpt.stage(
+                        f"{tx_type}.edgescores.history",
+                        lambda: rank_history.append_edges(edgescores, tx_type, latest_update),
+                        kind="marker"
+                    )
+                if nodescores.empty or edgescores.empty:
+                    failed = True
+                continue
+
+            edgescores = ckpt.stage(
+                f"{tx_type}.edgescores",
+                lambda: process_edge_betweenness(g_sub, e_betw, tx_type, latest_update, vertex_to_id, channels, logger)
+            )
             if not edgescores.empty and not TEST_MODE:
-                edgescores.to_gbq(
-                    "lightning-fee-optimizer.version_1.edge_betweenness",
-                    if_exists='append'
+                ckpt.stage(
+                    f"{tx_type}.edgescores.upload",
+                    lambda: upload(edgescores, "lightning-fee-optimizer.version_1.edge_betweenness"),
+                    kind="marker"
                 )
                 logger.info(f"[{tx_type}] Edge betweenness written to BigQuery")
+            if not edgescores.empty and not TEST_MODE and rank_history is not None:
+                ckpt.stage(
+                    f"{tx_type}.edgescores.history",
+                    lambda: rank_history.append_edges(edgescores, tx_type, latest_update),
+                    kind="marker"
+                )
+
+            if nodescores.empty or edgescores.empty:
+                failed = True
 
         except Exception:
             logger.exception(f"Failed processing tx_type={tx_type}")
+            failed = True
             continue
 
+    if compact_edges is not None and not failed and not TEST_MODE:
+        ckpt.stage(
+            "snapshot.upload",
+            lambda: compact_edges.write_snapshot(snapshot, latest_update, channels, len(nodes)),
+            kind="marker"
+        )
+
+    if not failed:
+        ckpt.finish()
+        ckpt.prune()
+    elif ckpt.enabled:
+        logger.warning(f"Run {ckpt.run_id} incomplete; rerun with --resume to retry failed stages")
+
+    if cache is not None:
+        cache.log_stats()
     logger.info("Lightning fee centrality computation completed")
 
 # -----------------------------
@@ -312,7 +528,103 @@ if __name__ == "__main__":
         help="Run in TEST_MODE (BFS subgraph, no BigQuery writes)"
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed for the fee jitter (default: derived from the snapshot)"
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help="Directory of the betweenness result cache"
+    )
+
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=DEFAULT_MAX_BYTES // 1024 ** 2,
+        help="Size bound of the result cache in MB"
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always recompute betweenness"
+    )
+
+    parser.add_argument(
+        "--checkpoint-dir",
+        default=DEFAULT_CHECKPOINT_DIR,
+        help="Directory for per-stage checkpoints"
+    )
+
+    parser.add_argument(
+        "--no-checkpoint",
+        action="store_true",
+        help="Do not write stage checkpoints"
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume the last incomplete run, skipping completed stages"
+    )
 
-    run_pipeline(TEST_MODE=args.test)
+    parser.add_argument(
+        "--compact-edges",
+        action="store_true",
+        help="Write edge scores as (snapshot_id, short_channel_id, direction, type, score, rank) only"
+    )
+
+    parser.add_argument(
+        "--edge-top-k",
+        type=int,
+        default=None,
+        help="With --compact-edges: only write the k highest ranked edges"
+    )
+
+    parser.add_argument(
+        "--edge-rank-changed",
+        type=int,
+        default=None,
+        metavar="N",
+        help="With --compact-edges: only write edges whose rank moved at least N since the last run"
+    )
+
+    parser.add_argument(
+        "--rank-history",
+        default=os.environ.get("CLTOOLS_RANK_HISTORY_DIR"),
+        help="Also append scores and ranks to this local rank history (see rank_history.py)"
+    )
+
+    tracing.add_arguments(parser)
+
+    args = parser.parse_args()
+    tracing.configure_from_args("betweenness_centrality", args)
+
+    cache = None
+    if not args.no_cache:
+        cache = ResultCache(args.cache_dir, args.cache_max_mb * 1024 ** 2, logger)
+
+    checkpoint_dir = None if args.no_checkpoint else args.checkpoint_dir
+
+    compact_edges = None
+    if args.compact_edges:
+        compact_edges = edge_scores.CompactEdges(
+            k=args.edge_top_k, changed=args.edge_rank_changed is not None,
+            min_change=1 if args.edge_rank_changed is None else args.edge_rank_changed, logger=logger
+        )
+
+    rank_history = None
+    if args.rank_history:
+        from rank_history import RankHistory
+        rank_history = RankHistory(args.rank_history, logger)
+
+    run_pipeline(
+        TEST_MODE=args.test, cache=cache, seed=args.seed,
+        checkpoint_dir=checkpoint_dir, resume=args.resume, compact_edges=compact_edges,
+        rank_history=rank_history
+    )
 
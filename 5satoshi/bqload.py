@@ -0,0 +1,323 @@
+#!/usr/bin/python
+
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import tracing
+
+logger = logging.getLogger("BulkLoader")
+
+# google.cloud.bigquery is only imported when a real client is used, so the
+# LocalClient path and importing this module do not need it. The values are
+# those of bigquery.WriteDisposition.
+WRITE_DISPOSITIONS = {
+    'append': "WRITE_APPEND",
+    'replace': "WRITE_TRUNCATE",
+    'fail': "WRITE_EMPTY",
+}
+
+# Column of a load schema; bigquery.SchemaField lists work too (same attributes)
+Field = namedtuple("Field", "name field_type")
+# Job config of a LocalClient load
+LocalLoadConfig = namedtuple("LocalLoadConfig", "schema write_disposition")
+
+ARROW_TYPES = {
+    'INTEGER': pa.int64(),
+    'FLOAT': pa.float64(),
+    'BOOLEAN': pa.bool_(),
+    'TIMESTAMP': pa.timestamp('us', tz='UTC'),
+    'STRING': pa.string(),
+}
+
+# -----------------------------
+# Schema
+# -----------------------------
+def bq_type(series):
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'BOOLEAN'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'FLOAT'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'TIMESTAMP'
+    return 'STRING'
+
+
+def frame_schema(df, overrides=None):
+    """
+    Explicit BigQuery schema (list of Field) for a frame, derived from its
+    dtypes. overrides maps column name to a BigQuery type.
+    """
+    overrides = overrides or {}
+    return [
+        Field(col, overrides.get(col, bq_type(df[col])))
+        for col in df.columns
+    ]
+
+
+def _to_string(value):
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, dict, tuple)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+def coerce_frame(df, schema):
+    """
+    Cast columns to the representation written to Parquet for each
+    schema type. Nested values (lists, dicts) become JSON strings.
+    """
+    out = {}
+    for field in schema:
+        col = df[field.name]
+        if field.field_type == 'TIMESTAMP':
+            col = pd.to_datetime(col, utc=True).dt.round('us')
+        elif field.field_type == 'STRING':
+            col = col.map(_to_string, na_action='ignore').astype(object)
+        elif field.field_type == 'INTEGER':
+            col = col.astype('Int64')
+        elif field.field_type == 'FLOAT':
+            col = col.astype('Float64')
+        elif field.field_type == 'BOOLEAN':
+            col = col.astype('boolean')
+        out[field.name] = col
+    return pd.DataFrame(out, index=df.index)
+
+
+def to_parquet(df, schema, compression="snappy"):
+    arrow_schema = pa.schema([pa.field(f.name, ARROW_TYPES[f.field_type]) for f in schema])
+    table = pa.Table.from_pandas(coerce_frame(df, schema), schema=arrow_schema, preserve_index=False)
+    buf = io.BytesIO()
+    pq.write_table(table, buf, compression=compression)
+    buf.seek(0)
+    return buf
+
+# -----------------------------
+# Local stand-in client
+# -----------------------------
+class LocalJob:
+    def __init__(self, path):
+        self.path = path
+
+    def result(self, timeout=None):
+        return self
+
+
+class LocalClient:
+    """
+    Stand-in for bigquery.Client.load_table_from_file that writes each load
+    as a Parquet file under directory/<table>/, for offline runs.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def load_table_from_file(self, file_obj, destination, job_config=None, rewind=False, **kwargs):
+        if rewind:
+            file_obj.seek(0)
+        table_dir = os.path.join(self.directory, str(destination))
+        with self._lock:
+            os.makedirs(table_dir, exist_ok=True)
+            disposition = getattr(job_config, 'write_disposition', None)
+            existing = sorted(os.listdir(table_dir))
+            if disposition == WRITE_DISPOSITIONS['replace']:
+                for name in existing:
+                    os.remove(os.path.join(table_dir, name))
+                existing = []
+            elif disposition == WRITE_DISPOSITIONS['fail'] and existing:
+                raise ValueError(f"Table {destination} is not empty")
+            path = os.path.join(table_dir, f"{len(existing):06d}.parquet")
+            with open(path, 'wb') as f:
+                f.write(file_obj.read())
+        return LocalJob(path)
+
+    def read_table(self, destination, columns=None):
+        """
+        Every load of a table as one frame (empty if nothing was loaded), e.g.
+        to read a sync watermark back offline.
+        """
+        table_dir = os.path.join(self.directory, str(destination))
+        files = sorted(f for f in os.listdir(table_dir) if f.endswith(".parquet")) if os.path.isdir(table_dir) else []
+        if not files:
+            return pd.DataFrame(columns=columns or [])
+        with self._lock:
+            frames = [pq.read_table(os.path.join(table_dir, f), columns=columns).to_pandas() for f in files]
+        return pd.concat(frames, ignore_index=True)
+
+
+def default_client(project_id=None):
+    """
+    BigQuery client, or a LocalClient when CLTOOLS_BQ_LOCAL_DIR is set.
+    """
+    local_dir = os.environ.get("CLTOOLS_BQ_LOCAL_DIR")
+    if local_dir:
+        return LocalClient(local_dir)
+    from google.cloud import bigquery
+    return bigquery.Client(project=project_id)
+
+
+def job_config(client, schema, disposition):
+    """
+    Load job config for client: a LocalLoadConfig for a LocalClient, else a
+    bigquery.LoadJobConfig for Parquet.
+    """
+    if isinstance(client, LocalClient):
+        return LocalLoadConfig(list(schema), disposition)
+    from google.cloud import bigquery
+    return bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.PARQUET,
+        schema=[f if isinstance(f, bigquery.SchemaField) else bigquery.SchemaField(f.name, f.field_type) for f in schema],
+        write_disposition=disposition,
+    )
+
+# -----------------------------
+# Loader
+# -----------------------------
+class BulkLoader:
+    """
+    Uploads frames as compressed Parquet through load_table_from_file jobs.
+
+    Up to max_workers loads run concurrently; submit() blocks once
+    max_pending uploads are queued or running. Frames must not be modified
+    after submission.
+    """
+
+    def __init__(self, client=None, max_workers=4, max_pending=8, retries=3, backoff=2.0,
+                 compression="snappy", project_id=None, logger=logger):
+        self.client = client
+        self.project_id = project_id
+        self.retries = retries
+        self.backoff = backoff
+        self.compression = compression
+        self.logger = logger
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bqload")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._futures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.wait()
+        finally:
+            self.close()
+
+    def _client(self):
+        if self.client is None:
+            self.client = default_client(self.project_id)
+        return self.client
+
+    def _table_id(self, table):
+        if self.project_id and table.count(".") == 1:
+            return f"{self.project_id}.{table}"
+        return table
+
+    def submit(self, df, table, if_exists="append", schema=None):
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(self._load, df, self._table_id(table), if_exists, schema)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+        return future
+
+    def _load(self, df, table, if_exists, schema):
+        with tracing.span("upload", table=table, rows=len(df)) as sp:
+            if isinstance(schema, dict) or schema is None:
+                schema = frame_schema(df, schema)
+            buf = to_parquet(df, schema, self.compression)
+            sp.set(bytes=buf.getbuffer().nbytes)
+
+            config = job_config(self._client(), schema, WRITE_DISPOSITIONS[if_exists])
+
+            for attempt in range(1, self.retries + 1):
+                try:
+                    job = self._client().load_table_from_file(buf, table, job_config=config, rewind=True)
+                    job.result()
+                    break
+                except Exception:
+                    if attempt == self.retries:
+                        self.logger.exception(f"Load into {table} failed after {attempt} attempts")
+                        raise
+                    delay = self.backoff ** attempt
+                    self.logger.warning(f"Load into {table} failed (attempt {attempt}), retrying in {delay:.0f}s")
+                    time.sleep(delay)
+
+        self.logger.info(f"Loaded {len(df)} rows into {table}")
+        return len(df)
+
+    def wait(self):
+        """
+        Block until all submitted loads finished; re-raise the first failure.
+        """
+        futures, self._futures = self._futures, []
+        errors = []
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+def upload(df, table, if_exists="append", schema=None, project_id=None, client=None):
+    """
+    Upload a single frame and wait for the load job.
+    """
+    with BulkLoader(client=client, max_workers=1, project_id=project_id) as loader:
+        loader.submit(df, table, if_exists, schema)
+
+
+def check_local():
+    """
+    Offline round trip through a LocalClient: append, append, replace, read
+    back; google.cloud must not get imported on the way.
+    """
+    import sys
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        client = LocalClient(directory)
+        df = pd.DataFrame({'id': [1, 2], 'name': ["a", None], 'when': pd.to_datetime([0, 1], unit='s'), 'meta': [[1], {'x': 1}]})
+        with BulkLoader(client=client) as loader:
+            loader.submit(df, "check.table")
+        upload(df, "check.table", client=client)
+        assert len(client.read_table("check.table")) == 4
+        upload(df.iloc[:1], "check.table", if_exists='replace', client=client)
+        back = client.read_table("check.table")
+        assert back['id'].tolist() == [1] and back['meta'].tolist() == ["[1]"], back
+        assert client.read_table("check.missing", columns=['id']).empty
+    assert "google.cloud.bigquery" not in sys.modules, "LocalClient path imported google.cloud.bigquery"
+    print("LocalClient round trip ok")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="BigQuery bulk loader")
+    parser.add_argument("command", choices=["check-local"], help="check-local: offline LocalClient round trip")
+    parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    check_local()
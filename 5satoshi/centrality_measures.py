@@ -1,80 +1,145 @@
 #!/usr/bin/python
 
+import logging
 import math
+import os
 import networkx as nx
-from google.cloud import bigquery
+import numpy as np
 import pandas as pd
 
-client = bigquery.Client()
-sql="SELECT * FROM `lightning-fee-optimizer.version_1.channels`"
-channels = client.query(sql).to_dataframe()
+import edge_scores
+import tracing
+from result_cache import ResultCache, cache_key, snapshot_digest
 
-sql="SELECT * FROM `lightning-fee-optimizer.version_1.nodes`"
-nodes = client.query(sql).to_dataframe()
 
-DG = nx.from_pandas_edgelist(channels[channels.active],"source","destination",edge_attr=True, create_using=nx.MultiDiGraph())
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+    tracing.configure("centrality_measures")
 
-tx_types = [("common",80000), ("micro",200), ("macro",4000000)]
-epsilon = 1
+    # The BigQuery backend is imported per run, not when this module is imported
+    from google.cloud import bigquery
+    import bqload
 
-# tx_type,tx_sat = tx_types[2]
-
-for tx_type,tx_sat in tx_types:
-    #tx_sat = 4000000 #macro ~1000
-    #tx_sat = 200 #micro ~0.05
-    #tx_sat = 80000 #common ~20
-    for source, dest, key, data in DG.out_edges(keys=True,data=True):
-        a = DG[source][dest][key]['base_fee_millisatoshi']
-        b = DG[source][dest][key]['fee_per_millionth']/1000000
-        DG[source][dest][key]['fee'] = math.floor(a + tx_sat*b*1000) * 1000 + epsilon
-    
-    sufficient_edges = (
-        (source,dest,data)
-        for source, dest, data
-        in DG.edges(data=True)
-        if int(data['htlc_maximum_msat'])>tx_sat*1000 and int(data['htlc_minimum_msat'])<tx_sat*1000
-    )
-    
-    filtered_DG = nx.MultiDiGraph(sufficient_edges)
-    newDG = filtered_DG.subgraph(max(nx.strongly_connected_components(filtered_DG),key=len))
+    client = bigquery.Client()
+    with tracing.span("fetch.bigquery") as sp:
+        sql="SELECT * FROM `lightning-fee-optimizer.version_1.channels`"
+        channels = client.query(sql).to_dataframe()
     
-    start = pd.Timestamp.now()
+        sql="SELECT * FROM `lightning-fee-optimizer.version_1.nodes`"
+        nodes = client.query(sql).to_dataframe()
+        sp.set(channels=len(channels), nodes=len(nodes))
+
+    channels = channels.sort_values(['source', 'destination', 'short_channel_id'], ignore_index=True)
+    nodes = nodes.sort_values('nodeid', ignore_index=True)
+
+    cache = ResultCache()
+    snapshot = snapshot_digest(channels, nodes)
+
+    with tracing.span("graph.build") as sp:
+        DG = nx.from_pandas_edgelist(channels[channels.active],"source","destination",edge_attr=True, create_using=nx.MultiDiGraph())
+        sp.set(nodes=DG.number_of_nodes(), edges=DG.number_of_edges())
+
+    # Compact edge rows instead of the channel merge, see edge_scores.py
+    compact_edges = None
+    if os.environ.get("CLTOOLS_COMPACT_EDGES"):
+        top_k = os.environ.get("CLTOOLS_EDGE_TOP_K")
+        compact_edges = edge_scores.CompactEdges(k=int(top_k) if top_k else None)
+
+    tx_types = [("common",80000), ("micro",200), ("macro",4000000)]
+    epsilon = 1
+
+    # tx_type,tx_sat = tx_types[2]
+
+    for tx_type,tx_sat in tx_types:
+        #tx_sat = 4000000 #macro ~1000
+        #tx_sat = 200 #micro ~0.05
+        #tx_sat = 80000 #common ~20
+        for source, dest, key, data in DG.out_edges(keys=True,data=True):
+            a = DG[source][dest][key]['base_fee_millisatoshi']
+            b = DG[source][dest][key]['fee_per_millionth']/1000000
+            DG[source][dest][key]['fee'] = math.floor(a + tx_sat*b*1000) * 1000 + epsilon
     
-    betweenness = nx.betweenness_centrality(newDG,normalized=True,weight='fee')
-    #betweenness = nx.edge_betweenness_centrality(newDG,normalized=True,weight='fee')
+        sufficient_edges = (
+            (source,dest,data)
+            for source, dest, data
+            in DG.edges(data=True)
+            if int(data['htlc_maximum_msat'])>tx_sat*1000 and int(data['htlc_minimum_msat'])<tx_sat*1000
+        )
     
-    stop = pd.Timestamp.now()
+        with tracing.span("scc", tx_type=tx_type) as sp:
+            filtered_DG = nx.MultiDiGraph(sufficient_edges)
+            newDG = filtered_DG.subgraph(max(nx.strongly_connected_components(filtered_DG),key=len))
+            sp.set(nodes=newDG.number_of_nodes(), edges=newDG.number_of_edges())
     
-    print('Time: ', stop - start) 
+        key = cache_key(snapshot, tx_sat=tx_sat, epsilon=epsilon, engine="networkx.betweenness_centrality", normalized=True)
+        cached = cache.get(key)
+        if cached is not None:
+            betweenness = dict(zip(cached['nodeid'].tolist(), cached['score'].tolist()))
+        else:
+            with tracing.span("betweenness", tx_type=tx_type) as sp:
+                betweenness = nx.betweenness_centrality(newDG,normalized=True,weight='fee')
+                #betweenness = nx.edge_betweenness_centrality(newDG,normalized=True,weight='fee')
+        
+            cache.put(key, sp.wall, nodeid=np.array(list(betweenness.keys())), score=np.array(list(betweenness.values())))
     
-    nodescores = pd.DataFrame.from_dict(data=betweenness,orient='index',columns=['shortest_path_share'])
-    nodescores['rank'] = nodescores['shortest_path_share'].rank(method='min',ascending=False)
-    nodescores = nodescores.join(nodes[['nodeid','alias']].set_index('nodeid'))
+        nodescores = pd.DataFrame.from_dict(data=betweenness,orient='index',columns=['shortest_path_share'])
+        nodescores['rank'] = nodescores['shortest_path_share'].rank(method='min',ascending=False)
+        nodescores = nodescores.join(nodes[['nodeid','alias']].set_index('nodeid'))
     
-    nodescores["timestamp"] = max(channels["last_update"])
-    nodescores["nodeid"] = nodescores.index
-    nodescores["type"] = tx_type
+        nodescores["timestamp"] = max(channels["last_update"])
+        nodescores["nodeid"] = nodescores.index
+        nodescores["type"] = tx_type
     
-    nodescores.to_gbq("lightning-fee-optimizer.version_1.betweenness",if_exists='append')
+        bqload.upload(nodescores, "lightning-fee-optimizer.version_1.betweenness", if_exists='append')
     
-    ##### Edges
-    if tx_type=="common":
-        
-        start = pd.Timestamp.now()
-        
-        #betweenness = nx.betweenness_centrality(newDG,normalized=True,weight='fee')
-        edge_betweenness = nx.edge_betweenness_centrality(newDG,normalized=True,weight='fee')
+        ##### Edges
+        if tx_type=="common":
         
-        stop = pd.Timestamp.now()
+            key = cache_key(snapshot, tx_sat=tx_sat, epsilon=epsilon, engine="networkx.edge_betweenness_centrality", normalized=True)
+            cached = cache.get(key)
+            if cached is not None:
+                edge_betweenness = {
+                    (s, d, k): v
+                    for s, d, k, v in zip(cached['source'].tolist(), cached['destination'].tolist(), cached['edge_key'].tolist(), cached['score'].tolist())
+                }
+            else:
+                with tracing.span("edge_betweenness", tx_type=tx_type) as sp:
+                    #betweenness = nx.betweenness_centrality(newDG,normalized=True,weight='fee')
+                    edge_betweenness = nx.edge_betweenness_centrality(newDG,normalized=True,weight='fee')
+            
+                cache.put(
+                    key, sp.wall,
+                    source=np.array([k[0] for k in edge_betweenness]),
+                    destination=np.array([k[1] for k in edge_betweenness]),
+                    edge_key=np.array([k[2] for k in edge_betweenness]),
+                    score=np.array(list(edge_betweenness.values()))
+                )
         
-        print('Time: ', stop - start) 
+            if compact_edges is not None:
+                ### only (snapshot_id, short_channel_id, direction, type, score, rank), appended
+                edges = [newDG[s][d][k] for s, d, k in edge_betweenness]
+                edgescores = edge_scores.compact_frame(
+                    [e['short_channel_id'] for e in edges], [e.get('direction', 0) for e in edges],
+                    list(edge_betweenness.values()), tx_type, snapshot
+                )
+                compact_edges.publish(edgescores, tx_type)
+                continue
         
-        edgescores = pd.DataFrame([(k[0],k[1],k[2],v) for k,v in edge_betweenness.items()], columns=['source','destination', 'key', 'shortest_path_share'])
+            edgescores = pd.DataFrame([(k[0],k[1],k[2],v) for k,v in edge_betweenness.items()], columns=['source','destination', 'key', 'shortest_path_share'])
         
-        edgescores = pd.merge(edgescores, channels[channels.active], how="left", on=['source','destination'])
-        edgescores['rank'] = edgescores['shortest_path_share'].rank(method='min',ascending=False)
+            edgescores = pd.merge(edgescores, channels[channels.active], how="left", on=['source','destination'])
+            edgescores['rank'] = edgescores['shortest_path_share'].rank(method='min',ascending=False)
         
-        edgescores["timestamp"] = max(channels["last_update"])
-        edgescores["type"] = tx_type
+            edgescores["timestamp"] = max(channels["last_update"])
+            edgescores["type"] = tx_type
         
-        edgescores.to_gbq("lightning-fee-optimizer.version_1.edge_betweenness",if_exists='replace')
+            bqload.upload(edgescores, "lightning-fee-optimizer.version_1.edge_betweenness", if_exists='replace')
+
+    if compact_edges is not None:
+        compact_edges.write_snapshot(snapshot, max(channels["last_update"]), channels, len(nodes))
+
+    cache.log_stats()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CHECKPOINT_DIR = os.path.join(os.environ.get('HOME', '.'), ".cache", "cl-tools", "checkpoints")
+
+logger = logging.getLogger("Checkpoint")
+
+# Payload kinds and their file suffixes
+SUFFIXES = {
+    "frame": ".pkl.gz",
+    "arrays": ".npz",
+    "graph": ".gt.gz",
+    "marker": None,
+}
+
+# -----------------------------
+# Checkpoint
+# -----------------------------
+class Checkpoint:
+    """
+    Per-stage checkpoints of one pipeline run, stored under root/run_id
+    with a manifest.json listing the completed stages.
+
+    A checkpoint created with root=None is disabled: stages always run and
+    nothing is written.
+    """
+
+    def __init__(self, root, run_id, logger=logger, reset=True):
+        self.root = root
+        self.run_id = run_id
+        self.logger = logger
+        self.enabled = root is not None
+        self.manifest = {'run_id': run_id, 'created_at': time.time(), 'complete': False, 'meta': {}, 'stages': {}}
+
+        if not self.enabled:
+            return
+
+        self.path = os.path.join(root, run_id)
+        if reset and os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path, exist_ok=True)
+
+        manifest_path = os.path.join(self.path, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self._write_manifest()
+
+    # -----------------------------
+    # Manifest
+    # -----------------------------
+    def _write_manifest(self):
+        manifest_path = os.path.join(self.path, "manifest.json")
+        tmp = manifest_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=2, default=str)
+        os.replace(tmp, manifest_path)
+
+    def done(self, name):
+        return name in self.manifest['stages']
+
+    def set_meta(self, **meta):
+        self.manifest['meta'].update(meta)
+        if self.enabled:
+            self._write_manifest()
+
+    def finish(self):
+        self.manifest['complete'] = True
+        if self.enabled:
+            self._write_manifest()
+            self.logger.info(f"Checkpoint run {self.run_id} complete")
+
+    # -----------------------------
+    # Payloads
+    # -----------------------------
+    def _file(self, name, kind):
+        return os.path.join(self.path, name + SUFFIXES[kind])
+
+    def save(self, name, value, kind="frame"):
+        if not self.enabled:
+            return
+        start = time.time()
+        if kind != "marker":
+            path = self._file(name, kind)
+            tmp = path + ".tmp" + SUFFIXES[kind]
+            if kind == "frame":
+                pd.to_pickle(value, tmp)
+            elif kind == "arrays":
+                with open(tmp, 'wb') as f:
+                    np.savez_compressed(f, **value)
+            elif kind == "graph":
+                value.save(tmp)
+            os.replace(tmp, path)
+
+        self.manifest['stages'][name] = {'kind': kind, 'completed_at': time.time()}
+        self._write_manifest()
+        self.logger.debug(f"Checkpointed {name} in {time.time() - start:.2f}s")
+
+    def load(self, name):
+        kind = self.manifest['stages'][name]['kind']
+        if kind == "marker":
+            return None
+        path = self._file(name, kind)
+        if kind == "frame":
+            return pd.read_pickle(path)
+        if kind == "arrays":
+            with np.load(path, allow_pickle=False) as data:
+                return {k: data[k] for k in data.files}
+        if kind == "graph":
+            from graph_tool import load_graph
+            return load_graph(path)
+
+    def stage(self, name, func, kind="frame"):
+        """
+        Return the checkpointed result of a stage, or run func and
+        checkpoint its result. Empty results are not marked as done, so
+        they are retried on resume.
+        """
+        if self.enabled and self.done(name):
+            self.logger.info(f"Skipping completed stage {name}")
+            return self.load(name)
+
+        result = func()
+        if kind == "marker" or not (result is None or getattr(result, 'empty', False)):
+            self.save(name, result, kind)
+        return result
+
+    # -----------------------------
+    # Housekeeping
+    # -----------------------------
+    def prune(self, keep=3):
+        """
+        Delete all but the newest `keep` completed runs.
+        """
+        if not self.enabled:
+            return
+        completed = []
+        for run_id in os.listdir(self.root):
+            manifest_path = os.path.join(self.root, run_id, "manifest.json")
+            try:
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+            if manifest.get('complete') and run_id != self.run_id:
+                completed.append((manifest.get('created_at', 0), run_id))
+
+        for _, run_id in sorted(completed, reverse=True)[keep:]:
+            shutil.rmtree(os.path.join(self.root, run_id), ignore_errors=True)
+            self.logger.info(f"Pruned checkpoint run {run_id}")
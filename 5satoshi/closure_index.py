@@ -0,0 +1,232 @@
+#!/usr/bin/python
+
+import argparse
+import heapq
+import logging
+import os
+import sqlite3
+import time
+
+import tracing
+
+DEFAULT_INDEX_PATH = os.path.join(os.environ.get('HOME', '.'), "data", "closures.sqlite")
+
+# listpeerchannels states of channels that are closing or closed but may not
+# be in listclosedchannels yet
+CLOSING_STATES = ("CLOSINGD_SIGEXCHANGE", "CLOSINGD_COMPLETE", "AWAITING_UNILATERAL", "FUNDING_SPEND_SEEN", "ONCHAIN", "CLOSED")
+# close_cause values of closes that were not negotiated
+FORCE_CAUSES = ("protocol", "onchain")
+
+logger = logging.getLogger("ClosureIndex")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS closures (
+    channel_id TEXT PRIMARY KEY,
+    short_channel_id TEXT,
+    peer_id TEXT,
+    state TEXT,
+    opener TEXT,
+    closer TEXT,
+    cause TEXT,
+    total_msat INTEGER,
+    final_to_us_msat INTEGER,
+    closed_at INTEGER,
+    pending INTEGER
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS closures_closed_at ON closures (closed_at);
+CREATE INDEX IF NOT EXISTS closures_peer ON closures (peer_id, closed_at);
+"""
+
+COLUMNS = ["channel_id", "short_channel_id", "peer_id", "state", "opener", "closer", "cause",
+           "total_msat", "final_to_us_msat", "closed_at", "pending"]
+
+# -----------------------------
+# Conversion
+# -----------------------------
+def _msat(value):
+    if isinstance(value, str) and value.endswith("msat"):
+        return int(value[:-4])
+    return None if value is None else int(value)
+
+
+def from_closed(chan):
+    """
+    listclosedchannels entry -> row. The entry has no close time; the last
+    stable connection stands in for one only if the channel was never seen
+    closing, else it stays unknown (NULL).
+    """
+    return (
+        chan.get("channel_id"), chan.get("short_channel_id"), chan.get("peer_id"), "CLOSED",
+        chan.get("opener"), chan.get("closer"), chan.get("close_cause"),
+        _msat(chan.get("total_msat")), _msat(chan.get("final_to_us_msat")),
+        int(chan["last_stable_connection"]) if chan.get("last_stable_connection") else None, 0,
+    )
+
+
+def from_peer_channel(chan, now):
+    close_info = chan.get("close_info") or {}
+    return (
+        chan.get("channel_id"), chan.get("short_channel_id"), chan.get("peer_id"), chan.get("state"),
+        chan.get("opener"), close_info.get("closer") or chan.get("closer"), close_info.get("reason"),
+        _msat(chan.get("total_msat")), _msat(chan.get("to_us_msat")),
+        int(close_info.get("closed_at") or now), 1,
+    )
+
+# -----------------------------
+# Index
+# -----------------------------
+class ClosureIndex:
+    """
+    One row per closed (or closing) channel in SQLite, with indexes on
+    closed_at and (peer_id, closed_at) so recent-N and per-peer queries read
+    only the rows they return.
+
+    listclosedchannels takes no paging arguments and lists closes in the
+    order lightningd stored them, so the watermark is the number of entries
+    already indexed plus the channel_id of the last one: a sync converts
+    only the entries after it and falls back to a full upsert if the
+    listing no longer lines up.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, logger=logger):
+        self.logger = logger
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _meta(self, key, default=None):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self.db.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, str(value))
+        )
+
+    def _upsert(self, rows, replace_pending_only=False):
+        # Closing sightings keep the earliest time seen (MIN() of a NULL is NULL, hence the COALESCE);
+        # the final entry's last_stable_connection only fills in a row that has no time yet
+        updates = [f"{c} = excluded.{c}" for c in COLUMNS[1:] if c != "closed_at"]
+        updates.append(
+            "closed_at = CASE WHEN excluded.pending = 1 "
+            "THEN COALESCE(MIN(closures.closed_at, excluded.closed_at), closures.closed_at, excluded.closed_at) "
+            "ELSE COALESCE(closures.closed_at, excluded.closed_at) END"
+        )
+        sql = f"INSERT INTO closures ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) " \
+              f"ON CONFLICT (channel_id) DO UPDATE SET " + ", ".join(updates)
+        if replace_pending_only:
+            # Closing channels never overwrite their final listclosedchannels entry
+            sql += " WHERE closures.pending = 1"
+        self.db.executemany(sql, rows)
+
+    def sync(self, rpc, pending=True):
+        """
+        Index new listclosedchannels entries and, with pending, channels that
+        listpeerchannels shows in a closing state.
+        """
+        now = int(time.time())
+        with tracing.span("rpc.listclosedchannels") as sp:
+            closed = rpc.call("listclosedchannels")["closedchannels"]
+            sp.set(rows=len(closed))
+
+        seen = int(self._meta("closed_seen", 0))
+        last = self._meta("closed_last")
+        if seen and seen <= len(closed) and closed[seen - 1].get("channel_id") == last:
+            new = closed[seen:]
+        else:
+            new = closed
+        with self.db:
+            self._upsert([from_closed(c) for c in new])
+            if closed:
+                self._set_meta("closed_seen", len(closed))
+                self._set_meta("closed_last", closed[-1].get("channel_id"))
+
+        closing = []
+        if pending:
+            with tracing.span("rpc.listpeerchannels") as sp:
+                channels = rpc.call("listpeerchannels")["channels"]
+                sp.set(rows=len(channels))
+            closing = [from_peer_channel(c, now) for c in channels if c.get("state") in CLOSING_STATES]
+            with self.db:
+                self._upsert(closing, replace_pending_only=True)
+
+        self.logger.info(f"Indexed {len(new)} new closed channels, {len(closing)} closing")
+        return len(new)
+
+    # -----------------------------
+    # Queries
+    # -----------------------------
+    def _rows(self, sql, params=()):
+        cur = self.db.execute(sql, params)
+        names = [d[0] for d in cur.description]
+        return [dict(zip(names, row)) for row in cur]
+
+    def recent(self, n=5):
+        # Closures of unknown time sort last
+        return self._rows(f"SELECT {', '.join(COLUMNS)} FROM closures ORDER BY closed_at IS NULL, closed_at DESC LIMIT ?", (n,))
+
+    def by_peer(self, peer_id, n=None):
+        return self._rows(
+            f"SELECT {', '.join(COLUMNS)} FROM closures WHERE peer_id = ? ORDER BY closed_at IS NULL, closed_at DESC LIMIT ?",
+            (peer_id, -1 if n is None else n)
+        )
+
+    def force_close_rates(self, k=10, min_closures=1, since=None):
+        """
+        Peers with the highest share of forced closes, top k by rate then count.
+        """
+        where = "WHERE closed_at >= ?" if since is not None else ""
+        rows = self.db.execute(
+            f"SELECT peer_id, COUNT(*), COALESCE(SUM(cause IN ({', '.join('?' * len(FORCE_CAUSES))})), 0) "
+            f"FROM closures {where} GROUP BY peer_id",
+            FORCE_CAUSES + ((since,) if since is not None else ())
+        )
+        top = heapq.nlargest(
+            k,
+            ((forced / total, forced, total, peer or "") for peer, total, forced in rows if total >= min_closures),
+        )
+        return [{'peer_id': peer, 'closures': total, 'forced': forced, 'rate': rate} for rate, forced, total, peer in top]
+
+    def summary(self):
+        total, forced = self.db.execute(
+            f"SELECT COUNT(*), SUM(cause IN ({', '.join('?' * len(FORCE_CAUSES))})) FROM closures", FORCE_CAUSES
+        ).fetchone()
+        return {'closures': total, 'forced': forced or 0}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local index of channel closures")
+    parser.add_argument("command", choices=["sync", "recent", "peer", "rates"])
+    parser.add_argument("--path", default=DEFAULT_INDEX_PATH, help="SQLite index")
+    parser.add_argument("--rpc", default=os.environ.get('HOME', '') + "/.lightning/bitcoin/lightning-rpc", help="lightning-rpc socket")
+    parser.add_argument("--peer", help="Peer node id")
+    parser.add_argument("-n", type=int, default=10)
+    parser.add_argument("--min-closures", type=int, default=2, help="Rates: ignore peers with fewer closures")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    tracing.configure_from_args("closure_index", args)
+    index = ClosureIndex(args.path)
+
+    if args.command == "sync":
+        from pyln.client import LightningRpc
+        index.sync(LightningRpc(args.rpc))
+    elif args.command == "recent":
+        for row in index.recent(args.n):
+            print(row)
+    elif args.command == "peer":
+        for row in index.by_peer(args.peer, args.n):
+            print(row)
+    else:
+        for row in index.force_close_rates(args.n, args.min_closures):
+            print(f"{row['peer_id']}  {row['forced']}/{row['closures']}  {row['rate']:.0%}")
+    index.close()
@@ -0,0 +1,303 @@
+#!/usr/bin/python
+"""
+Collect node-local data from several Core Lightning nodes at once:
+
+    python collector.py --node main=~/.lightning/bitcoin/lightning-rpc \\
+                        --node btc=~/.lightning-btc/bitcoin/lightning-rpc
+
+Peer channels, forwards and closed channels are fetched from every node
+concurrently and tagged with the node id. Network gossip is the same on
+all nodes, so it is fetched once, from the node with the freshest view.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+
+import pandas as pd
+
+import tracing
+
+DEFAULT_OUTPUT_DIR = os.path.join(os.environ.get('HOME', '.'), "data", "collector")
+PAGE_SIZE = 50000
+PROBE_SIZE = 20
+
+logger = logging.getLogger("Collector")
+
+# -----------------------------
+# Async JSON-RPC
+# -----------------------------
+class RpcError(Exception):
+    def __init__(self, method, error):
+        super().__init__(f"{method}: {error}")
+        self.method = method
+        self.error = error
+
+
+class AsyncRpc:
+    """
+    Minimal asyncio client for the lightning-rpc unix socket, one
+    connection per call and at most `concurrency` calls at a time.
+    """
+
+    def __init__(self, path, concurrency=2):
+        self.path = path
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.ids = 0
+
+    async def call(self, method, **params):
+        self.ids += 1
+        request = {'jsonrpc': "2.0", 'id': self.ids, 'method': method, 'params': params}
+        async with self.semaphore:
+            reader, writer = await asyncio.open_unix_connection(self.path, limit=1 << 24)
+            try:
+                writer.write(json.dumps(request).encode())
+                await writer.drain()
+                buf = bytearray()
+                while True:
+                    chunk = await reader.read(1 << 20)
+                    if not chunk:
+                        raise ConnectionError(f"{self.path} closed the connection during {method}")
+                    buf += chunk
+                    # lightningd ends every response with a blank line
+                    if buf.endswith(b"\n\n"):
+                        try:
+                            response = json.loads(buf)
+                            break
+                        except ValueError:
+                            continue
+            finally:
+                writer.close()
+                await writer.wait_closed()
+        if "error" in response:
+            raise RpcError(method, response["error"])
+        return response["result"]
+
+# -----------------------------
+# Frames
+# -----------------------------
+def _nested_to_json(value):
+    if isinstance(value, (list, dict, tuple)):
+        return json.dumps(value, sort_keys=True, default=str)
+    return value
+
+
+def to_frame(rows, node_id=None):
+    """
+    RPC rows -> frame with nested values as JSON strings, tagged with the
+    node it came from.
+    """
+    df = pd.DataFrame(rows)
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].map(_nested_to_json)
+    if node_id is not None:
+        df.insert(0, "node_id", node_id)
+    return df
+
+# -----------------------------
+# Collection
+# -----------------------------
+class Node:
+    def __init__(self, name, path, concurrency=2):
+        self.name = name
+        self.rpc = AsyncRpc(path, concurrency)
+        self.id = None
+        self.blockheight = None
+
+
+async def fetch_forwards(node, start, page_size=PAGE_SIZE):
+    forwards = []
+    while True:
+        page = (await node.rpc.call("listforwards", index="updated", start=start, limit=page_size))["forwards"]
+        forwards.extend(page)
+        if len(page) < page_size:
+            return forwards
+        start = max(f["updated_index"] for f in page) + 1
+
+
+async def collect_node(node, watermark):
+    """
+    Node-local data of one node; the three calls run concurrently.
+    """
+    with tracing.span("collect.node", node=node.name):
+        peers, forwards, closed = await asyncio.gather(
+            node.rpc.call("listpeerchannels"),
+            fetch_forwards(node, watermark + 1),
+            node.rpc.call("listclosedchannels"),
+        )
+    return {
+        'peer_channels': to_frame(peers["channels"], node.id),
+        'forwards': to_frame(forwards, node.id),
+        'closed_channels': to_frame(closed["closedchannels"], node.id),
+    }
+
+
+async def freshness(node, probe):
+    """
+    (blockheight, newest last_update among the probe channels) as seen by
+    this node; a handful of small listchannels calls instead of a dump.
+    """
+    updates = await asyncio.gather(
+        *(node.rpc.call("listchannels", short_channel_id=scid) for scid in probe),
+        return_exceptions=True
+    )
+    newest = max(
+        (c["last_update"] for r in updates if not isinstance(r, Exception) for c in r["channels"]),
+        default=0
+    )
+    return node.blockheight, newest
+
+
+async def collect_gossip(nodes, probe):
+    if len(nodes) > 1 and probe:
+        scores = await asyncio.gather(*(freshness(n, probe) for n in nodes))
+        source = nodes[max(range(len(nodes)), key=lambda i: scores[i])]
+    else:
+        source = nodes[0]
+    logger.info(f"Fetching gossip from {source.name}")
+    with tracing.span("collect.gossip", node=source.name):
+        channels, network = await asyncio.gather(source.rpc.call("listchannels"), source.rpc.call("listnodes"))
+    gossip = {
+        'channels': to_frame(channels["channels"]),
+        'nodes': to_frame(network["nodes"]),
+    }
+    for df in gossip.values():
+        df["gossip_source"] = source.id
+    return gossip
+
+
+async def collect(nodes, watermarks, probe):
+    """
+    Node-local data of all nodes plus one gossip dump, all concurrently.
+    """
+    infos = await asyncio.gather(*(n.rpc.call("getinfo") for n in nodes))
+    for node, info in zip(nodes, infos):
+        node.id = info["id"]
+        node.blockheight = info.get("blockheight", 0)
+
+    if not probe:
+        # First run: probe with our own channels, known to every node's gossip
+        peers = await nodes[0].rpc.call("listpeerchannels")
+        probe = [c["short_channel_id"] for c in peers["channels"] if c.get("short_channel_id")]
+    probe = random.sample(probe, min(PROBE_SIZE, len(probe)))
+
+    *local, gossip = await asyncio.gather(
+        *(collect_node(n, watermarks.get(n.id, 0)) for n in nodes),
+        collect_gossip(nodes, probe)
+    )
+    return dict(zip((n.id for n in nodes), local)), gossip
+
+# -----------------------------
+# Output
+# -----------------------------
+class ParquetSink:
+    """
+    out/<table>/node_id=<id>/<stamp>.parquet for node-local tables and
+    out/<table>/<stamp>.parquet for gossip; forwards watermarks per node
+    in out/_meta.json.
+    """
+
+    def __init__(self, root=DEFAULT_OUTPUT_DIR):
+        self.root = root
+        self.meta_path = os.path.join(root, "_meta.json")
+        os.makedirs(root, exist_ok=True)
+
+    def watermarks(self):
+        try:
+            with open(self.meta_path) as f:
+                return json.load(f).get('forwards_watermark', {})
+        except FileNotFoundError:
+            return {}
+
+    def set_watermarks(self, marks):
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'forwards_watermark': marks}, f)
+        os.replace(tmp, self.meta_path)
+
+    def write(self, table, df, stamp, node_id=None):
+        if df.empty:
+            return
+        parts = [self.root, table] + ([f"node_id={node_id}"] if node_id else [])
+        directory = os.path.join(*parts)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{stamp}.parquet")
+        df.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+
+    def probe(self):
+        """
+        Channel ids from the last gossip dump to probe freshness with.
+        """
+        directory = os.path.join(self.root, "channels")
+        if not os.path.isdir(directory):
+            return []
+        files = sorted(f for f in os.listdir(directory) if f.endswith(".parquet"))
+        if not files:
+            return []
+        scids = pd.read_parquet(os.path.join(directory, files[-1]), columns=["short_channel_id"])["short_channel_id"]
+        return scids.drop_duplicates().sample(min(PROBE_SIZE * 10, len(scids))).tolist()
+
+
+def store(sink, local, gossip, watermarks, upload=False):
+    stamp = pd.Timestamp.now(tz="UTC").strftime("%Y%m%dT%H%M%S")
+    for node_id, tables in local.items():
+        for table, df in tables.items():
+            sink.write(table, df, stamp, node_id)
+        if not tables['forwards'].empty:
+            watermarks[node_id] = int(tables['forwards']['updated_index'].max())
+    for table, df in gossip.items():
+        sink.write(table, df, stamp)
+
+    if upload:
+        import bqload
+        with bqload.BulkLoader() as loader:
+            for table in ("peer_channels", "forwards", "closed_channels"):
+                frames = [tables[table] for tables in local.values() if not tables[table].empty]
+                if frames:
+                    loader.submit(pd.concat(frames, ignore_index=True), f"lightning-fee-optimizer.version_1.node_{table}", if_exists='append')
+
+    # Only after the upload succeeded (BulkLoader re-raises failed loads), so
+    # a failed run collects the same forwards again next time
+    sink.set_watermarks(watermarks)
+
+
+def parse_node(text):
+    name, _, path = text.partition("=")
+    return name, os.path.expanduser(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent multi-node collector with shared gossip")
+    parser.add_argument("--node", action="append", type=parse_node,
+                        help="name=path/to/lightning-rpc (repeatable)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_DIR, help="Output directory")
+    parser.add_argument("--rpc-concurrency", type=int, default=2, help="Concurrent calls per node")
+    parser.add_argument("--upload", action="store_true", help="Also append node-local tables to BigQuery")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    tracing.configure_from_args("collector", args)
+
+    home = os.environ.get('HOME', '')
+    node_args = args.node or [
+        ("main", os.path.join(home, ".lightning/bitcoin/lightning-rpc")),
+        ("btc", os.path.join(home, ".lightning-btc/bitcoin/lightning-rpc")),
+    ]
+    sink = ParquetSink(args.output)
+    watermarks = sink.watermarks()
+
+    async def main():
+        nodes = [Node(name, path, args.rpc_concurrency) for name, path in node_args]
+        with tracing.span("collect", nodes=len(nodes)):
+            return await collect(nodes, watermarks, sink.probe())
+
+    local, gossip = asyncio.run(main())
+    for node_id, tables in local.items():
+        logger.info(f"{node_id[:12]}: " + ", ".join(f"{len(df)} {table}" for table, df in tables.items()))
+    logger.info(f"Gossip: {len(gossip['channels'])} channels, {len(gossip['nodes'])} nodes")
+    store(sink, local, gossip, watermarks, args.upload)
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+"""
+Compact edge-betweenness rows:
+
+    snapshot_id  short_channel_id  direction  type  score  rank
+
+instead of every channel column merged onto every score. Channel
+attributes are appended once per snapshot to the *_channels table and are
+joined back on (snapshot_id, short_channel_id, direction); *_snapshots has
+one row per snapshot. Optionally only the top k edges or the edges whose
+rank changed since the previous snapshot are written.
+"""
+
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_STATE_DIR = os.path.join(os.environ.get('HOME', '.'), ".cache", "cl-tools", "edge_ranks")
+DEFAULT_TABLE = "lightning-fee-optimizer.version_1.edge_betweenness_compact"
+CHUNK_ROWS = 250_000
+# listchannels columns kept per snapshot for the join
+CHANNEL_COLUMNS = ["short_channel_id", "direction", "source", "destination", "satoshis", "active",
+                   "base_fee_millisatoshi", "fee_per_millionth", "delay",
+                   "htlc_minimum_msat", "htlc_maximum_msat", "last_update"]
+
+logger = logging.getLogger("EdgeScores")
+
+# -----------------------------
+# Frames
+# -----------------------------
+def snapshot_id(digest):
+    """
+    Integer id of a snapshot digest (first 60 bits, fits INT64).
+    """
+    return int(digest[:15], 16)
+
+
+def compact_frame(short_channel_id, direction, score, tx_type, snapshot):
+    """
+    One row per edge with narrow dtypes; rank 1 is the highest score.
+    """
+    score = np.asarray(score, dtype=np.float64)
+    rank = pd.Series(score).rank(method='min', ascending=False).to_numpy(dtype=np.int32)
+    return pd.DataFrame({
+        'snapshot_id': np.full(len(score), snapshot_id(snapshot), dtype=np.int64),
+        'short_channel_id': pd.Categorical(short_channel_id),
+        'direction': np.asarray(direction, dtype=np.int8),
+        'type': pd.Categorical([tx_type] * len(score)),
+        'score': score.astype(np.float32),
+        'rank': rank,
+    })
+
+
+def channel_frame(channels, snapshot):
+    """
+    The snapshot's channel attributes, keyed like compact_frame rows.
+    """
+    df = channels[[c for c in CHANNEL_COLUMNS if c in channels.columns]].copy()
+    df.insert(0, 'snapshot_id', np.full(len(df), snapshot_id(snapshot), dtype=np.int64))
+    if 'direction' in df:
+        df['direction'] = df['direction'].astype(np.int8)
+    for c in ('source', 'destination'):
+        if c in df:
+            df[c] = pd.Categorical(df[c])
+    return df.reset_index(drop=True)
+
+
+def top_k(df, k):
+    return df[df['rank'] <= k]
+
+
+def rank_changed(df, previous, min_change=1):
+    """
+    Rows that are new or moved at least min_change ranks since previous.
+    """
+    if previous is None:
+        return df
+    keys = ['short_channel_id', 'direction']
+    old = previous.set_index(keys)['rank']
+    idx = pd.MultiIndex.from_arrays([df['short_channel_id'].astype(str), df['direction']])
+    before = old.reindex(idx).to_numpy(dtype=float)
+    moved = np.isnan(before) | (np.abs(before - df['rank'].to_numpy()) >= min_change)
+    return df[moved]
+
+# -----------------------------
+# Writer
+# -----------------------------
+class CompactEdges:
+    """
+    Filters and uploads compact frames in chunks; remembers the last ranks
+    per tx_type in state_dir for the rank_changed filter.
+    """
+
+    def __init__(self, table=DEFAULT_TABLE, k=None, changed=False, min_change=1,
+                 state_dir=DEFAULT_STATE_DIR, chunk_rows=CHUNK_ROWS, logger=logger):
+        self.table = table
+        self.k = k
+        self.changed = changed
+        self.min_change = min_change
+        self.state_dir = state_dir
+        self.chunk_rows = chunk_rows
+        self.logger = logger
+
+    def _state_path(self, tx_type):
+        return os.path.join(self.state_dir, f"{tx_type}.parquet")
+
+    def previous(self, tx_type):
+        path = self._state_path(tx_type)
+        if not os.path.exists(path):
+            return None
+        return pd.read_parquet(path)
+
+    def remember(self, df, tx_type):
+        os.makedirs(self.state_dir, exist_ok=True)
+        path = self._state_path(tx_type)
+        state = df[['short_channel_id', 'direction', 'rank']].copy()
+        state['short_channel_id'] = state['short_channel_id'].astype(str)
+        state.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+
+    def select(self, df, tx_type):
+        out = df
+        if self.changed:
+            out = rank_changed(out, self.previous(tx_type), self.min_change)
+        if self.k:
+            out = top_k(out, self.k)
+        self.logger.info(f"[{tx_type}] {len(out)} of {len(df)} edge rows selected")
+        return out
+
+    def write(self, df, loader=None):
+        """
+        Append in chunks of chunk_rows through a bqload.BulkLoader.
+        """
+        import bqload
+        own = loader is None
+        loader = loader or bqload.BulkLoader()
+        try:
+            for start in range(0, len(df), self.chunk_rows):
+                loader.submit(df.iloc[start:start + self.chunk_rows], self.table, if_exists='append')
+            if own:
+                loader.wait()
+        finally:
+            if own:
+                loader.close()
+
+    def write_snapshot(self, snapshot, timestamp, channels, nodes, loader=None):
+        """
+        The snapshot's channel attributes (appended to <table>_channels, so
+        they outlive the replaced channels table) and one <table>_snapshots
+        row. Call once per snapshot.
+        """
+        row = pd.DataFrame({
+            'snapshot_id': [snapshot_id(snapshot)],
+            'digest': [snapshot],
+            'timestamp': [timestamp],
+            'channels': [len(channels)],
+            'nodes': [nodes],
+        })
+        import bqload
+        own = loader is None
+        loader = loader or bqload.BulkLoader()
+        try:
+            attrs = channel_frame(channels, snapshot)
+            for start in range(0, len(attrs), self.chunk_rows):
+                loader.submit(attrs.iloc[start:start + self.chunk_rows], self.table + "_channels", if_exists='append')
+            loader.submit(row, self.table + "_snapshots", if_exists='append')
+            if own:
+                loader.wait()
+        finally:
+            if own:
+                loader.close()
+
+    def publish(self, df, tx_type):
+        """
+        select + write + remember the full ranking.
+        """
+        self.write(self.select(df, tx_type))
+        self.remember(df, tx_type)
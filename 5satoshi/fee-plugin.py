@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Event-driven fee updater, run as a Core Lightning plugin:
+
+    lightningd --plugin=/path/to/cl-tools/5satoshi/fee-plugin.py
+
+Keeps a per-channel balance table up to date from forward_event and
+channel_state_changed notifications and re-evaluates only the channels
+that were touched, with the same policy as fee-updates.py. Each channel
+gets at most one setchannel per debounce window.
+"""
+
+import os
+import sys
+import threading
+import time
+
+from pyln.client import Millisatoshi, Plugin
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import fee_policy
+
+plugin = Plugin()
+
+# short_channel_id -> {'channel_id', 'peer_id', 'to_us_msat', 'total_msat', 'htlc_max', 'ppm'}
+channels = {}
+# short_channel_id -> earliest time the channel may be updated again
+next_allowed = {}
+# short_channel_id -> due time of a pending evaluation
+pending = {}
+stats = {'forwards': 0, 'state_changes': 0, 'evaluations': 0, 'updates': 0, 'resyncs': 0}
+lock = threading.Lock()
+
+
+def msat(value):
+    return int(Millisatoshi(value)) if value is not None else 0
+
+# -----------------------------
+# Balance table
+# -----------------------------
+def channel_row(chan):
+    return {
+        'channel_id': chan["channel_id"],
+        'peer_id': chan.get("peer_id"),
+        'to_us_msat': msat(chan.get("to_us_msat")),
+        'total_msat': msat(chan.get("total_msat")),
+        'htlc_max': msat(chan.get("maximum_htlc_out_msat")),
+        'ppm': chan.get("fee_proportional_millionths"),
+    }
+
+
+def resync(peer_id=None):
+    """
+    Rebuild the table (or one peer's rows) from listpeerchannels. Also
+    corrects drift from payments that do not show up as forwards.
+    """
+    result = plugin.rpc.listpeerchannels(peer_id) if peer_id else plugin.rpc.listpeerchannels()
+    with lock:
+        if peer_id is None:
+            channels.clear()
+        for chan in result["channels"]:
+            scid = chan.get("short_channel_id")
+            if scid is None:
+                continue
+            if chan.get("state") == "CHANNELD_NORMAL":
+                channels[scid] = channel_row(chan)
+            else:
+                channels.pop(scid, None)
+        stats['resyncs'] += 1
+
+
+def touch(scid):
+    """
+    Queue a channel for evaluation, no earlier than its debounce window allows.
+    """
+    if scid not in channels:
+        return
+    due = max(time.time(), next_allowed.get(scid, 0))
+    pending[scid] = min(pending.get(scid, due), due)
+
+# -----------------------------
+# Evaluation
+# -----------------------------
+def evaluate(scid):
+    with lock:
+        row = channels.get(scid)
+        if row is None:
+            return
+        row = dict(row)
+    stats['evaluations'] += 1
+
+    update, balance, new_fee, new_htlc_max = fee_policy.evaluate(row['to_us_msat'], row['total_msat'], row['htlc_max'])
+    if not update:
+        return
+
+    plugin.log(
+        f"Update fee for {row['channel_id']}: balance {balance:.3f}, liquidity {row['to_us_msat']}, "
+        f"htlc_max {row['htlc_max']} -> {new_htlc_max}, ppm {row['ppm']} -> {new_fee}"
+    )
+    if not plugin.dry_run:
+        plugin.rpc.setchannel(id=row['channel_id'], feebase=fee_policy.BASE_FEE, feeppm=new_fee, htlcmax=new_htlc_max)
+
+    with lock:
+        if scid in channels:
+            channels[scid]['htlc_max'] = new_htlc_max
+            channels[scid]['ppm'] = new_fee
+        next_allowed[scid] = time.time() + plugin.debounce
+    stats['updates'] += 1
+
+
+def worker():
+    last_resync = time.time()
+    while True:
+        time.sleep(1)
+        now = time.time()
+        with lock:
+            due = [scid for scid, t in pending.items() if t <= now]
+            for scid in due:
+                del pending[scid]
+        for scid in due:
+            try:
+                evaluate(scid)
+            except Exception as e:
+                plugin.log(f"Fee update for {scid} failed: {e}", level="warn")
+
+        if now - last_resync > plugin.resync_interval:
+            try:
+                resync()
+                with lock:
+                    for scid in list(channels):
+                        touch(scid)
+            except Exception as e:
+                plugin.log(f"Resync failed: {e}", level="warn")
+            last_resync = now
+
+# -----------------------------
+# Notifications
+# -----------------------------
+@plugin.subscribe("forward_event")
+def on_forward_event(plugin, forward_event, **kwargs):
+    if forward_event.get("status") != "settled":
+        return
+    in_channel = forward_event.get("in_channel")
+    out_channel = forward_event.get("out_channel")
+    with lock:
+        stats['forwards'] += 1
+        if in_channel in channels:
+            channels[in_channel]['to_us_msat'] += msat(forward_event.get("in_msat"))
+            touch(in_channel)
+        if out_channel in channels:
+            channels[out_channel]['to_us_msat'] -= msat(forward_event.get("out_msat"))
+            touch(out_channel)
+
+
+@plugin.subscribe("channel_state_changed")
+def on_channel_state_changed(plugin, channel_state_changed, **kwargs):
+    stats['state_changes'] += 1
+    scid = channel_state_changed.get("short_channel_id")
+    if channel_state_changed.get("new_state") == "CHANNELD_NORMAL":
+        resync(channel_state_changed.get("peer_id"))
+        with lock:
+            touch(scid)
+    else:
+        with lock:
+            channels.pop(scid, None)
+            pending.pop(scid, None)
+
+# -----------------------------
+# RPC
+# -----------------------------
+@plugin.method("feeplugin-status")
+def status(plugin, **kwargs):
+    """Show the balance table, pending evaluations and counters."""
+    with lock:
+        return {
+            'channels': {scid: dict(row) for scid, row in channels.items()},
+            'pending': len(pending),
+            'stats': dict(stats),
+        }
+
+# -----------------------------
+# Init
+# -----------------------------
+plugin.add_option("feeplugin-debounce", "10", "Minimum minutes between two updates of the same channel", opt_type="int")
+plugin.add_option("feeplugin-resync", "60", "Minutes between full listpeerchannels resyncs", opt_type="int")
+plugin.add_option("feeplugin-dry-run", False, "Log updates without calling setchannel", opt_type="flag")
+
+
+@plugin.init()
+def init(options, configuration, plugin, **kwargs):
+    plugin.debounce = int(options["feeplugin-debounce"]) * 60
+    plugin.resync_interval = int(options["feeplugin-resync"]) * 60
+    plugin.dry_run = bool(options["feeplugin-dry-run"])
+
+    resync()
+    with lock:
+        for scid in channels:
+            touch(scid)
+    threading.Thread(target=worker, name="feeplugin-worker", daemon=True).start()
+    plugin.log(f"Fee plugin tracking {len(channels)} channels, debounce {plugin.debounce}s")
+
+
+plugin.run()
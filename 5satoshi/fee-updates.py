@@ -1,14 +1,22 @@
-from pyln.client import LightningRpc, Millisatoshi
-import pandas
-import math, time
-import sys, os, logging
-import random
+import time
+import os, logging
+
+import fee_policy
+import tracing
+
+RPC_PATH = os.environ['HOME']+"/.lightning/bitcoin/lightning-rpc"
+RPC_PATH_BTC = os.environ['HOME']+"/.lightning-btc/bitcoin/lightning-rpc"
 
 
 def update_fees(rpcpath,test=False,update_all = False):
+    # pyln and pandas are imported per run so importing this module stays cheap
+    from pyln.client import LightningRpc
+    import pandas
     l1 = LightningRpc(rpcpath)
     
-    channels = l1.listpeerchannels()
+    with tracing.span("rpc.listpeerchannels", node=rpcpath) as sp:
+        channels = l1.listpeerchannels()
+        sp.set(rows=len(channels["channels"]))
     
     dfp = pandas.DataFrame(channels["channels"])
     
@@ -19,19 +27,13 @@ def update_fees(rpcpath,test=False,update_all = False):
             msat_to_us = row["to_us_msat"]
             msat_total = row["total_msat"]
             
-            balance = (msat_to_us+1)/msat_total
-            new_fee = pow(math.floor(1/balance),2)
-            if new_fee>10000:
-                new_fee=10000
-            base_fee = 0
-            
             ppm = row["fee_proportional_millionths"]
             htlc_max = row["maximum_htlc_out_msat"]
-            new_htlc_max = int(msat_to_us - random.random() * 0.1 * msat_total)
-            if new_htlc_max < 0:
-                new_htlc_max = msat_to_us
+            base_fee = fee_policy.BASE_FEE
+            
+            update, balance, new_fee, new_htlc_max = fee_policy.evaluate(msat_to_us, msat_total, htlc_max, update_all)
             
-            if msat_to_us - (0.1 * msat_total) > htlc_max  or msat_to_us < htlc_max or update_all or balance>1:
+            if update:
                 logging.info("Update fee:")
                 logging.info("Channel balance for " + channel_id + " is "+ str(balance) )
                 logging.info("Liquidity is now "+ str(msat_to_us) )
@@ -45,31 +47,46 @@ def update_fees(rpcpath,test=False,update_all = False):
                 time.sleep(5)
 
 
-logging.basicConfig(filename=os.environ['HOME']+'/logs/fees.log', level=logging.INFO,format='%(asctime)s - %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',filemode = 'a')
 
-update_fees(os.environ['HOME']+"/.lightning/bitcoin/lightning-rpc")
+def store_peers(rpcpath):
+    from pyln.client import LightningRpc
+    import pandas
+    import bqload
+    l1 = LightningRpc(rpcpath)
+    with tracing.span("rpc.listpeerchannels") as sp:
+        channels = l1.listpeerchannels()
+        sp.set(rows=len(channels["channels"]))
+
+    dfp = pandas.DataFrame(channels["channels"])
+    ### backward compatability
+    dfp['msatoshi_to_us'] = dfp['to_us_msat']
+    dfp['msatoshi_to_us_max'] = dfp['max_to_us_msat']
+    dfp['msatoshi_to_us_min'] = dfp['min_to_us_msat']
+    dfp['out_msatoshi_fulfilled'] = dfp['out_fulfilled_msat']
+    dfp['msatoshi_total'] = dfp['total_msat']
+    dfp['id'] = dfp['peer_id']
+
+    dfp = dfp.select_dtypes(include=['int64', 'float64', 'object', 'bool', 'datetime64[ns]'])
+    bqload.upload(dfp, "lightning-fee-optimizer.version_1.peers", if_exists='replace')
 
-### db update -------------------------------------------------
-l1 = LightningRpc(os.environ['HOME']+"/.lightning/bitcoin/lightning-rpc")
-channels = l1.listpeerchannels()
 
-dfp = pandas.DataFrame(channels["channels"])
-### backward compatability
-dfp['msatoshi_to_us'] = dfp['to_us_msat']
-dfp['msatoshi_to_us_max'] = dfp['max_to_us_msat']
-dfp['msatoshi_to_us_min'] = dfp['min_to_us_msat']
-dfp['out_msatoshi_fulfilled'] = dfp['out_fulfilled_msat']
-dfp['msatoshi_total'] = dfp['total_msat']
-dfp['id'] = dfp['peer_id']
+def main():
+    logging.basicConfig(filename=os.environ['HOME']+'/logs/fees.log', level=logging.INFO,format='%(asctime)s - %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',filemode = 'a')
+    tracing.configure("fee-updates")
 
-dfp = dfp.select_dtypes(include=['int64', 'float64', 'object', 'bool', 'datetime64[ns]'])
-dfp.to_gbq("lightning-fee-optimizer.version_1.peers",if_exists='replace')
+    with tracing.span("update_fees"):
+        update_fees(RPC_PATH)
 
+    ### db update -------------------------------------------------
+    store_peers(RPC_PATH)
 
-### btcbrother -------------------------------------------------
+    ### btcbrother -------------------------------------------------
 
+    logging.basicConfig(filename=os.environ['HOME']+'/logs/fees-btc.log', level=logging.INFO,format='%(asctime)s - %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',filemode = 'a')
 
-logging.basicConfig(filename=os.environ['HOME']+'/logs/fees-btc.log', level=logging.INFO,format='%(asctime)s - %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',filemode = 'a')
+    with tracing.span("update_fees"):
+        update_fees(RPC_PATH_BTC)
 
-update_fees(os.environ['HOME']+"/.lightning-btc/bitcoin/lightning-rpc")
 
+if __name__ == "__main__":
+    main()
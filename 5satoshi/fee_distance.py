@@ -0,0 +1,252 @@
+#!/usr/bin/python
+
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse import csgraph
+
+import tracing
+from amount_sweep import AmountGraph, prepare
+
+DEFAULT_DISTANCE_DIR = os.path.join(os.environ.get('HOME', '.'), "data", "fee_distance")
+CHUNK = 256
+
+logger = logging.getLogger("FeeDistance")
+
+# -----------------------------
+# Workers
+# -----------------------------
+_worker = {}
+
+
+def _init_worker(matrix, path, predecessors):
+    _worker['matrix'] = matrix
+    _worker['dist'] = np.load(os.path.join(path, "dist.npy"), mmap_mode="r+")
+    if predecessors:
+        _worker['pred'] = np.load(os.path.join(path, "pred.npy"), mmap_mode="r+")
+
+
+def _solve_rows(start, stop):
+    """
+    Rows [start, stop), written straight into the memmaps. The source's own
+    channel is free, so its row is the min over its out-neighbours u of the
+    distance from u (one multi-source Dijkstra with min_only); u's
+    predecessor is the source.
+    """
+    matrix = _worker['matrix']
+    n = matrix.shape[0]
+    with_pred = 'pred' in _worker
+    dist = np.full((stop - start, n), np.inf, dtype=np.float32)
+    pred = np.full((stop - start, n), -9999, dtype=np.int32) if with_pred else None
+    for row, s in enumerate(range(start, stop)):
+        first = matrix.indices[matrix.indptr[s]:matrix.indptr[s + 1]]
+        if len(first):
+            if with_pred:
+                d, p, _ = csgraph.dijkstra(matrix, directed=True, indices=first, min_only=True, return_predecessors=True)
+                p[first] = s
+                pred[row] = p
+            else:
+                d = csgraph.dijkstra(matrix, directed=True, indices=first, min_only=True)
+            dist[row] = d
+        dist[row, s] = 0
+        if with_pred:
+            pred[row, s] = -9999
+    _worker['dist'][start:stop] = dist
+    _worker['dist'].flush()
+    if with_pred:
+        _worker['pred'][start:stop] = pred
+        _worker['pred'].flush()
+    return stop - start
+
+
+def fee_matrix(edges, graph, keep):
+    """
+    Cheapest fee per (source, destination) pair among the kept nodes at the
+    graph's amount: base + amount * ppm in msat, without the jitter that
+    AmountGraph adds to make paths unique. Zero-fee channels stay explicit
+    zeros, which csgraph treats as edges.
+    """
+    pos = np.full(len(edges['nodeids']), -1, dtype=np.int64)
+    pos[keep] = np.arange(len(keep))
+    e = np.flatnonzero(graph.mask & (pos[edges['src']] >= 0) & (pos[edges['dst']] >= 0))
+    fee = edges['base'][e] + graph.amount * edges['ppm'][e] * 1000
+    u, v = pos[edges['src'][e]], pos[edges['dst'][e]]
+    order = np.lexsort((fee, v, u))
+    u, v, fee = u[order], v[order], fee[order]
+    first = np.ones(len(u), dtype=bool)
+    first[1:] = (np.diff(u) != 0) | (np.diff(v) != 0)
+    return sp.csr_matrix((fee[first], (u[first], v[first])), shape=(len(keep), len(keep)))
+
+# -----------------------------
+# Build
+# -----------------------------
+def build(channels, nodes, amount_sat, path, workers=4, chunk=CHUNK, predecessors=False, exclude=None, seed=0, logger=logger):
+    """
+    All-sources cheapest fee (msat, float32) within the largest SCC at
+    amount_sat, as path/dist.npy (row = source, column = destination) plus
+    optionally path/pred.npy with the predecessor of every destination.
+    Like the route finder, the source pays no fee on its own first hop.
+    With exclude=<nodeid> that node's channels are left out, e.g. to see
+    what routing around us costs.
+    """
+    if exclude is not None:
+        channels = channels[(channels['source'] != exclude) & (channels['destination'] != exclude)]
+        nodes = nodes[nodes['nodeid'] != exclude]
+
+    edges = prepare(channels, nodes, seed)
+    graph = AmountGraph(edges, amount_sat)
+    keep = np.flatnonzero(graph.in_scc)
+    matrix = fee_matrix(edges, graph, keep)
+    n = len(keep)
+    logger.info(f"Largest SCC at {amount_sat} sat: {n} nodes, {matrix.nnz} channels")
+
+    os.makedirs(path, exist_ok=True)
+    np.lib.format.open_memmap(os.path.join(path, "dist.npy"), mode="w+", dtype=np.float32, shape=(n, n)).flush()
+    if predecessors:
+        np.lib.format.open_memmap(os.path.join(path, "pred.npy"), mode="w+", dtype=np.int32, shape=(n, n)).flush()
+
+    start = time.time()
+    bounds = [(lo, min(lo + chunk, n)) for lo in range(0, n, chunk)]
+    with tracing.span("fee_distance.solve", nodes=n, chunks=len(bounds)):
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(matrix, path, predecessors)) as pool:
+            done = 0
+            for rows in pool.map(_solve_rows, *zip(*bounds)):
+                done += rows
+    logger.info(f"Solved {done} sources in {time.time() - start:.1f}s")
+
+    index = {
+        'amount_sat': amount_sat,
+        'nodes': edges['nodeids'][keep].tolist(),
+        'predecessors': predecessors,
+        'exclude': exclude,
+        'seed': seed,
+        'latest_update': str(channels['last_update'].max()) if 'last_update' in channels else None,
+        'created_at': pd.Timestamp.now(tz="UTC").isoformat(),
+    }
+    with open(os.path.join(path, "index.json.tmp"), "w") as f:
+        json.dump(index, f)
+    os.replace(os.path.join(path, "index.json.tmp"), os.path.join(path, "index.json"))
+    return FeeDistances(path)
+
+# -----------------------------
+# Queries
+# -----------------------------
+class FeeDistances:
+    """
+    Read-only view of a matrix written by build(). Rows and columns are
+    read from the memory map, so only the touched pages are loaded.
+    """
+
+    def __init__(self, path=DEFAULT_DISTANCE_DIR):
+        self.path = path
+        with open(os.path.join(path, "index.json")) as f:
+            self.index = json.load(f)
+        self.nodes = pd.Index(self.index['nodes'])
+        self.dist = np.load(os.path.join(path, "dist.npy"), mmap_mode="r")
+        pred_path = os.path.join(path, "pred.npy")
+        self.pred = np.load(pred_path, mmap_mode="r") if os.path.exists(pred_path) else None
+
+    def _pos(self, node):
+        pos = self.nodes.get_indexer([node])[0]
+        if pos < 0:
+            raise KeyError(f"{node} is not in the largest SCC at {self.index['amount_sat']} sat")
+        return pos
+
+    def distance(self, source, destination):
+        return float(self.dist[self._pos(source), self._pos(destination)])
+
+    def row(self, source):
+        """
+        Cheapest fee from source to every node.
+        """
+        return pd.Series(np.asarray(self.dist[self._pos(source)]), index=self.nodes, name=source)
+
+    def column(self, destination):
+        """
+        Cheapest fee from every node to destination.
+        """
+        return pd.Series(np.asarray(self.dist[:, self._pos(destination)]), index=self.nodes, name=destination)
+
+    def top_k(self, node, k=10, outgoing=True, largest=False):
+        """
+        k cheapest (or most expensive) destinations from node, or sources
+        towards it with outgoing=False. The node itself is left out.
+        """
+        values = np.asarray(self.dist[self._pos(node)] if outgoing else self.dist[:, self._pos(node)], dtype=np.float64)
+        values[self._pos(node)] = np.nan
+        finite = np.flatnonzero(np.isfinite(values))
+        k = min(k, len(finite))
+        if k == 0:
+            return pd.Series(dtype=float)
+        key = -values[finite] if largest else values[finite]
+        part = finite[np.argpartition(key, k - 1)[:k]]
+        part = part[np.argsort(-values[part] if largest else values[part])]
+        return pd.Series(values[part], index=self.nodes[part])
+
+    def path(self, source, destination):
+        """
+        Node ids along the cheapest path (needs predecessors).
+        """
+        if self.pred is None:
+            raise ValueError("Matrix was built without predecessors")
+        s, t = self._pos(source), self._pos(destination)
+        pred = self.pred[s]
+        hops = [t]
+        while hops[-1] != s:
+            p = int(pred[hops[-1]])
+            if p < 0:
+                return []
+            hops.append(p)
+        return self.nodes[hops[::-1]].tolist()
+
+    def detour(self, without, source):
+        """
+        Extra fee per destination when routing from source without the node
+        of `without` (a FeeDistances built with exclude=...).
+        """
+        base = self.row(source)
+        other = without.row(source)
+        return (other - base.reindex(other.index)).sort_values(ascending=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="All-sources fee distance matrix")
+    parser.add_argument("command", choices=["build", "row", "column", "top", "path"])
+    parser.add_argument("--path", default=DEFAULT_DISTANCE_DIR, help="Matrix directory")
+    parser.add_argument("--amount", type=int, default=80000, help="Payment amount in sat")
+    parser.add_argument("--channels-file", help="Parquet/CSV of listchannels (default: BigQuery channels)")
+    parser.add_argument("--nodes-file", help="Parquet/CSV of listnodes (default: BigQuery nodes)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk", type=int, default=CHUNK, help="Sources per task")
+    parser.add_argument("--predecessors", action="store_true", help="Also store predecessor arrays")
+    parser.add_argument("--exclude", help="Leave this node out (routing around it)")
+    parser.add_argument("--node", help="Source (row/top/path) or destination (column)")
+    parser.add_argument("--to", help="Destination for path")
+    parser.add_argument("--k", type=int, default=10)
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    tracing.configure_from_args("fee_distance", args)
+
+    if args.command == "build":
+        from amount_sweep import load_inputs
+        channels, nodes, _ = load_inputs(args)
+        build(channels, nodes, args.amount, args.path, args.workers, args.chunk, args.predecessors, args.exclude)
+    else:
+        fd = FeeDistances(args.path)
+        if args.command == "row":
+            print(fd.row(args.node).describe())
+        elif args.command == "column":
+            print(fd.column(args.node).describe())
+        elif args.command == "top":
+            print(fd.top_k(args.node, args.k).to_string())
+        else:
+            print(" -> ".join(fd.path(args.node, args.to)))
@@ -0,0 +1,47 @@
+#!/usr/bin/python
+
+import math
+import random
+
+MAX_PPM = 10000
+BASE_FEE = 0
+
+# -----------------------------
+# Balance -> ppm / htlc_max policy
+# -----------------------------
+def channel_balance(msat_to_us, msat_total):
+    return (msat_to_us + 1) / msat_total
+
+
+def new_ppm(balance):
+    new_fee = pow(math.floor(1 / balance), 2)
+    if new_fee > MAX_PPM:
+        new_fee = MAX_PPM
+    return new_fee
+
+
+def new_htlc_max(msat_to_us, msat_total, rng=random):
+    htlc_max = int(msat_to_us - rng.random() * 0.1 * msat_total)
+    if htlc_max < 0:
+        htlc_max = msat_to_us
+    return htlc_max
+
+
+def needs_update(msat_to_us, msat_total, htlc_max, balance, update_all=False):
+    return msat_to_us - (0.1 * msat_total) > htlc_max or msat_to_us < htlc_max or update_all or balance > 1
+
+
+def evaluate(msat_to_us, msat_total, htlc_max, update_all=False, rng=random):
+    """
+    Apply the policy to one channel.
+
+    Returns (update, balance, ppm, htlc_max) where update tells whether
+    the current htlc_max is out of line with our liquidity.
+    """
+    balance = channel_balance(msat_to_us, msat_total)
+    return (
+        needs_update(msat_to_us, msat_total, htlc_max, balance, update_all),
+        balance,
+        new_ppm(balance),
+        new_htlc_max(msat_to_us, msat_total, rng),
+    )
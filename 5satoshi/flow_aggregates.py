@@ -0,0 +1,286 @@
+#!/usr/bin/python
+
+import argparse
+import logging
+import os
+import sqlite3
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import tracing
+
+DEFAULT_AGGREGATES_PATH = os.path.join(os.environ.get('HOME', '.'), "data", "flow_aggregates.sqlite")
+PAGE_SIZE = 50000
+HOURLY_RETENTION_DAYS = 30
+
+# Forwards in these states do not change any more
+TERMINAL = ("settled", "failed", "local_failed")
+
+logger = logging.getLogger("FlowAggregates")
+
+COUNTERS = ["settled", "failed", "local_failed", "in_msat", "out_msat", "fee_msat"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER
+);
+CREATE TABLE IF NOT EXISTS pair_totals (
+    in_channel TEXT, out_channel TEXT,
+    settled INTEGER, failed INTEGER, local_failed INTEGER,
+    in_msat INTEGER, out_msat INTEGER, fee_msat INTEGER,
+    PRIMARY KEY (in_channel, out_channel)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS pair_daily (
+    bucket TEXT, in_channel TEXT, out_channel TEXT,
+    settled INTEGER, failed INTEGER, local_failed INTEGER,
+    in_msat INTEGER, out_msat INTEGER, fee_msat INTEGER,
+    PRIMARY KEY (bucket, in_channel, out_channel)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS pair_hourly (
+    bucket TEXT, in_channel TEXT, out_channel TEXT,
+    settled INTEGER, failed INTEGER, local_failed INTEGER,
+    in_msat INTEGER, out_msat INTEGER, fee_msat INTEGER,
+    PRIMARY KEY (bucket, in_channel, out_channel)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS channel_totals (
+    channel TEXT, direction TEXT,
+    settled INTEGER, failed INTEGER, local_failed INTEGER,
+    in_msat INTEGER, out_msat INTEGER, fee_msat INTEGER,
+    PRIMARY KEY (channel, direction)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS failures (
+    bucket TEXT, in_channel TEXT, out_channel TEXT, status TEXT, failcode INTEGER,
+    count INTEGER,
+    PRIMARY KEY (bucket, in_channel, out_channel, status, failcode)
+) WITHOUT ROWID;
+"""
+
+# -----------------------------
+# Helpers
+# -----------------------------
+def _msat(value):
+    if isinstance(value, str) and value.endswith("msat"):
+        return int(value[:-4])
+    return int(value or 0)
+
+
+def _buckets(received_time):
+    t = datetime.fromtimestamp(float(received_time), tz=timezone.utc)
+    return t.strftime("%Y-%m-%d"), t.strftime("%Y-%m-%dT%H:00")
+
+
+def _counts(forward):
+    status = forward.get("status")
+    settled = status == "settled"
+    return (
+        int(settled),
+        int(status == "failed"),
+        int(status == "local_failed"),
+        _msat(forward.get("in_msat")) if settled else 0,
+        _msat(forward.get("out_msat")) if settled else 0,
+        _msat(forward.get("fee_msat")) if settled else 0,
+    )
+
+
+def _add(acc, key, counts):
+    row = acc[key]
+    for i, c in enumerate(counts):
+        row[i] += c
+
+
+def _upsert_sql(table, keys):
+    cols = keys + COUNTERS
+    updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in COUNTERS)
+    return (
+        f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+        f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+    )
+
+# -----------------------------
+# Aggregates
+# -----------------------------
+class FlowAggregates:
+    """
+    Per-(in_channel, out_channel) and per-channel counters over all
+    forwards, plus daily/hourly buckets and failure counts by failcode,
+    kept in SQLite. Each batch is pre-aggregated in memory and upserted,
+    so updates cost O(batch), never a rescan of the history.
+    """
+
+    def __init__(self, path=DEFAULT_AGGREGATES_PATH, logger=logger):
+        self.logger = logger
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def watermark(self):
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'max_updated_index'").fetchone()
+        return row[0] if row else 0
+
+    # -----------------------------
+    # Folding
+    # -----------------------------
+    def fold(self, forwards):
+        """
+        Fold a batch of listforwards entries into the aggregates. Entries at
+        or below the watermark and forwards still in flight are skipped;
+        the latter come back with a higher updated_index once resolved.
+        """
+        watermark = self.watermark()
+        batch = [f for f in forwards if f.get("updated_index", 0) > watermark]
+        if not batch:
+            return 0
+
+        pairs = defaultdict(lambda: [0] * len(COUNTERS))
+        daily = defaultdict(lambda: [0] * len(COUNTERS))
+        hourly = defaultdict(lambda: [0] * len(COUNTERS))
+        channels = defaultdict(lambda: [0] * len(COUNTERS))
+        failures = defaultdict(int)
+
+        folded = 0
+        for f in batch:
+            if f.get("status") not in TERMINAL:
+                continue
+            in_channel = f.get("in_channel")
+            out_channel = f.get("out_channel") or ""
+            counts = _counts(f)
+            day, hour = _buckets(f.get("received_time") or 0)
+
+            _add(pairs, (in_channel, out_channel), counts)
+            _add(daily, (day, in_channel, out_channel), counts)
+            _add(hourly, (hour, in_channel, out_channel), counts)
+            _add(channels, (in_channel, "in"), counts)
+            if out_channel:
+                _add(channels, (out_channel, "out"), counts)
+            if f["status"] != "settled":
+                failures[(day, in_channel, out_channel, f["status"], f.get("failcode") or 0)] += 1
+            folded += 1
+
+        new_watermark = max(f.get("updated_index", 0) for f in batch)
+        with self.db:
+            self.db.executemany(_upsert_sql("pair_totals", ["in_channel", "out_channel"]),
+                                [k + tuple(v) for k, v in pairs.items()])
+            self.db.executemany(_upsert_sql("pair_daily", ["bucket", "in_channel", "out_channel"]),
+                                [k + tuple(v) for k, v in daily.items()])
+            self.db.executemany(_upsert_sql("pair_hourly", ["bucket", "in_channel", "out_channel"]),
+                                [k + tuple(v) for k, v in hourly.items()])
+            self.db.executemany(_upsert_sql("channel_totals", ["channel", "direction"]),
+                                [k + tuple(v) for k, v in channels.items()])
+            self.db.executemany(
+                "INSERT INTO failures (bucket, in_channel, out_channel, status, failcode, count) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (bucket, in_channel, out_channel, status, failcode) DO UPDATE SET count = count + excluded.count",
+                [k + (v,) for k, v in failures.items()]
+            )
+            self.db.execute(
+                "INSERT INTO meta (key, value) VALUES ('max_updated_index', ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (new_watermark,)
+            )
+        return folded
+
+    def prune_hourly(self, days=HOURLY_RETENTION_DAYS):
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%dT%H:00")
+        with self.db:
+            self.db.execute("DELETE FROM pair_hourly WHERE bucket < ?", (cutoff,))
+
+    def sync(self, rpc, page_size=PAGE_SIZE):
+        """
+        Fold everything lightningd changed since the watermark.
+        """
+        total = 0
+        while True:
+            start = self.watermark() + 1
+            with tracing.span("rpc.listforwards", start=start) as sp:
+                forwards = rpc.listforwards(index="updated", start=start, limit=page_size)["forwards"]
+                sp.set(rows=len(forwards))
+            if not forwards:
+                break
+            with tracing.span("aggregates.fold", rows=len(forwards)):
+                total += self.fold(forwards)
+            if len(forwards) < page_size:
+                break
+        self.prune_hourly()
+        self.logger.info(f"Folded {total} forwards, watermark at updated_index {self.watermark()}")
+        return total
+
+    # -----------------------------
+    # Queries
+    # -----------------------------
+    def channel(self, channel, days=None):
+        """
+        Counters of one channel as {'in': {...}, 'out': {...}}, over all time
+        or the last `days` days.
+        """
+        cols = ", ".join(f"SUM({c})" for c in COUNTERS)
+        if days is None:
+            rows = self.db.execute(
+                f"SELECT direction, {', '.join(COUNTERS)} FROM channel_totals WHERE channel = ?", (channel,)
+            ).fetchall()
+        else:
+            since = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
+            rows = self.db.execute(
+                f"SELECT 'in', {cols} FROM pair_daily WHERE in_channel = ? AND bucket >= ? "
+                f"UNION ALL SELECT 'out', {cols} FROM pair_daily WHERE out_channel = ? AND bucket >= ?",
+                (channel, since, channel, since)
+            ).fetchall()
+        return {r[0]: dict(zip(COUNTERS, (v or 0 for v in r[1:]))) for r in rows}
+
+    def top_pairs(self, by="fee_msat", limit=20):
+        if by not in COUNTERS:
+            raise ValueError(f"Unknown counter {by}")
+        return self.db.execute(
+            f"SELECT in_channel, out_channel, {', '.join(COUNTERS)} FROM pair_totals ORDER BY {by} DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+
+    def failures_by_code(self, channel=None, days=7):
+        since = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
+        sql = "SELECT status, failcode, SUM(count) FROM failures WHERE bucket >= ?"
+        params = [since]
+        if channel is not None:
+            sql += " AND (in_channel = ? OR out_channel = ?)"
+            params += [channel, channel]
+        return self.db.execute(sql + " GROUP BY status, failcode ORDER BY 3 DESC", params).fetchall()
+
+    def series(self, channel, direction="out", hourly=False, days=7):
+        table = "pair_hourly" if hourly else "pair_daily"
+        column = "out_channel" if direction == "out" else "in_channel"
+        since = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
+        return self.db.execute(
+            f"SELECT bucket, {', '.join(f'SUM({c})' for c in COUNTERS)} FROM {table} "
+            f"WHERE {column} = ? AND bucket >= ? GROUP BY bucket ORDER BY bucket",
+            (channel, since)
+        ).fetchall()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-channel forwarding flow and revenue aggregates")
+    parser.add_argument("command", choices=["sync", "channel", "top", "failures"])
+    parser.add_argument("--path", default=DEFAULT_AGGREGATES_PATH, help="SQLite file of the aggregates")
+    parser.add_argument("--rpc", default=os.environ.get('HOME', '') + "/.lightning/bitcoin/lightning-rpc", help="lightning-rpc socket")
+    parser.add_argument("--channel", help="Short channel id")
+    parser.add_argument("--days", type=int, default=None, help="Restrict to the last N days")
+    parser.add_argument("--limit", type=int, default=20)
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    tracing.configure_from_args("flow_aggregates", args)
+    agg = FlowAggregates(args.path)
+
+    if args.command == "sync":
+        from pyln.client import LightningRpc
+        agg.sync(LightningRpc(args.rpc))
+    elif args.command == "channel":
+        for direction, counters in agg.channel(args.channel, args.days).items():
+            print(direction, counters)
+    elif args.command == "top":
+        for row in agg.top_pairs(limit=args.limit):
+            print(row)
+    else:
+        for row in agg.failures_by_code(args.channel, args.days or 7):
+            print(row)
@@ -0,0 +1,299 @@
+#!/usr/bin/python
+
+import argparse
+import logging
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+import tracing
+
+WEIGHTS = ("volume", "fee", "count")
+FLUSH_EVERY = 1_000_000
+PAGE_SIZE = 50000
+
+logger = logging.getLogger("FlowMatrix")
+
+# -----------------------------
+# Channel ids
+# -----------------------------
+class ChannelInterner:
+    """
+    Maps short_channel_id strings to dense integer ids (and back).
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.scids = []
+
+    def __len__(self):
+        return len(self.scids)
+
+    def __call__(self, scid):
+        idx = self.ids.get(scid)
+        if idx is None:
+            idx = len(self.scids)
+            self.ids[scid] = idx
+            self.scids.append(scid)
+        return idx
+
+    def get(self, scid):
+        return self.ids.get(scid)
+
+# -----------------------------
+# Matrix
+# -----------------------------
+def _msat(value):
+    if isinstance(value, str) and value.endswith("msat"):
+        return int(value[:-4])
+    return int(value or 0)
+
+
+def _utc(value):
+    t = pd.Timestamp(value)
+    return t.tz_localize("UTC") if t.tz is None else t
+
+
+class FlowMatrix:
+    """
+    Sparse in_channel x out_channel matrices of settled forwards, weighted
+    by out volume (msat), fee (msat) and count, kept per time bucket.
+
+    Forwards are streamed into COO buffers that are folded into the CSR
+    bucket matrices every FLUSH_EVERY entries, so memory grows with the
+    number of distinct channel pairs, not with the number of forwards.
+    """
+
+    def __init__(self, bucket="D", logger=logger):
+        self.bucket = bucket
+        self.logger = logger
+        self.channels = ChannelInterner()
+        self.buckets = {}
+        self._reset_buffer()
+
+    def _reset_buffer(self):
+        self._buf = {'bucket': [], 'row': [], 'col': [], 'volume': [], 'fee': []}
+
+    # -----------------------------
+    # Streaming construction
+    # -----------------------------
+    def add(self, forwards):
+        """
+        Add an iterable of listforwards entries (dicts).
+        """
+        buf = self._buf
+        added = 0
+        for f in forwards:
+            if f.get("status") != "settled" or not f.get("out_channel"):
+                continue
+            t = datetime.fromtimestamp(float(f["received_time"]), tz=timezone.utc)
+            buf['bucket'].append(t)
+            buf['row'].append(self.channels(f["in_channel"]))
+            buf['col'].append(self.channels(f["out_channel"]))
+            buf['volume'].append(_msat(f.get("out_msat")))
+            buf['fee'].append(_msat(f.get("fee_msat")))
+            added += 1
+            if len(buf['row']) >= FLUSH_EVERY:
+                self.flush()
+                buf = self._buf
+        return added
+
+    def add_frame(self, df):
+        """
+        Add a DataFrame batch (e.g. a warehouse partition) without going
+        through Python dicts.
+        """
+        df = df[(df["status"] == "settled") & df["out_channel"].notna()]
+        if df.empty:
+            return 0
+        rows = np.fromiter((self.channels(c) for c in df["in_channel"]), dtype=np.int64, count=len(df))
+        cols = np.fromiter((self.channels(c) for c in df["out_channel"]), dtype=np.int64, count=len(df))
+        received = pd.to_datetime(df["received_time"], utc=True)
+        self._fold(received, rows, cols, df["out_msat"].fillna(0).to_numpy(dtype=float), df["fee_msat"].fillna(0).to_numpy(dtype=float))
+        return len(df)
+
+    def flush(self):
+        buf = self._buf
+        if not buf['row']:
+            return
+        self._fold(
+            pd.to_datetime(pd.Series(buf['bucket']), utc=True),
+            np.asarray(buf['row'], dtype=np.int64),
+            np.asarray(buf['col'], dtype=np.int64),
+            np.asarray(buf['volume'], dtype=float),
+            np.asarray(buf['fee'], dtype=float),
+        )
+        self._reset_buffer()
+
+    def _fold(self, received, rows, cols, volume, fee):
+        keys = received.dt.floor(self.bucket).to_numpy()
+        n = len(self.channels)
+        for key in np.unique(keys):
+            mask = keys == key
+            r, c = rows[mask], cols[mask]
+            batch = {
+                'volume': sp.csr_matrix((volume[mask], (r, c)), shape=(n, n)),
+                'fee': sp.csr_matrix((fee[mask], (r, c)), shape=(n, n)),
+                'count': sp.csr_matrix((np.ones(mask.sum()), (r, c)), shape=(n, n)),
+            }
+            key = pd.Timestamp(key, tz="UTC")
+            current = self.buckets.get(key)
+            if current is None:
+                self.buckets[key] = batch
+            else:
+                self.buckets[key] = {w: self._resize(current[w], n) + batch[w] for w in WEIGHTS}
+
+    @staticmethod
+    def _resize(m, n):
+        if m.shape == (n, n):
+            return m
+        m = m.tocoo()
+        return sp.csr_matrix((m.data, (m.row, m.col)), shape=(n, n))
+
+    # -----------------------------
+    # Windows
+    # -----------------------------
+    def expire(self, before):
+        """
+        Drop buckets older than `before` (sliding window).
+        """
+        before = _utc(before)
+        for key in [k for k in self.buckets if k < before]:
+            del self.buckets[key]
+
+    def matrix(self, weight="volume", start=None, end=None):
+        """
+        Sum of the bucket matrices in [start, end).
+        """
+        self.flush()
+        n = len(self.channels)
+        start = _utc(start) if start is not None else None
+        end = _utc(end) if end is not None else None
+        total = sp.csr_matrix((n, n))
+        for key, mats in self.buckets.items():
+            if start is not None and key < start:
+                continue
+            if end is not None and key >= end:
+                continue
+            total = total + self._resize(mats[weight], n)
+        return total.tocsr()
+
+    # -----------------------------
+    # Queries
+    # -----------------------------
+    def top_partners(self, in_channel, k=10, weight="volume", start=None, end=None, outgoing=True):
+        """
+        Top-k outgoing channels for an inbound channel (or, with
+        outgoing=False, top-k inbound channels for an outbound one).
+        """
+        idx = self.channels.get(in_channel)
+        if idx is None:
+            return []
+        m = self.matrix(weight, start, end)
+        line = m.getrow(idx) if outgoing else m.getcol(idx).T.tocsr()
+        if line.nnz == 0:
+            return []
+        top = np.argsort(line.data)[::-1][:k]
+        return [(self.channels.scids[line.indices[i]], float(line.data[i])) for i in top]
+
+    def imbalance_report(self, capacities=None, start=None, end=None, min_volume=0):
+        """
+        Per channel pair: volume and fee both ways and the imbalance
+        (a->b - b->a) / (a->b + b->a). With capacities (scid -> msat) each
+        side also gets its net outflow relative to capacity (saturation).
+        """
+        vol = self.matrix("volume", start, end)
+        fee = self.matrix("fee", start, end)
+        rev = vol.T.tocsr()
+
+        coo = vol.tocoo()
+        keep = coo.data > min_volume
+        rows, cols, forward = coo.row[keep], coo.col[keep], coo.data[keep]
+        backward = np.asarray(rev[rows, cols]).ravel()
+        fees = np.asarray(fee[rows, cols]).ravel()
+
+        net_out = np.asarray(vol.sum(axis=0)).ravel() - np.asarray(vol.sum(axis=1)).ravel()
+        scids = np.asarray(self.channels.scids, dtype=object)
+        report = pd.DataFrame({
+            'in_channel': scids[rows],
+            'out_channel': scids[cols],
+            'volume_msat': forward,
+            'reverse_volume_msat': backward,
+            'fee_msat': fees,
+            'imbalance': (forward - backward) / (forward + backward),
+            'in_net_out_msat': net_out[rows],
+            'out_net_out_msat': net_out[cols],
+        })
+        if capacities is not None:
+            cap = np.array([capacities.get(s, np.nan) for s in scids], dtype=float)
+            report['in_saturation'] = net_out[rows] / cap[rows]
+            report['out_saturation'] = net_out[cols] / cap[cols]
+        return report.sort_values('volume_msat', ascending=False, ignore_index=True)
+
+# -----------------------------
+# Sources
+# -----------------------------
+def iter_listforwards(rpc, start=1, page_size=PAGE_SIZE):
+    """
+    Yield pages of forwards from lightningd by updated_index.
+    """
+    while True:
+        page = rpc.listforwards(index="updated", start=start, limit=page_size)["forwards"]
+        if not page:
+            return
+        yield page
+        start = max(f["updated_index"] for f in page) + 1
+        if len(page) < page_size:
+            return
+
+
+def iter_warehouse(warehouse, start=None, end=None):
+    """
+    Yield settled forwards one day partition at a time from a ForwardsWarehouse.
+    """
+    columns = ["in_channel", "out_channel", "out_msat", "fee_msat", "status", "received_time"]
+    for day in pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq="D", inclusive="left"):
+        df = warehouse.query(day, day + pd.Timedelta(days=1), status="settled", columns=columns)
+        if not df.empty:
+            yield df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sparse in/out channel flow matrix")
+    parser.add_argument("--rpc", default=os.environ.get('HOME', '') + "/.lightning/bitcoin/lightning-rpc", help="lightning-rpc socket")
+    parser.add_argument("--warehouse", help="Read from this forwards warehouse instead of lightningd")
+    parser.add_argument("--start", default=str((pd.Timestamp.now() - pd.Timedelta(days=30)).date()))
+    parser.add_argument("--end", default=str((pd.Timestamp.now() + pd.Timedelta(days=1)).date()))
+    parser.add_argument("--channel", help="Print top outgoing partners of this inbound channel")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", help="Write the imbalance report to this CSV")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    tracing.configure_from_args("flow_matrix", args)
+
+    fm = FlowMatrix()
+    with tracing.span("flow_matrix.build") as span:
+        if args.warehouse:
+            from forwards_warehouse import ForwardsWarehouse
+            for df in iter_warehouse(ForwardsWarehouse(args.warehouse), args.start, args.end):
+                fm.add_frame(df)
+        else:
+            from pyln.client import LightningRpc
+            for page in iter_listforwards(LightningRpc(args.rpc)):
+                fm.add(page)
+        fm.flush()
+        span.set(channels=len(fm.channels), buckets=len(fm.buckets))
+
+    if args.channel:
+        for scid, value in fm.top_partners(args.channel, args.top, start=args.start, end=args.end):
+            print(f"{scid}\t{value / 1000:.0f} sat")
+
+    report = fm.imbalance_report(start=args.start, end=args.end)
+    print(report.head(args.top).to_string())
+    if args.output:
+        report.to_csv(args.output, index=False)
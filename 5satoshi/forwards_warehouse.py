@@ -0,0 +1,283 @@
+#!/usr/bin/python
+
+import argparse
+import json
+import logging
+import os
+import shutil
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import tracing
+
+DEFAULT_WAREHOUSE_DIR = os.path.join(os.environ.get('HOME', '.'), "data", "forwards")
+ROW_GROUP_SIZE = 16384
+PAGE_SIZE = 50000
+
+# Same columns as the forwardings table written by store-forwards.py
+SCHEMA = pa.schema([
+    ("created_index", pa.int64()),
+    ("in_channel", pa.string()),
+    ("out_channel", pa.string()),
+    ("in_msat", pa.int64()),
+    ("out_msat", pa.int64()),
+    ("fee_msat", pa.int64()),
+    ("status", pa.string()),
+    ("received_time", pa.timestamp("us", tz="UTC")),
+    ("resolved_time", pa.timestamp("us", tz="UTC")),
+    ("in_htlc_id", pa.int64()),
+    ("failcode", pa.int64()),
+    ("failreason", pa.string()),
+    ("out_htlc_id", pa.int64()),
+    ("style", pa.string()),
+    ("updated_index", pa.int64()),
+])
+PARTITIONING = ds.partitioning(pa.schema([("day", pa.string())]), flavor="hive")
+
+logger = logging.getLogger("ForwardsWarehouse")
+
+# -----------------------------
+# Conversion
+# -----------------------------
+def _msat(value):
+    if isinstance(value, str) and value.endswith("msat"):
+        return int(value[:-4])
+    return None if value is None else int(value)
+
+
+def _micros(seconds):
+    return None if seconds is None else int(round(float(seconds) * 1e6))
+
+
+def _day(seconds):
+    return datetime.fromtimestamp(float(seconds), tz=timezone.utc).date().isoformat()
+
+
+def records_to_table(records):
+    """
+    listforwards entries -> Arrow table with the warehouse schema.
+    """
+    columns = []
+    for field in SCHEMA:
+        values = [r.get(field.name) for r in records]
+        if pa.types.is_timestamp(field.type):
+            columns.append(pa.array([_micros(v) for v in values], pa.int64()).cast(field.type))
+        elif field.name.endswith("_msat"):
+            columns.append(pa.array([_msat(v) for v in values], field.type))
+        else:
+            columns.append(pa.array(values, field.type))
+    return pa.Table.from_arrays(columns, schema=SCHEMA)
+
+
+def latest_versions(df):
+    """
+    Keep the newest version (highest updated_index) of every forward.
+    """
+    if df.empty:
+        return df
+    return df.sort_values("updated_index").drop_duplicates("created_index", keep="last").sort_values("received_time", ignore_index=True)
+
+# -----------------------------
+# Warehouse
+# -----------------------------
+class ForwardsWarehouse:
+    """
+    Forwards stored as day partitions root/day=YYYY-MM-DD/*.parquet keyed on
+    received_time. New batches are appended as extra files; a forward that
+    changed since (e.g. offered -> settled) appears again with a higher
+    updated_index and queries keep only the newest version.
+    """
+
+    def __init__(self, root=DEFAULT_WAREHOUSE_DIR, logger=logger):
+        self.root = root
+        self.logger = logger
+        os.makedirs(root, exist_ok=True)
+        self.meta_path = os.path.join(root, "_meta.json")
+
+    # -----------------------------
+    # Watermark
+    # -----------------------------
+    def _meta(self):
+        try:
+            with open(self.meta_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'max_updated_index': 0}
+
+    def watermark(self):
+        return self._meta()['max_updated_index']
+
+    def _set_watermark(self, value):
+        meta = self._meta()
+        meta['max_updated_index'] = int(value)
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.meta_path)
+
+    # -----------------------------
+    # Writing
+    # -----------------------------
+    def append(self, records):
+        """
+        Write one batch of listforwards entries, one file per touched day.
+        """
+        records = [r for r in records if r.get("received_time") is not None]
+        if not records:
+            return 0
+
+        by_day = defaultdict(list)
+        for r in records:
+            by_day[_day(r["received_time"])].append(r)
+
+        lo = min(r.get("updated_index", 0) for r in records)
+        hi = max(r.get("updated_index", 0) for r in records)
+        for day, rows in by_day.items():
+            part = os.path.join(self.root, f"day={day}")
+            os.makedirs(part, exist_ok=True)
+            table = records_to_table(rows).sort_by("out_channel")
+            path = os.path.join(part, f"part-{lo:012d}-{hi:012d}.parquet")
+            pq.write_table(table, path + ".tmp", row_group_size=ROW_GROUP_SIZE, compression="zstd")
+            os.replace(path + ".tmp", path)
+
+        self._set_watermark(max(hi, self.watermark()))
+        return len(records)
+
+    def sync(self, rpc, page_size=PAGE_SIZE):
+        """
+        Pull forwards changed since the watermark from lightningd, page by page.
+        """
+        total = 0
+        while True:
+            start = self.watermark() + 1
+            with tracing.span("rpc.listforwards", start=start) as sp:
+                forwards = rpc.listforwards(index="updated", start=start, limit=page_size)["forwards"]
+                sp.set(rows=len(forwards))
+            if not forwards:
+                break
+            with tracing.span("warehouse.append", rows=len(forwards)):
+                total += self.append(forwards)
+            if len(forwards) < page_size:
+                break
+        self.logger.info(f"Synced {total} forwards, watermark at updated_index {self.watermark()}")
+        return total
+
+    def compact(self, day=None):
+        """
+        Rewrite partitions (all, or one day) as a single deduplicated file
+        sorted by out_channel, so row group statistics prune channel queries.
+        """
+        days = [day] if day else [d[len("day="):] for d in os.listdir(self.root) if d.startswith("day=")]
+        for d in sorted(days):
+            part = os.path.join(self.root, f"day={d}")
+            files = [f for f in os.listdir(part) if f.endswith(".parquet")]
+            if len(files) <= 1:
+                continue
+            table = ds.dataset(part, format="parquet", schema=SCHEMA).to_table()
+            df = latest_versions(table.to_pandas())
+            table = pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False).sort_by("out_channel")
+
+            # Dot-prefixed directories are ignored by dataset discovery
+            tmp_dir = os.path.join(self.root, f".compact-{d}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            hi = int(df["updated_index"].max())
+            pq.write_table(table, os.path.join(tmp_dir, f"part-{0:012d}-{hi:012d}.parquet"),
+                           row_group_size=ROW_GROUP_SIZE, compression="zstd")
+            old_dir = os.path.join(self.root, f".old-{d}")
+            os.rename(part, old_dir)
+            os.rename(tmp_dir, part)
+            shutil.rmtree(old_dir)
+            self.logger.info(f"Compacted day={d}: {len(files)} files -> 1 ({len(df)} forwards)")
+
+    # -----------------------------
+    # Reading
+    # -----------------------------
+    def dataset(self):
+        return ds.dataset(self.root, format="parquet", schema=SCHEMA.append(pa.field("day", pa.string())),
+                          partitioning=PARTITIONING, exclude_invalid_files=True)
+
+    def query(self, start=None, end=None, channel=None, in_channel=None, out_channel=None, status=None, columns=None):
+        """
+        Forwards received in [start, end), optionally restricted to a channel
+        (either side), in/out channel or status. Only partitions inside the
+        time range are opened and row groups are skipped by their statistics.
+        Channels are the same in every version of a forward, so they filter
+        the scan; status changes between versions and is only applied after
+        the newest version is picked (else the settled version would be
+        dropped and the stale offered one returned).
+        """
+        expr = None
+
+        def conj(e):
+            return e if expr is None else expr & e
+
+        if start is not None:
+            start = pd.Timestamp(start, tz="UTC") if pd.Timestamp(start).tz is None else pd.Timestamp(start)
+            expr = conj(ds.field("day") >= start.date().isoformat())
+            expr = conj(ds.field("received_time") >= pa.scalar(start.to_pydatetime(), pa.timestamp("us", tz="UTC")))
+        if end is not None:
+            end = pd.Timestamp(end, tz="UTC") if pd.Timestamp(end).tz is None else pd.Timestamp(end)
+            expr = conj(ds.field("day") <= end.date().isoformat())
+            expr = conj(ds.field("received_time") < pa.scalar(end.to_pydatetime(), pa.timestamp("us", tz="UTC")))
+        if channel is not None:
+            expr = conj((ds.field("in_channel") == channel) | (ds.field("out_channel") == channel))
+        if in_channel is not None:
+            expr = conj(ds.field("in_channel") == in_channel)
+        if out_channel is not None:
+            expr = conj(ds.field("out_channel") == out_channel)
+
+        read_columns = None
+        if columns is not None:
+            extra = ["status"] if status is not None else []
+            read_columns = list(dict.fromkeys(list(columns) + ["created_index", "updated_index", "received_time"] + extra))
+
+        with tracing.span("warehouse.query") as sp:
+            table = self.dataset().to_table(columns=read_columns, filter=expr)
+            df = latest_versions(table.to_pandas())
+            if status is not None:
+                df = df[df["status"] == status].reset_index(drop=True)
+            if "day" in df.columns:
+                df = df.drop(columns="day")
+            if columns is not None:
+                df = df[list(columns)]
+            sp.set(rows=len(df))
+        return df
+
+def yesterday_range():
+    today = pd.Timestamp.now(tz="UTC").normalize()
+    return today - timedelta(days=1), today
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local day-partitioned forwards warehouse")
+    parser.add_argument("command", choices=["sync", "query", "compact"])
+    parser.add_argument("--root", default=DEFAULT_WAREHOUSE_DIR, help="Warehouse directory")
+    parser.add_argument("--rpc", default=os.environ.get('HOME', '') + "/.lightning/bitcoin/lightning-rpc", help="lightning-rpc socket")
+    parser.add_argument("--start", help="Query start (inclusive)")
+    parser.add_argument("--end", help="Query end (exclusive)")
+    parser.add_argument("--channel", help="Channel on either side")
+    parser.add_argument("--status", help="Forward status, e.g. settled")
+    parser.add_argument("--day", help="Only compact this day (YYYY-MM-DD)")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    tracing.configure_from_args("forwards_warehouse", args)
+    wh = ForwardsWarehouse(args.root)
+
+    if args.command == "sync":
+        from pyln.client import LightningRpc
+        wh.sync(LightningRpc(args.rpc))
+    elif args.command == "compact":
+        wh.compact(args.day)
+    else:
+        df = wh.query(args.start, args.end, channel=args.channel, status=args.status)
+        print(df.to_string())
+        if "fee_msat" in df:
+            print(f"\n{len(df)} forwards, {df['fee_msat'].sum() / 1000:.3f} sat fees")
@@ -0,0 +1,294 @@
+#!/usr/bin/python
+
+import argparse
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import tracing
+
+DEFAULT_HISTORY_DIR = os.path.join(os.environ.get('HOME', '.'), "data", "gossip")
+TIME_FORMAT = "%Y%m%dT%H%M%S"
+COMPACT_EVERY = 168  # deltas between two base snapshots (a week of hourly pulls)
+
+# Rows are identified by these keys; a channel has one row per direction
+KEYS = {
+    'channels': ["short_channel_id", "direction"],
+    'nodes': ["nodeid"],
+}
+
+logger = logging.getLogger("GossipHistory")
+
+# -----------------------------
+# Helpers
+# -----------------------------
+def _utc(value):
+    t = pd.Timestamp(value)
+    return t.tz_localize("UTC") if t.tz is None else t.tz_convert("UTC")
+
+
+def _stamp(at):
+    return _utc(at).strftime(TIME_FORMAT)
+
+
+def _parse(name):
+    return pd.Timestamp(datetime.strptime(name.split("-", 1)[1].split(".")[0], TIME_FORMAT), tz="UTC")
+
+
+def _nested_to_json(value):
+    if isinstance(value, (list, dict, tuple)):
+        return json.dumps(value, sort_keys=True, default=str)
+    return value
+
+
+def normalize(df, kind):
+    """
+    Stable column order and Parquet friendly values: nested values (node
+    addresses, features objects) become JSON strings.
+    """
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].map(_nested_to_json)
+    keys = KEYS[kind]
+    rest = sorted(c for c in df.columns if c not in keys)
+    return df[keys + rest].sort_values(keys, ignore_index=True)
+
+
+def row_hashes(df, keys):
+    """
+    One uint64 per row over the non-key columns, to detect changed rows.
+    """
+    values = df[[c for c in df.columns if c not in keys and c != "_removed"]]
+    return pd.util.hash_pandas_object(values.astype(str), index=False).to_numpy()
+
+
+def diff(old, new, keys):
+    """
+    Rows of `new` that are new or changed with respect to `old`, plus
+    tombstones (_removed=True, key columns only) for rows that disappeared.
+    """
+    if old is None or old.empty:
+        changed = new.copy()
+        changed["_removed"] = False
+        return changed
+
+    old_idx = pd.MultiIndex.from_frame(old[keys])
+    new_idx = pd.MultiIndex.from_frame(new[keys])
+    # Nullable so the reindex below does not round the hashes through float
+    old_hash = pd.Series(row_hashes(old, keys), index=old_idx, dtype="UInt64")
+    new_hash = pd.Series(row_hashes(new, keys), index=new_idx, dtype="UInt64")
+
+    same = (old_hash.reindex(new_idx) == new_hash).fillna(False).to_numpy(dtype=bool)
+    changed = new[~same].copy()
+    changed["_removed"] = False
+
+    gone = ~old_idx.isin(new_idx)
+    removed = old.loc[gone, keys].copy()
+    removed["_removed"] = True
+    return pd.concat([changed, removed], ignore_index=True)
+
+# -----------------------------
+# Store
+# -----------------------------
+class GossipHistory:
+    """
+    Channel and node gossip over time as root/<kind>/base-<ts>.parquet full
+    snapshots followed by delta-<ts>.parquet files holding only the rows
+    that changed (or were removed) since the previous pull. The state at any
+    time is the newest base before it plus the deltas up to it, keeping the
+    last version of every key.
+    """
+
+    def __init__(self, root=DEFAULT_HISTORY_DIR, compact_every=COMPACT_EVERY, logger=logger):
+        self.root = root
+        self.compact_every = compact_every
+        self.logger = logger
+        for kind in KEYS:
+            os.makedirs(os.path.join(root, kind), exist_ok=True)
+
+    def _files(self, kind, prefix=None):
+        files = [f for f in os.listdir(os.path.join(self.root, kind)) if f.endswith(".parquet")]
+        if prefix is not None:
+            files = [f for f in files if f.startswith(prefix + "-")]
+        return sorted(files, key=_parse)
+
+    def _path(self, kind, name):
+        return os.path.join(self.root, kind, name)
+
+    def _write(self, kind, name, df):
+        path = self._path(kind, name)
+        df.to_parquet(path + ".tmp", index=False, compression="zstd")
+        os.replace(path + ".tmp", path)
+
+    def snapshots(self, kind="channels"):
+        """
+        Times of all recorded pulls.
+        """
+        return [_parse(f) for f in self._files(kind)]
+
+    # -----------------------------
+    # Reconstruction
+    # -----------------------------
+    def state_at(self, kind, at=None):
+        """
+        Rows of `kind` as of time `at` (default: latest), or None if nothing
+        was recorded before it.
+        """
+        at = _utc(at) if at is not None else None
+        files = [f for f in self._files(kind) if at is None or _parse(f) <= at]
+        bases = [i for i, f in enumerate(files) if f.startswith("base-")]
+        if not bases:
+            return None
+        files = files[bases[-1]:]
+
+        keys = KEYS[kind]
+        with tracing.span("gossip.reconstruct", kind=kind, files=len(files)) as sp:
+            frames = [pd.read_parquet(self._path(kind, f)) for f in files]
+            df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+            # Later files come later in the concat, so keep="last" is the newest version
+            df = df.drop_duplicates(keys, keep="last")
+            if "_removed" in df:
+                df = df[~df["_removed"].fillna(False).astype(bool)].drop(columns="_removed")
+            # Tombstones upcast int columns to float in the concat
+            for col, dtype in frames[0].dtypes.items():
+                if col in df and df[col].dtype != dtype:
+                    try:
+                        df[col] = df[col].astype(dtype)
+                    except (TypeError, ValueError):
+                        pass
+            df = df.sort_values(keys, ignore_index=True)
+            sp.set(rows=len(df))
+        return df
+
+    # -----------------------------
+    # Recording
+    # -----------------------------
+    def record(self, kind, df, at=None):
+        """
+        Store one pull. Writes a base snapshot for the first pull and every
+        compact_every deltas, a delta otherwise. Returns the rows written.
+        """
+        at = _utc(at) if at is not None else pd.Timestamp.now(tz="UTC")
+        new = normalize(df, kind)
+        files = self._files(kind)
+        since_base = len(files) - max((i for i, f in enumerate(files) if f.startswith("base-")), default=len(files))
+
+        if not files or since_base >= self.compact_every:
+            self._write(kind, f"base-{_stamp(at)}.parquet", new)
+            self.logger.info(f"{kind}: base snapshot with {len(new)} rows at {at}")
+            return len(new)
+
+        with tracing.span("gossip.diff", kind=kind) as sp:
+            delta = diff(self.state_at(kind, at), new, KEYS[kind])
+            sp.set(rows=len(delta))
+        self._write(kind, f"delta-{_stamp(at)}.parquet", delta)
+        self.logger.info(f"{kind}: {len(delta)} changed rows of {len(new)} at {at}")
+        return len(delta)
+
+    def record_rpc(self, rpc, at=None):
+        """
+        Pull listchannels/listnodes and record both.
+        """
+        at = at or pd.Timestamp.now(tz="UTC")
+        with tracing.span("rpc.listchannels") as sp:
+            channels = pd.DataFrame(rpc.listchannels()["channels"])
+            sp.set(rows=len(channels))
+        with tracing.span("rpc.listnodes") as sp:
+            nodes = pd.DataFrame(rpc.listnodes()["nodes"])
+            sp.set(rows=len(nodes))
+        self.record("channels", channels, at)
+        self.record("nodes", nodes, at)
+        return channels, nodes
+
+    def compact(self, kind, at=None):
+        """
+        Write the state at `at` (default: latest pull) as a new base snapshot.
+        """
+        files = self._files(kind)
+        if not files:
+            return
+        at = _utc(at) if at is not None else _parse(files[-1])
+        state = self.state_at(kind, at)
+        name = f"base-{_stamp(at)}.parquet"
+        # A delta with the same time is superseded by the base
+        delta = self._path(kind, f"delta-{_stamp(at)}.parquet")
+        self._write(kind, name, state)
+        if os.path.exists(delta):
+            os.remove(delta)
+        self.logger.info(f"{kind}: compacted {len(state)} rows into {name}")
+
+    def prune(self, kind, before):
+        """
+        Drop everything that is only needed for states before `before`.
+        """
+        before = _utc(before)
+        files = self._files(kind)
+        bases = [i for i, f in enumerate(files) if f.startswith("base-") and _parse(f) <= before]
+        if not bases:
+            return 0
+        for f in files[:bases[-1]]:
+            os.remove(self._path(kind, f))
+        return bases[-1]
+
+    def size(self):
+        total = 0
+        for kind in KEYS:
+            total += sum(os.path.getsize(self._path(kind, f)) for f in self._files(kind))
+        return total
+
+
+def graph_frame(channels):
+    """
+    Undo the normalization for graph building (types as listchannels returns them).
+    """
+    df = channels.copy()
+    for col in ("active", "public"):
+        if col in df:
+            df[col] = df[col].astype(bool)
+    if "direction" in df:
+        df["direction"] = df["direction"].astype(np.int64)
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delta-encoded gossip history")
+    parser.add_argument("command", choices=["record", "show", "compact", "prune", "info"])
+    parser.add_argument("--root", default=DEFAULT_HISTORY_DIR, help="History directory")
+    parser.add_argument("--rpc", default=os.environ.get('HOME', '') + "/.lightning/bitcoin/lightning-rpc", help="lightning-rpc socket")
+    parser.add_argument("--at", help="Point in time (default: latest)")
+    parser.add_argument("--kind", choices=list(KEYS), default="channels")
+    parser.add_argument("--output", help="Write the reconstructed state to this Parquet file")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    tracing.configure_from_args("gossip_history", args)
+    history = GossipHistory(args.root)
+
+    if args.command == "record":
+        from pyln.client import LightningRpc
+        history.record_rpc(LightningRpc(args.rpc))
+    elif args.command == "show":
+        df = history.state_at(args.kind, args.at)
+        if df is None:
+            print("No snapshot before that time")
+        else:
+            print(df.to_string(max_rows=50))
+            if args.output:
+                df.to_parquet(args.output, index=False)
+    elif args.command == "compact":
+        for kind in KEYS:
+            history.compact(kind, args.at)
+    elif args.command == "prune":
+        for kind in KEYS:
+            history.prune(kind, args.at or datetime.now(timezone.utc))
+    else:
+        for kind in KEYS:
+            snaps = history.snapshots(kind)
+            if snaps:
+                print(f"{kind}: {len(snaps)} pulls from {snaps[0]} to {snaps[-1]}")
+        print(f"{history.size() / 1e6:.1f} MB")
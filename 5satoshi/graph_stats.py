@@ -0,0 +1,254 @@
+#!/usr/bin/python
+
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse import csgraph
+
+import tracing
+
+PERCENTILES = [0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+logger = logging.getLogger("GraphStats")
+
+# -----------------------------
+# Columns
+# -----------------------------
+def _msat(col):
+    if col.dtype == object:
+        col = col.astype(str).str.replace("msat", "", regex=False)
+    return pd.to_numeric(col, errors="coerce").to_numpy(dtype=float)
+
+
+def _percentiles(values):
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return pd.Series(np.nan, index=PERCENTILES)
+    return pd.Series(np.quantile(values, PERCENTILES), index=PERCENTILES)
+
+
+class Snapshot:
+    """
+    listchannels/listnodes frames reduced to integer arrays: node codes for
+    both ends of every directed channel entry and one row per channel.
+    """
+
+    def __init__(self, channels, nodes=None):
+        self.channels = channels
+        self.nodes = nodes
+        ends = pd.concat([channels['source'], channels['destination']], ignore_index=True)
+        if nodes is not None:
+            ends = pd.concat([nodes['nodeid'], ends], ignore_index=True)
+        codes, self.nodeids = pd.factorize(ends)
+        m = len(channels)
+        self.src = codes[-2 * m:-m] if m else codes[:0]
+        self.dst = codes[-m:] if m else codes[:0]
+        self.n = len(self.nodeids)
+        self.active = channels['active'].to_numpy(dtype=bool) if 'active' in channels else np.ones(m, dtype=bool)
+        self.amount = _msat(channels['amount_msat']) if 'amount_msat' in channels else np.full(m, np.nan)
+
+        # One row per channel (listchannels has one entry per direction)
+        scid = channels['short_channel_id'].to_numpy()
+        _, first = np.unique(scid, return_index=True)
+        self.channel_rows = np.sort(first)
+
+        # Undirected simple graph: distinct node pairs
+        lo = np.minimum(self.src, self.dst)
+        hi = np.maximum(self.src, self.dst)
+        pair = np.unique(lo.astype(np.int64) * self.n + hi)
+        self.pair_lo = pair // self.n
+        self.pair_hi = pair % self.n
+
+# -----------------------------
+# Statistics
+# -----------------------------
+def degrees(snap):
+    """
+    Distinct neighbours per node, as in an undirected simple graph.
+    """
+    return np.bincount(np.concatenate([snap.pair_lo, snap.pair_hi]), minlength=snap.n)
+
+
+def odd_degree_nodes(snap):
+    return snap.nodeids[degrees(snap) % 2 == 1]
+
+
+def component_sizes(snap, strong=False):
+    """
+    Sizes of the weakly connected components (or strongly connected ones
+    over active directed channels), largest first.
+    """
+    if strong:
+        mask = snap.active
+        adj = sp.csr_matrix((np.ones(mask.sum()), (snap.src[mask], snap.dst[mask])), shape=(snap.n, snap.n))
+    else:
+        adj = sp.csr_matrix((np.ones(len(snap.pair_lo)), (snap.pair_lo, snap.pair_hi)), shape=(snap.n, snap.n))
+    _, labels = csgraph.connected_components(adj, directed=strong, connection='strong' if strong else 'weak')
+    return np.sort(np.bincount(labels))[::-1]
+
+
+def node_aggregates(snap):
+    """
+    Per node: channels, distinct peers, capacity and its outgoing fee policy.
+    """
+    rows = snap.channel_rows
+    ends = np.concatenate([snap.src[rows], snap.dst[rows]])
+    capacity = np.nan_to_num(np.concatenate([snap.amount[rows], snap.amount[rows]]))
+    out = pd.DataFrame({
+        'channels': np.bincount(ends, minlength=snap.n),
+        'peers': degrees(snap),
+        'capacity_sat': np.bincount(ends, weights=capacity, minlength=snap.n) / 1000,
+        'active_out': np.bincount(snap.src, weights=snap.active, minlength=snap.n).astype(int),
+    }, index=pd.Index(snap.nodeids, name='nodeid'))
+
+    policy = pd.DataFrame({
+        'node': snap.src[snap.active],
+        'ppm': snap.channels['fee_per_millionth'].to_numpy(dtype=float)[snap.active],
+        'base': snap.channels['base_fee_millisatoshi'].to_numpy(dtype=float)[snap.active],
+    }).groupby('node').agg(median_ppm=('ppm', 'median'), mean_base_msat=('base', 'mean'))
+    out = out.join(policy.set_axis(snap.nodeids[policy.index]))
+
+    if snap.nodes is not None and 'alias' in snap.nodes:
+        out = out.join(snap.nodes.set_index('nodeid')['alias'])
+    return out
+
+
+def report(snap):
+    """
+    Full statistics of one snapshot as a dict of scalars and frames.
+    """
+    with tracing.span("graph_stats.report", nodes=snap.n, channels=len(snap.channels)):
+        deg = degrees(snap)
+        weak = component_sizes(snap)
+        strong = component_sizes(snap, strong=True)
+        capacity = snap.amount[snap.channel_rows] / 1000
+        active = snap.active
+        ppm = snap.channels['fee_per_millionth'].to_numpy(dtype=float)[active]
+        base = snap.channels['base_fee_millisatoshi'].to_numpy(dtype=float)[active]
+
+        summary = pd.Series({
+            'nodes': snap.n,
+            'nodes_with_channels': int((deg > 0).sum()),
+            'channels': len(snap.channel_rows),
+            'directed_entries': len(snap.channels),
+            'active_entries': int(active.sum()),
+            'node_pairs': len(snap.pair_lo),
+            'capacity_btc': np.nansum(capacity) / 1e8,
+            'components': len(weak),
+            'largest_component': int(weak[0]) if len(weak) else 0,
+            'largest_scc': int(strong[0]) if len(strong) else 0,
+            'odd_degree_nodes': int((deg % 2 == 1).sum()),
+        })
+        log_bins = np.floor(np.log2(np.maximum(capacity[np.isfinite(capacity)], 1))).astype(int)
+        return {
+            'summary': summary,
+            'degree_distribution': pd.Series(np.bincount(deg), name='nodes').rename_axis('degree'),
+            'capacity_distribution': pd.Series(np.bincount(log_bins), name='channels').rename_axis('log2_sat'),
+            'component_sizes': pd.Series(weak[:10], name='nodes'),
+            'percentiles': pd.DataFrame({
+                'degree': _percentiles(deg[deg > 0].astype(float)),
+                'capacity_sat': _percentiles(capacity),
+                'ppm': _percentiles(ppm),
+                'base_fee_msat': _percentiles(base),
+            }),
+            'nodes': node_aggregates(snap),
+        }
+
+
+def diff(old, new, old_report=None, new_report=None, top=20):
+    """
+    Differences between two snapshots: summary and percentile deltas,
+    opened/closed channels, appeared/disappeared nodes and the nodes whose
+    capacity changed most.
+    """
+    old_report = old_report or report(old)
+    new_report = new_report or report(new)
+
+    old_scids = pd.Index(old.channels['short_channel_id'].unique())
+    new_scids = pd.Index(new.channels['short_channel_id'].unique())
+    a, b = old_report['nodes'], new_report['nodes']
+    nodes = a[['channels', 'capacity_sat']].join(b[['channels', 'capacity_sat']], how='outer', lsuffix='_old', rsuffix='_new').fillna(0)
+    nodes['capacity_change_sat'] = nodes['capacity_sat_new'] - nodes['capacity_sat_old']
+    nodes['channel_change'] = nodes['channels_new'] - nodes['channels_old']
+    movers = nodes.reindex(nodes['capacity_change_sat'].abs().sort_values(ascending=False).index[:top])
+
+    return {
+        'summary': pd.DataFrame({'old': old_report['summary'], 'new': new_report['summary'],
+                                 'change': new_report['summary'] - old_report['summary']}),
+        'percentiles': new_report['percentiles'] - old_report['percentiles'],
+        'opened_channels': new_scids.difference(old_scids),
+        'closed_channels': old_scids.difference(new_scids),
+        'new_nodes': b.index.difference(a.index),
+        'gone_nodes': a.index.difference(b.index),
+        'capacity_movers': movers,
+    }
+
+
+def print_report(rep):
+    for name, value in rep.items():
+        if name == 'nodes':
+            value = value.sort_values('capacity_sat', ascending=False).head(20)
+        print(f"\n### {name}")
+        if isinstance(value, pd.Index):
+            print(f"{len(value)}: {', '.join(map(str, value[:20]))}")
+        else:
+            print(value.to_string())
+
+# -----------------------------
+# Loading
+# -----------------------------
+def load_rpc(rpc_path):
+    from pyln.client import LightningRpc
+    rpc = LightningRpc(rpc_path)
+    with tracing.span("rpc.listchannels") as sp_:
+        channels = pd.DataFrame(rpc.listchannels()["channels"])
+        sp_.set(rows=len(channels))
+    with tracing.span("rpc.listnodes") as sp_:
+        nodes = pd.DataFrame(rpc.listnodes()["nodes"])
+        sp_.set(rows=len(nodes))
+    return channels, nodes
+
+
+def load_history(root, at):
+    from gossip_history import GossipHistory
+    history = GossipHistory(root)
+    channels = history.state_at("channels", at)
+    if channels is None:
+        raise ValueError(f"No gossip recorded in {root} before {at}")
+    return channels, history.state_at("nodes", at)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lightning graph statistics and snapshot comparison")
+    parser.add_argument("--rpc", default=os.environ.get('HOME', '') + "/.lightning/bitcoin/lightning-rpc", help="lightning-rpc socket")
+    parser.add_argument("--history", help="Read snapshots from this gossip history instead of lightningd")
+    parser.add_argument("--at", help="Snapshot time in the history (default: latest)")
+    parser.add_argument("--compare", help="Compare with the history snapshot at this time")
+    parser.add_argument("--odd-degree", action="store_true", help="List the nodes with odd degree")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    if args.compare and not args.history:
+        parser.error("--compare needs --history")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    tracing.configure_from_args("graph_stats", args)
+
+    channels, nodes = load_history(args.history, args.at) if args.history else load_rpc(args.rpc)
+    snap = Snapshot(channels, nodes)
+    start = time.time()
+    rep = report(snap)
+    logger.info(f"Statistics of {snap.n} nodes and {len(snap.channels)} channel entries in {time.time() - start:.3f}s")
+
+    if args.compare:
+        old = Snapshot(*load_history(args.history, args.compare))
+        print_report(diff(old, snap, new_report=rep))
+    else:
+        print_report(rep)
+
+    if args.odd_degree:
+        print("\n".join(odd_degree_nodes(snap)))
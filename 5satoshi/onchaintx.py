@@ -1,15 +1,44 @@
 
 import sys, os, logging
+import argparse
 import pandas
 from pyln.client import LightningRpc
 
-from bloxplorer import bitcoin_explorer
+import tracing
+from tx_lookup import DEFAULT_CACHE_PATH, TxCache, get_backend, lookup
+
+parser = argparse.ArgumentParser(description="Our on-chain transactions enriched with explorer data")
+parser.add_argument("--backend", default="bloxplorer", help="bloxplorer, esplora[:URL] or stub:DIRECTORY")
+parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="SQLite cache of confirmed transactions")
+parser.add_argument("--workers", type=int, default=8, help="Concurrent explorer lookups")
+parser.add_argument("--retries", type=int, default=3)
+parser.add_argument("--output", help="Write the enriched transactions to this CSV file")
+tracing.add_arguments(parser)
+args = parser.parse_args()
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+tracing.configure_from_args("onchaintx", args)
 
 
 l1 = LightningRpc(os.environ['HOME']+"/.lightning/bitcoin/lightning-rpc")
-txs = l1.listtransactions()
+with tracing.span("rpc.listtransactions") as sp:
+    txs = l1.listtransactions()
+    sp.set(rows=len(txs["transactions"]))
 dfp = pandas.DataFrame(txs["transactions"])
 
-onchaintx = dfp[dfp.blockheight>0]
+onchaintx = dfp[dfp.blockheight>0].copy()
+
+### opens, closes and sweeps; confirmed ones are served from the cache on reruns
+cache = TxCache(args.cache)
+try:
+    result = lookup(onchaintx.hash, cache, get_backend(args.backend), workers=args.workers, retries=args.retries)
+finally:
+    cache.close()
+
+onchaintx["fee"] = onchaintx.hash.map(lambda h: result.get(h, {}).get("fee"))
+onchaintx["weight"] = onchaintx.hash.map(lambda h: result.get(h, {}).get("weight"))
+onchaintx["block_time"] = onchaintx.hash.map(lambda h: result.get(h, {}).get("status", {}).get("block_time"))
 
-result = bitcoin_explorer.tx.get(dfp.hash[1])
+print(onchaintx[["hash", "blockheight", "fee", "weight", "block_time"]].to_string(index=False))
+if args.output:
+    onchaintx.drop(columns=[c for c in ("rawtx", "inputs", "outputs") if c in onchaintx]).to_csv(args.output, index=False)
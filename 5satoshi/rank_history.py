@@ -0,0 +1,254 @@
+#!/usr/bin/python
+"""
+Local history of betweenness scores and ranks, for questions such as
+"how did node X's micro rank move over the last 90 days" without a
+BigQuery scan:
+
+    python rank_history.py series --key <nodeid> --type micro --days 90
+    python rank_history.py movers --type common --start 2026-09-01 --end 2026-10-01
+
+Layout per kind (nodes, edges):
+
+    root/<kind>/main.parquet        sorted by (key, type, timestamp)
+    root/<kind>/run-<ts>.parquet    appended by run_pipeline since the last compaction
+
+Edge keys are "<short_channel_id>/<direction>". compact() merges the runs
+into main.parquet and keeps one point per day for data older than
+keep_days.
+"""
+
+import argparse
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+import tracing
+
+DEFAULT_HISTORY_DIR = os.path.join(os.environ.get('HOME', '.'), "data", "rank_history")
+KINDS = ("nodes", "edges")
+COLUMNS = ["key", "type", "timestamp", "score", "rank"]
+KEEP_DAYS = 7
+
+logger = logging.getLogger("RankHistory")
+
+
+def _seconds(ts):
+    """
+    last_update values are epoch seconds or timestamps depending on the source.
+    """
+    if isinstance(ts, (int, np.integer, float, np.floating)):
+        return int(ts)
+    ts = pd.Timestamp(ts)
+    return int((ts if ts.tz else ts.tz_localize("UTC")).timestamp())
+
+# -----------------------------
+# Index
+# -----------------------------
+class SeriesIndex:
+    """
+    One kind's history as sorted arrays plus (key, type) -> row range, so a
+    series lookup is a dict hit and two slices.
+    """
+
+    def __init__(self, df):
+        df = df.sort_values(["key", "type", "timestamp"], ignore_index=True)
+        df = df.drop_duplicates(["key", "type", "timestamp"], keep="last", ignore_index=True)
+        self.timestamp = df["timestamp"].to_numpy(dtype=np.int64)
+        self.score = df["score"].to_numpy(dtype=np.float32)
+        self.rank = df["rank"].to_numpy(dtype=np.int32)
+
+        keys = df["key"].to_numpy(dtype=object)
+        types = df["type"].to_numpy(dtype=object)
+        new = np.ones(len(df), dtype=bool)
+        new[1:] = (keys[1:] != keys[:-1]) | (types[1:] != types[:-1])
+        self.starts = np.flatnonzero(new)
+        self.stops = np.r_[self.starts[1:], len(df)]
+        self.keys = keys[self.starts]
+        self.types = types[self.starts]
+        self.groups = {(k, t): g for g, (k, t) in enumerate(zip(self.keys, self.types))}
+        # group << 32 | timestamp is sorted, one searchsorted finds "as of t" for every group
+        group_of_row = np.repeat(np.arange(len(self.starts), dtype=np.int64), self.stops - self.starts)
+        self.composite = (group_of_row << 32) | self.timestamp
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def series(self, key, tx_type, start=None, end=None):
+        g = self.groups.get((key, tx_type))
+        if g is None:
+            return self.timestamp[:0], self.score[:0], self.rank[:0]
+        lo, hi = self.starts[g], self.stops[g]
+        ts = self.timestamp[lo:hi]
+        a = lo + (np.searchsorted(ts, start) if start is not None else 0)
+        b = lo + (np.searchsorted(ts, end) if end is not None else hi - lo)
+        return self.timestamp[a:b], self.score[a:b], self.rank[a:b]
+
+    def as_of(self, tx_type, at):
+        """
+        (group ids, rank) of every key of tx_type at its latest point <= at.
+        """
+        groups = np.flatnonzero(self.types == tx_type)
+        idx = np.searchsorted(self.composite, (groups.astype(np.int64) << 32) | int(at), side="right") - 1
+        ok = idx >= self.starts[groups]
+        return groups[ok], self.rank[idx[ok]]
+
+    def movers(self, tx_type, start, end, k=10):
+        """
+        Keys with the largest rank improvement (positive) or drop from start
+        to end; both ends must have a point.
+        """
+        g0, r0 = self.as_of(tx_type, start)
+        g1, r1 = self.as_of(tx_type, end)
+        both, i0, i1 = np.intersect1d(g0, g1, assume_unique=True, return_indices=True)
+        change = r0[i0].astype(np.int64) - r1[i1]
+        order = np.argsort(-np.abs(change), kind="stable")[:k]
+        return pd.DataFrame({
+            'key': self.keys[both[order]],
+            'rank_start': r0[i0][order],
+            'rank_end': r1[i1][order],
+            'change': change[order],
+        })
+
+# -----------------------------
+# Store
+# -----------------------------
+class RankHistory:
+    def __init__(self, root=DEFAULT_HISTORY_DIR, logger=logger):
+        self.root = root
+        self.logger = logger
+        self._index = {}
+
+    def _dir(self, kind):
+        path = os.path.join(self.root, kind)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _files(self, kind):
+        d = self._dir(kind)
+        return sorted(os.path.join(d, f) for f in os.listdir(d) if f.endswith(".parquet"))
+
+    def append(self, kind, df):
+        """
+        df with COLUMNS; written as one run file.
+        """
+        if df.empty:
+            return 0
+        df = df[COLUMNS].sort_values(["key", "type", "timestamp"], ignore_index=True)
+        stamp = pd.Timestamp.now(tz="UTC").strftime("%Y%m%dT%H%M%S%f")
+        path = os.path.join(self._dir(kind), f"run-{stamp}.parquet")
+        df.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+        return len(df)
+
+    def append_nodes(self, nodescores, tx_type, timestamp):
+        return self.append("nodes", pd.DataFrame({
+            'key': nodescores['nodeid'].astype(str),
+            'type': tx_type,
+            'timestamp': _seconds(timestamp),
+            'score': nodescores['shortest_path_share'].astype(np.float32),
+            'rank': nodescores['rank'].astype(np.int32),
+        }))
+
+    def append_edges(self, edgescores, tx_type, timestamp):
+        """
+        Full (merged) or compact edge frames, see edge_scores.py.
+        """
+        score = edgescores['score'] if 'score' in edgescores else edgescores['shortest_path_share']
+        direction = edgescores['direction'].astype(int).astype(str) if 'direction' in edgescores else "0"
+        df = pd.DataFrame({
+            'key': edgescores['short_channel_id'].astype(str) + "/" + direction,
+            'type': tx_type,
+            'timestamp': _seconds(timestamp),
+            'score': score.astype(np.float32),
+            'rank': edgescores['rank'].astype(np.int32),
+        }).dropna(subset=['key']).drop_duplicates('key')
+        return self.append("edges", df)
+
+    def index(self, kind):
+        """
+        SeriesIndex of a kind, rebuilt only when its files changed.
+        """
+        files = self._files(kind)
+        signature = tuple((f, os.path.getmtime(f)) for f in files)
+        cached = self._index.get(kind)
+        if cached is None or cached[0] != signature:
+            with tracing.span("rank_history.index", kind=kind, files=len(files)):
+                df = pd.concat([pd.read_parquet(f) for f in files], ignore_index=True) if files \
+                    else pd.DataFrame({c: [] for c in COLUMNS})
+                cached = (signature, SeriesIndex(df))
+            self._index[kind] = cached
+        return cached[1]
+
+    def series(self, kind, key, tx_type, start=None, end=None):
+        ts, score, rank = self.index(kind).series(
+            key, tx_type,
+            None if start is None else _seconds(start),
+            None if end is None else _seconds(end)
+        )
+        return pd.DataFrame({'timestamp': pd.to_datetime(ts, unit="s", utc=True), 'score': score, 'rank': rank})
+
+    def movers(self, kind, tx_type, start, end, k=10):
+        return self.index(kind).movers(tx_type, _seconds(start), _seconds(end), k)
+
+    def compact(self, kind, keep_days=KEEP_DAYS, now=None):
+        """
+        Merge all files into main.parquet; points older than keep_days are
+        downsampled to the last one per (key, type, day).
+        """
+        files = self._files(kind)
+        if not files:
+            return 0
+        df = pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
+        df = df.sort_values(["key", "type", "timestamp"], ignore_index=True)
+        df = df.drop_duplicates(["key", "type", "timestamp"], keep="last")
+
+        cutoff = _seconds(now if now is not None else pd.Timestamp.now(tz="UTC")) - keep_days * 86400
+        old = df["timestamp"] < cutoff
+        day = df.loc[old, "timestamp"] // 86400
+        daily = df[old].assign(day=day).drop_duplicates(["key", "type", "day"], keep="last").drop(columns="day")
+        df = pd.concat([daily, df[~old]]).sort_values(["key", "type", "timestamp"], ignore_index=True)
+
+        main = os.path.join(self._dir(kind), "main.parquet")
+        df.to_parquet(main + ".tmp", index=False, row_group_size=65536)
+        os.replace(main + ".tmp", main)
+        for f in files:
+            if f != main:
+                os.remove(f)
+        self.logger.info(f"Compacted {kind}: {len(files)} files -> main.parquet ({len(df)} points)")
+        return len(df)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local betweenness rank history")
+    parser.add_argument("command", choices=["series", "movers", "compact", "info"])
+    parser.add_argument("--root", default=os.environ.get("CLTOOLS_RANK_HISTORY_DIR", DEFAULT_HISTORY_DIR))
+    parser.add_argument("--kind", choices=KINDS, default="nodes")
+    parser.add_argument("--key", help="Node id, or short_channel_id/direction for edges")
+    parser.add_argument("--type", default="common", help="tx_type (micro, common, macro)")
+    parser.add_argument("--days", type=int, default=None, help="Series: only the last N days")
+    parser.add_argument("--start", help="Movers: start timestamp")
+    parser.add_argument("--end", help="Movers: end timestamp (default: now)")
+    parser.add_argument("-k", type=int, default=20)
+    parser.add_argument("--keep-days", type=int, default=KEEP_DAYS, help="Compact: full resolution for this many days")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    tracing.configure_from_args("rank_history", args)
+    history = RankHistory(args.root)
+    now = pd.Timestamp.now(tz="UTC")
+
+    if args.command == "series":
+        start = now - pd.Timedelta(days=args.days) if args.days else None
+        print(history.series(args.kind, args.key, args.type, start).to_string(index=False))
+    elif args.command == "movers":
+        print(history.movers(args.kind, args.type, args.start, args.end or now, args.k).to_string(index=False))
+    elif args.command == "compact":
+        for kind in KINDS:
+            history.compact(kind, args.keep_days)
+    else:
+        for kind in KINDS:
+            index = history.index(kind)
+            print(f"{kind}: {len(index)} points, {len(index.starts)} series, {len(history._files(kind))} files")
@@ -0,0 +1,134 @@
+#!/usr/bin/python
+
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+# -----------------------------
+# Defaults
+# -----------------------------
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get('HOME', '.'), ".cache", "cl-tools", "centrality")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# Channel columns that influence any centrality/routing result
+SNAPSHOT_CHANNEL_COLUMNS = [
+    "source", "destination", "short_channel_id", "active",
+    "base_fee_millisatoshi", "fee_per_millionth",
+    "htlc_minimum_msat", "htlc_maximum_msat", "satoshis"
+]
+
+logger = logging.getLogger("ResultCache")
+
+# -----------------------------
+# Keys
+# -----------------------------
+def snapshot_digest(channels, nodes):
+    """
+    Hash the parts of a gossip snapshot that feed the graph computations.
+
+    Row order matters (it fixes vertex/edge indices), so callers should sort
+    the frames deterministically before hashing.
+    """
+    h = hashlib.sha256()
+    cols = [c for c in SNAPSHOT_CHANNEL_COLUMNS if c in channels.columns]
+    h.update(",".join(cols).encode())
+    h.update(pd.util.hash_pandas_object(channels[cols], index=False).values.tobytes())
+    h.update(pd.util.hash_pandas_object(nodes['nodeid'], index=False).values.tobytes())
+    return h.hexdigest()
+
+
+def cache_key(snapshot, **params):
+    payload = json.dumps({'version': CACHE_VERSION, 'snapshot': snapshot, **params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+# -----------------------------
+# Cache
+# -----------------------------
+class ResultCache:
+    """
+    On-disk cache of score arrays, one compressed .npz file per key.
+    Entries are evicted least-recently-used first once the directory
+    grows beyond max_bytes.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, logger=logger):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.logger = logger
+        self.hits = 0
+        self.misses = 0
+        self.time_saved = 0.0
+        os.makedirs(path, exist_ok=True)
+
+    def _entry(self, key):
+        return os.path.join(self.path, key + ".npz")
+
+    def get(self, key):
+        path = self._entry(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception:
+            self.logger.warning(f"Dropping unreadable cache entry {path}")
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        # Touch for LRU ordering
+        os.utime(path)
+        self.hits += 1
+        self.time_saved += float(arrays.pop('_elapsed', 0.0))
+        return arrays
+
+    def put(self, key, elapsed, **arrays):
+        path = self._entry(key)
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, 'wb') as f:
+                np.savez_compressed(f, _elapsed=np.float64(elapsed), **arrays)
+            os.replace(tmp, path)
+        except Exception:
+            self.logger.exception(f"Failed to write cache entry {path}")
+            self._remove(tmp)
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(".npz"):
+                continue
+            p = os.path.join(self.path, name)
+            try:
+                st = os.stat(p)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(p)
+            total -= size
+            self.logger.debug(f"Evicted cache entry {p}")
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def log_stats(self):
+        self.logger.info(
+            f"Result cache: {self.hits} hits, {self.misses} misses, "
+            f"{self.time_saved:.1f}s of computation saved"
+        )
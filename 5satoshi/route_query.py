@@ -0,0 +1,259 @@
+#!/usr/bin/python
+"""
+Cheapest route for one (source, destination, amount) without solving
+single-source shortest paths to the whole graph:
+
+    python route_query.py --from <node> --to <node> --amount 80000
+
+A* over the active channels with ALT lower bounds. Fees are affine in the
+amount (base + amount * ppm), so for any amount A a path costs at least
+d_base + A * d_ppm, where d_base and d_ppm are distances under base fees
+and proportional fees alone. Both are bounded by the triangle inequality
+through a few landmarks, precomputed once and valid at every amount. The
+HTLC filter is checked while relaxing edges; nothing is copied per query.
+"""
+
+import argparse
+import heapq
+import logging
+import math
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse import csgraph
+
+import tracing
+from amount_sweep import load_inputs, prepare
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+)
+logger = logging.getLogger("RouteQuery")
+
+LANDMARKS = 16
+SLACK = 1e-9   # keeps float rounding from making the bound inadmissible
+BOUND_CACHE = 64   # (destination, amount) bound vectors kept, n floats each
+
+
+@dataclass
+class Route:
+    source: str
+    destination: str
+    amount_sat: int
+    fee_msat: float
+    channels: list   # (short_channel_id, direction) per hop
+    nodes: list
+
+    @property
+    def hops(self):
+        return len(self.channels)
+
+
+def _min_matrix(src, dst, weight, n):
+    """
+    CSR matrix with the cheapest of any parallel edges (csgraph would add them).
+    """
+    order = np.lexsort((weight, dst, src))
+    s, d, w = src[order], dst[order], weight[order]
+    first = np.ones(len(s), dtype=bool)
+    first[1:] = (np.diff(s) != 0) | (np.diff(d) != 0)
+    # Explicitly stored zeros stay edges for csgraph (zero base fees are common)
+    return sp.csr_matrix((w[first], (s[first], d[first])), shape=(n, n))
+
+
+class RouteIndex:
+    """
+    Adjacency lists of the channel graph plus landmark distance tables under
+    the base-fee and ppm metrics. The first hop is free, the source does not
+    charge itself.
+    """
+
+    def __init__(self, edges, landmarks=LANDMARKS, seed=0):
+        self.nodeids = edges['nodeids']
+        self.n = n = len(self.nodeids)
+        src, dst = edges['src'], edges['dst']
+
+        order = np.argsort(src, kind='stable')
+        self.indptr = np.searchsorted(src[order], np.arange(n + 1)).tolist()
+        self.src = src[order].tolist()
+        self.dst = dst[order].tolist()
+        self.base = edges['base'][order].tolist()
+        self.ppm = edges['ppm'][order].tolist()   # fraction of the amount, fees in msat
+        self.htlc_min = edges['htlc_min'][order].tolist()
+        self.htlc_max = edges['htlc_max'][order].tolist()
+        self.scid = edges['short_channel_id'][order]
+        self.direction = edges['direction'][order]
+
+        with tracing.span("route.landmarks", landmarks=landmarks):
+            self._landmarks(src, dst, edges['base'], edges['ppm'], landmarks, seed)
+        self._bounds = {}
+
+    def _landmarks(self, src, dst, base, ppm, k, seed):
+        """
+        Farthest-first landmarks by hop count, then forward and backward
+        distance rows for both metrics (4k single-source runs in scipy).
+        """
+        hops = _min_matrix(src, dst, np.ones(len(src)), self.n)
+        _, labels = csgraph.connected_components(hops, directed=True, connection='strong')
+        scc = np.flatnonzero(labels == np.bincount(labels).argmax())
+        rng = np.random.default_rng(seed)
+        chosen = [int(rng.choice(scc))]
+        closest = np.full(self.n, np.inf)
+        while len(chosen) < min(k, len(scc)):
+            d = csgraph.dijkstra(hops, directed=False, indices=chosen[-1], unweighted=True)
+            closest = np.minimum(closest, d)
+            candidates = np.where(np.isfinite(closest[scc]), closest[scc], -1)
+            chosen.append(int(scc[candidates.argmax()]))
+        self.landmarks = np.array(chosen)
+
+        tables = {}
+        for name, weight in (('base', base), ('ppm', ppm)):
+            m = _min_matrix(src, dst, weight, self.n)
+            tables[name] = (
+                csgraph.dijkstra(m, directed=True, indices=self.landmarks),          # L -> v
+                csgraph.dijkstra(m.T.tocsr(), directed=True, indices=self.landmarks),  # v -> L
+            )
+        self.tables = tables
+
+    def bound(self, target, msat):
+        """
+        Lower bound of the fee from every node to target at this amount.
+        """
+        key = (target, msat)
+        if key not in self._bounds:
+            h = np.zeros(self.n)
+            for name, scale in (('base', 1.0), ('ppm', float(msat))):
+                from_l, to_l = self.tables[name]
+                with np.errstate(invalid='ignore'):
+                    fwd = from_l[:, [target]] - from_l          # d(L,t) - d(L,v)
+                    bwd = to_l - to_l[:, [target]]              # d(v,L) - d(t,L)
+                lb = np.nan_to_num(np.maximum(fwd, bwd), nan=0.0, posinf=np.inf).max(axis=0)
+                h += scale * np.maximum(lb, 0)
+            h[target] = 0
+            if len(self._bounds) >= BOUND_CACHE:
+                self._bounds.clear()
+            self._bounds[key] = (h * (1 - SLACK)).tolist()
+        return self._bounds[key]
+
+    def _search(self, s, t, msat, h):
+        indptr, dst, base, ppm, lo, hi = self.indptr, self.dst, self.base, self.ppm, self.htlc_min, self.htlc_max
+        inf = math.inf
+        g = {s: 0.0}
+        prev = {}
+        closed = set()
+        heap = [(h[s], 0.0, s)]
+        while heap:
+            _, gu, u = heapq.heappop(heap)
+            if u == t:
+                return gu, prev
+            if u in closed:
+                continue
+            closed.add(u)
+            for i in range(indptr[u], indptr[u + 1]):
+                if not (lo[i] < msat < hi[i]):
+                    continue
+                v = dst[i]
+                hv = h[v]
+                if hv == inf or v in closed:
+                    continue
+                ng = gu if u == s else gu + base[i] + msat * ppm[i]
+                if ng < g.get(v, inf):
+                    g[v] = ng
+                    prev[v] = i
+                    heapq.heappush(heap, (ng + hv, ng, v))
+        return None, prev
+
+    def _route(self, s, t, amount_sat, h):
+        if s == t:
+            return None
+        fee, prev = self._search(s, t, amount_sat * 1000, h)
+        if fee is None:
+            return None
+        edges, v = [], t
+        while v != s:
+            i = prev[v]
+            edges.append(i)
+            v = self.src[i]
+        edges.reverse()
+        nodes = [self.nodeids[s]] + [self.nodeids[self.dst[i]] for i in edges]
+        return Route(
+            self.nodeids[s], self.nodeids[t], amount_sat, fee,
+            [(self.scid[i], int(self.direction[i])) for i in edges], nodes
+        )
+
+    def route(self, source, destination, amount_sat):
+        """
+        Cheapest Route or None if the destination is unreachable at this amount.
+        """
+        s, t = self.nodeids.get_loc(source), self.nodeids.get_loc(destination)
+        return self._route(s, t, amount_sat, self.bound(t, amount_sat * 1000))
+
+    def routes(self, queries):
+        """
+        Batch mode: [(source, destination, amount_sat), ...] -> [Route or None].
+        Queries are grouped by destination and amount to share the bounds.
+        """
+        located = [(i, self.nodeids.get_loc(s), self.nodeids.get_loc(d), a) for i, (s, d, a) in enumerate(queries)]
+        located.sort(key=lambda q: (q[2], q[3]))
+        out = [None] * len(queries)
+        with tracing.span("route.batch", queries=len(queries)):
+            for i, s, t, amount in located:
+                out[i] = self._route(s, t, amount, self.bound(t, amount * 1000))
+        return out
+
+
+def benchmark(index, count, amount, seed=0):
+    """
+    Random queries per second and the share that found a route.
+    """
+    rng = np.random.default_rng(seed)
+    ids = index.nodeids
+    picks = rng.integers(0, index.n, size=(count, 2))
+    queries = [(ids[a], ids[b], amount) for a, b in picks if a != b]
+    start = time.time()
+    found = index.routes(queries)
+    elapsed = time.time() - start
+    return len(queries) / max(elapsed, 1e-9), sum(r is not None for r in found) / max(len(queries), 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Point-to-point cheapest route queries")
+    parser.add_argument("--channels-file", help="Parquet/CSV of listchannels (default: BigQuery channels)")
+    parser.add_argument("--nodes-file", help="Parquet/CSV of listnodes (default: BigQuery nodes)")
+    parser.add_argument("--from", dest="source", help="Source node id")
+    parser.add_argument("--to", dest="destination", help="Destination node id")
+    parser.add_argument("--amount", type=int, default=80000, help="Amount in sat")
+    parser.add_argument("--batch-file", help="CSV with source,destination,amount_sat columns to answer in one batch")
+    parser.add_argument("--landmarks", type=int, default=LANDMARKS)
+    parser.add_argument("--benchmark", type=int, default=0, metavar="N", help="Time N random queries")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    tracing.configure_from_args("route_query", args)
+
+    channels, nodes, _ = load_inputs(args)
+    edges = prepare(channels, nodes)
+    start = time.time()
+    index = RouteIndex(edges, args.landmarks)
+    logger.info(f"Index over {index.n} nodes, {len(index.dst)} channels built in {time.time() - start:.1f}s")
+
+    if args.source and args.destination:
+        route = index.route(args.source, args.destination, args.amount)
+        if route is None:
+            print("No route")
+        else:
+            print(f"fee {route.fee_msat:.3f} msat over {route.hops} hops")
+            for node, (scid, direction) in zip(route.nodes, route.channels):
+                print(f"  {node} -> {scid}/{direction}")
+    if args.batch_file:
+        import pandas as pd
+        queries = pd.read_csv(args.batch_file)
+        found = index.routes(list(queries[['source', 'destination', 'amount_sat']].itertuples(index=False, name=None)))
+        queries['fee_msat'] = [r.fee_msat if r else None for r in found]
+        queries['hops'] = [r.hops if r else None for r in found]
+        print(queries.to_string(index=False))
+    if args.benchmark:
+        qps, reachable = benchmark(index, args.benchmark, args.amount)
+        logger.info(f"{qps:.0f} queries/s, {reachable:.1%} routable at {args.amount} sat")
@@ -0,0 +1,411 @@
+#!/usr/bin/python
+"""
+Resident scheduler for the cl-tools jobs:
+
+    python scheduler.py --node main=~/.lightning/bitcoin/lightning-rpc --dry-run
+
+Keeps one gossip snapshot in memory for the analysis jobs and sends all
+RPC traffic through a per-node priority queue, so fee updates are not
+stuck behind bulk dumps and the node never sees more than a few
+concurrent calls from us.
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pandas as pd
+
+import fee_policy
+import tracing
+
+# route_compete imports the route finder from the sibling fee-updates tree
+FEE_UPDATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "fee-updates")
+if FEE_UPDATES_DIR not in sys.path:
+    sys.path.append(FEE_UPDATES_DIR)
+
+DEFAULT_STATUS_FILE = os.path.join(os.environ.get('HOME', '.'), "data", "scheduler-status.json")
+
+# Lower runs first
+PRIORITY_FEES = 0
+PRIORITY_SYNC = 5
+PRIORITY_BULK = 10
+
+logger = logging.getLogger("Scheduler")
+
+# -----------------------------
+# RPC governor
+# -----------------------------
+class RpcGovernor:
+    """
+    Priority queue in front of one lightning-rpc socket, served by
+    `concurrency` worker threads.
+    """
+
+    def __init__(self, name, rpc_path, concurrency=2, logger=logger):
+        from pyln.client import LightningRpc
+        self.name = name
+        self.rpc = LightningRpc(rpc_path)
+        self.logger = logger
+        self.queue = []
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.stats = {'calls': 0, 'errors': 0, 'wait_s': 0.0, 'busy_s': 0.0}
+        for i in range(concurrency):
+            threading.Thread(target=self._worker, name=f"rpc-{name}-{i}", daemon=True).start()
+
+    def submit(self, method, priority=PRIORITY_SYNC, **params):
+        future = Future()
+        with self.cond:
+            heapq.heappush(self.queue, (priority, next(self.seq), time.time(), method, params, future))
+            self.cond.notify()
+        return future
+
+    def call(self, method, priority=PRIORITY_SYNC, **params):
+        return self.submit(method, priority, **params).result()
+
+    def proxy(self, priority):
+        """
+        LightningRpc look-alike whose calls go through the queue, for code
+        that takes an rpc object (warehouse/aggregates sync etc.).
+        """
+        return _RpcProxy(self, priority)
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                _, _, queued_at, method, params, future = heapq.heappop(self.queue)
+                self.in_flight += 1
+            start = time.time()
+            failed = False
+            try:
+                future.set_result(self.rpc.call(method, params))
+            except Exception as e:
+                failed = True
+                future.set_exception(e)
+            finally:
+                with self.cond:
+                    self.in_flight -= 1
+                    self.stats['calls'] += 1
+                    self.stats['errors'] += failed
+                    self.stats['wait_s'] += start - queued_at
+                    self.stats['busy_s'] += time.time() - start
+
+    def status(self):
+        with self.cond:
+            calls = max(self.stats['calls'], 1)
+            return {
+                'queue_depth': len(self.queue),
+                'in_flight': self.in_flight,
+                'calls': self.stats['calls'],
+                'errors': self.stats['errors'],
+                'mean_wait_s': round(self.stats['wait_s'] / calls, 4),
+                'mean_call_s': round(self.stats['busy_s'] / calls, 4),
+            }
+
+
+class _RpcProxy:
+    def __init__(self, governor, priority):
+        self._governor = governor
+        self._priority = priority
+
+    def call(self, method, payload=None):
+        return self._governor.call(method, self._priority, **(payload or {}))
+
+    def __getattr__(self, method):
+        def call(**params):
+            return self._governor.call(method, self._priority, **params)
+        return call
+
+# -----------------------------
+# Shared snapshot
+# -----------------------------
+class GraphSnapshot:
+    """
+    listchannels/listnodes frames shared by the analysis jobs. Frames are
+    replaced, never modified, so readers can keep a reference while a
+    refresh runs.
+    """
+
+    def __init__(self, governor, history=None):
+        self.governor = governor
+        self.history = history
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.channels = None
+        self.nodes = None
+        self.fetched_at = None
+
+    def refresh(self):
+        with self.refresh_lock:
+            self._refresh()
+
+    def _stale(self, max_age):
+        return self.fetched_at is None or (max_age is not None and self.age() > max_age)
+
+    def _refresh(self):
+        rpc = self.governor.proxy(PRIORITY_BULK)
+        channels = pd.DataFrame(rpc.listchannels()["channels"])
+        nodes = pd.DataFrame(rpc.listnodes()["nodes"])
+        fetched_at = pd.Timestamp.now(tz="UTC")
+        if self.history is not None:
+            self.history.record("channels", channels, fetched_at)
+            self.history.record("nodes", nodes, fetched_at)
+        channels['last_update'] = pd.to_datetime(channels['last_update'], unit='s')
+        nodes['last_timestamp'] = pd.to_datetime(nodes['last_timestamp'], unit='s')
+        with self.lock:
+            self.channels, self.nodes, self.fetched_at = channels, nodes, fetched_at
+
+    def get(self, max_age=None):
+        """
+        (channels, nodes), refreshed first if missing or older than max_age seconds.
+        """
+        if self._stale(max_age):
+            with self.refresh_lock:
+                # Another job may have refreshed while we waited
+                if self._stale(max_age):
+                    self._refresh()
+        with self.lock:
+            return self.channels, self.nodes
+
+    def age(self):
+        if self.fetched_at is None:
+            return None
+        return (pd.Timestamp.now(tz="UTC") - self.fetched_at).total_seconds()
+
+    def status(self):
+        with self.lock:
+            return {
+                'fetched_at': self.fetched_at.isoformat() if self.fetched_at is not None else None,
+                'age_s': round(self.age(), 1) if self.fetched_at is not None else None,
+                'channels': 0 if self.channels is None else len(self.channels),
+                'nodes': 0 if self.nodes is None else len(self.nodes),
+            }
+
+# -----------------------------
+# Jobs
+# -----------------------------
+class Job:
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.next_due = time.time()
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.last_start = None
+        self.last_duration = None
+        self.last_error = None
+
+    def status(self):
+        return {
+            'interval_s': self.interval,
+            'running': self.running,
+            'runs': self.runs,
+            'failures': self.failures,
+            'last_start': self.last_start,
+            'last_duration_s': None if self.last_duration is None else round(self.last_duration, 3),
+            'last_error': self.last_error,
+            'next_due_in_s': round(self.next_due - time.time(), 1),
+        }
+
+
+class Scheduler:
+    """
+    Runs each job every `interval` seconds on a thread pool; a job never
+    overlaps with its own previous run.
+    """
+
+    def __init__(self, status_file=DEFAULT_STATUS_FILE, workers=4, logger=logger):
+        self.status_file = status_file
+        self.logger = logger
+        self.jobs = []
+        self.governors = {}
+        self.snapshot = None
+        self.started_at = time.time()
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="job")
+
+    def add(self, name, interval, func):
+        self.jobs.append(Job(name, interval, func))
+
+    def _run(self, job):
+        job.last_start = time.time()
+        try:
+            with tracing.span(f"job.{job.name}"):
+                job.func()
+            job.last_error = None
+        except Exception as e:
+            job.failures += 1
+            job.last_error = repr(e)
+            self.logger.exception(f"Job {job.name} failed")
+        finally:
+            job.last_duration = time.time() - job.last_start
+            job.runs += 1
+            job.next_due = job.last_start + job.interval
+            job.running = False
+
+    def write_status(self):
+        status = {
+            'updated_at': pd.Timestamp.now(tz="UTC").isoformat(),
+            'uptime_s': round(time.time() - self.started_at),
+            'snapshot': self.snapshot.status() if self.snapshot else None,
+            'rpc': {name: gov.status() for name, gov in self.governors.items()},
+            'jobs': {job.name: job.status() for job in self.jobs},
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.status_file)), exist_ok=True)
+        tmp = self.status_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(status, f, indent=2, default=str)
+        os.replace(tmp, self.status_file)
+
+    def run_forever(self, tick=1.0, status_every=10.0):
+        self.logger.info(f"Scheduler running {len(self.jobs)} jobs: {', '.join(j.name for j in self.jobs)}")
+        last_status = 0
+        while True:
+            now = time.time()
+            for job in self.jobs:
+                if not job.running and job.next_due <= now:
+                    job.running = True
+                    self.pool.submit(self._run, job)
+            if now - last_status >= status_every:
+                try:
+                    self.write_status()
+                except OSError:
+                    self.logger.exception("Could not write status file")
+                tracing.flush()
+                last_status = now
+            time.sleep(tick)
+
+# -----------------------------
+# Job bodies
+# -----------------------------
+def update_fees(governor, dry_run=False, logger=logger):
+    """
+    Same policy as fee-updates.py, on the fee priority.
+    """
+    channels = governor.call("listpeerchannels", PRIORITY_FEES)["channels"]
+    updates = 0
+    for chan in channels:
+        if chan.get("state") != "CHANNELD_NORMAL":
+            continue
+        to_us, total = int(chan["to_us_msat"]), int(chan["total_msat"])
+        htlc_max = int(chan["maximum_htlc_out_msat"])
+        update, balance, ppm, new_htlc_max = fee_policy.evaluate(to_us, total, htlc_max)
+        if not update:
+            continue
+        logger.info(f"[{governor.name}] {chan['channel_id']}: balance {balance:.3f}, htlc_max {htlc_max} -> {new_htlc_max}, ppm -> {ppm}")
+        if not dry_run:
+            governor.call("setchannel", PRIORITY_FEES, id=chan["channel_id"], feebase=fee_policy.BASE_FEE,
+                          feeppm=ppm, htlcmax=new_htlc_max)
+        updates += 1
+    return updates
+
+
+def centrality(snapshot, test_mode, rank_history=None):
+    from betweenness_centrality import run_pipeline
+    channels, nodes = snapshot.get()
+    run_pipeline(TEST_MODE=test_mode, data=(channels, nodes), checkpoint_dir=None, rank_history=rank_history)
+
+
+def compact_rank_history(rank_history):
+    from rank_history import KINDS
+    for kind in KINDS:
+        rank_history.compact(kind)
+
+
+def route_compete(snapshot, config):
+    from compatative_route_finder import graph_from_frame, run_route_finding
+    channels, _ = snapshot.get()
+    run_route_finding(config, graph_from_frame(channels))
+
+
+def parse_node(text):
+    name, _, path = text.partition("=")
+    return name, os.path.expanduser(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resident scheduler with shared graph snapshot and RPC governor")
+    parser.add_argument("--node", action="append", type=parse_node,
+                        help="name=path/to/lightning-rpc; the first node serves gossip (repeatable)")
+    parser.add_argument("--rpc-concurrency", type=int, default=2, help="Concurrent RPC calls per node")
+    parser.add_argument("--workers", type=int, default=4, help="Jobs running at the same time")
+    parser.add_argument("--status-file", default=DEFAULT_STATUS_FILE)
+    parser.add_argument("--graph-interval", type=int, default=15, help="Minutes between gossip snapshots")
+    parser.add_argument("--fees-interval", type=int, default=10, help="Minutes between fee updates (0: off)")
+    parser.add_argument("--forwards-interval", type=int, default=5, help="Minutes between forwards syncs (0: off)")
+    parser.add_argument("--centrality-interval", type=int, default=0, help="Minutes between centrality runs (0: off)")
+    parser.add_argument("--route-interval", type=int, default=0, help="Minutes between route competition runs (0: off)")
+    parser.add_argument("--route-config", help="Config file of compatative_route_finder.py")
+    parser.add_argument("--aggregates", help="Flow aggregates SQLite path for the forwards sync")
+    parser.add_argument("--warehouse", help="Forwards warehouse directory for the forwards sync")
+    parser.add_argument("--history", help="Gossip history directory; every snapshot is recorded")
+    parser.add_argument("--rank-history", default=os.environ.get("CLTOOLS_RANK_HISTORY_DIR"),
+                        help="Rank history directory for centrality results, compacted daily")
+    parser.add_argument("--dry-run", action="store_true", help="Log fee updates without setchannel")
+    parser.add_argument("--test", action="store_true", help="Centrality in TEST_MODE")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(threadName)s %(message)s")
+    tracing.configure_from_args("scheduler", args)
+
+    nodes = args.node or [("main", os.path.join(os.environ.get('HOME', ''), ".lightning/bitcoin/lightning-rpc"))]
+    scheduler = Scheduler(args.status_file, args.workers)
+    for name, path in nodes:
+        scheduler.governors[name] = RpcGovernor(name, path, args.rpc_concurrency)
+    gossip_node = scheduler.governors[nodes[0][0]]
+
+    history = None
+    if args.history:
+        from gossip_history import GossipHistory
+        history = GossipHistory(args.history)
+    snapshot = scheduler.snapshot = GraphSnapshot(gossip_node, history)
+    scheduler.add("graph", args.graph_interval * 60, snapshot.refresh)
+
+    for name, gov in scheduler.governors.items():
+        if args.fees_interval:
+            scheduler.add(f"fees.{name}", args.fees_interval * 60,
+                          lambda gov=gov: update_fees(gov, args.dry_run))
+
+    if args.forwards_interval and (args.aggregates or args.warehouse):
+        # Local stores of the gossip node; a per-node layout is the collector's job
+        def sync_forwards():
+            rpc = gossip_node.proxy(PRIORITY_SYNC)
+            if args.warehouse:
+                from forwards_warehouse import ForwardsWarehouse
+                ForwardsWarehouse(args.warehouse).sync(rpc)
+            if args.aggregates:
+                from flow_aggregates import FlowAggregates
+                agg = FlowAggregates(args.aggregates)
+                try:
+                    agg.sync(rpc)
+                finally:
+                    agg.close()
+        scheduler.add("forwards", args.forwards_interval * 60, sync_forwards)
+
+    rank_history = None
+    if args.rank_history:
+        from rank_history import RankHistory
+        rank_history = RankHistory(args.rank_history)
+        scheduler.add("rank-history.compact", 24 * 3600, lambda: compact_rank_history(rank_history))
+    if args.centrality_interval:
+        scheduler.add("centrality", args.centrality_interval * 60,
+                      lambda: centrality(snapshot, args.test, rank_history))
+    if args.route_interval:
+        if not args.route_config:
+            parser.error("--route-interval needs --route-config")
+        scheduler.add("route-compete", args.route_interval * 60, lambda: route_compete(snapshot, args.route_config))
+
+    scheduler.run_forever()
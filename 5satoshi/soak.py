@@ -0,0 +1,541 @@
+#!/usr/bin/python
+"""
+Load and soak harness: runs the sync and fee scripts against mock
+lightningd sockets and offline sinks, and reports JSON metrics.
+
+    python soak.py --nodes 15000 --channels 80000 --forwards 1000000 --duration 600
+
+Every entry point runs as a subprocess with HOME pointing at a scratch
+directory. That directory holds the two sockets the scripts expect
+(.lightning/ and .lightning-btc/), served by MockLightningd with generated
+gossip, peer channels and forwards. BigQuery loads go to files through
+CLTOOLS_BQ_LOCAL_DIR (store-forwards.py also reads its watermark back from
+there), and MySQL is replaced by SQLite through mysqlbulk's url key.
+
+Per entry point the report has runs, failures, wall time, peak RSS (from
+wait4), RPC calls and rows served per method, and rows/s.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import shutil
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+logger = logging.getLogger("Soak")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK = 10000
+
+# -----------------------------
+# Generated data
+# -----------------------------
+def node_id(i):
+    return "02" + hashlib.sha256(f"node{i}".encode()).hexdigest()
+
+
+class Gossip:
+    """
+    nodes and channels with a few hubs (endpoints drawn with a skew towards
+    low indices), plus `peers` channels for each of the own nodes.
+    """
+
+    def __init__(self, nodes, channels, own=(0, 1), peers=50, seed=0):
+        rng = random.Random(seed)
+        self.node_ids = [node_id(i) for i in range(nodes)]
+        self.nodes = [{
+            'nodeid': nid, 'alias': f"mock-{i}", 'color': "3399ff",
+            'last_timestamp': 1700000000 + i % 86400, 'features': "808898880a8a59a1",
+            'addresses': [],
+        } for i, nid in enumerate(self.node_ids)]
+
+        self.channels = []
+        self.own = {}
+        count = 0
+
+        def add(a, b, capacity):
+            nonlocal count
+            scid = f"{700000 + count // 1000}x{count % 1000}x{count % 3}"
+            count += 1
+            for direction, (s, d) in enumerate(((a, b), (b, a))):
+                self.channels.append({
+                    'source': self.node_ids[s], 'destination': self.node_ids[d],
+                    'short_channel_id': scid, 'direction': direction, 'public': True,
+                    'amount_msat': capacity * 1000, 'satoshis': capacity,
+                    'message_flags': 1, 'channel_flags': direction, 'active': rng.random() > 0.05,
+                    'last_update': 1700000000 + rng.randrange(14 * 86400),
+                    'base_fee_millisatoshi': rng.choice((0, 0, 1, 1000)),
+                    'fee_per_millionth': rng.choice((1, 10, 50, 100, 500, 1000, 2500)),
+                    'delay': rng.choice((40, 80, 144)),
+                    'htlc_minimum_msat': rng.choice((0, 1000)),
+                    'htlc_maximum_msat': capacity * 990,
+                    'features': "",
+                })
+            return scid
+
+        for _ in range(channels):
+            a = int(nodes * rng.random() ** 2)
+            b = rng.randrange(nodes)
+            if a != b:
+                add(a, b, rng.choice((1_000_000, 2_000_000, 5_000_000, 10_000_000, 50_000_000)))
+        for o in own:
+            others = rng.sample([i for i in range(min(nodes, peers * 4)) if i not in own], min(peers, nodes - len(own)))
+            self.own[o] = [(add(o, p, 5_000_000), p) for p in others]
+
+        self.by_scid = defaultdict(list)
+        for c in self.channels:
+            self.by_scid[c['short_channel_id']].append(c)
+        self._channels_json = None
+        self._nodes_json = None
+
+    def channels_json(self):
+        if self._channels_json is None:
+            self._channels_json = json.dumps({'channels': self.channels}).encode()
+        return self._channels_json
+
+    def nodes_json(self):
+        if self._nodes_json is None:
+            self._nodes_json = json.dumps({'nodes': self.nodes}).encode()
+        return self._nodes_json
+
+
+class MockNode:
+    """
+    Node-local state of one own node: peer channels and a forwards log that
+    is generated on demand (forward i is a pure function of i), so millions
+    of forwards cost no memory.
+    """
+
+    def __init__(self, gossip, index, forwards=0, seed=0):
+        self.gossip = gossip
+        self.id = gossip.node_ids[index]
+        rng = random.Random(seed + index)
+        self.peer_channels = []
+        for n, (scid, peer) in enumerate(gossip.own[index]):
+            total = 5_000_000_000
+            to_us = rng.randrange(total)
+            self.peer_channels.append({
+                'peer_id': gossip.node_ids[peer], 'peer_connected': True, 'state': "CHANNELD_NORMAL",
+                'short_channel_id': scid, 'channel_id': hashlib.sha256(scid.encode()).hexdigest(),
+                'funding_txid': hashlib.sha256(b"f" + scid.encode()).hexdigest(), 'funding_outnum': 0,
+                'opener': "local" if n % 2 else "remote", 'private': False,
+                'to_us_msat': to_us, 'total_msat': total,
+                'min_to_us_msat': to_us // 2, 'max_to_us_msat': total,
+                'spendable_msat': to_us, 'receivable_msat': total - to_us,
+                'fee_base_msat': 0, 'fee_proportional_millionths': 100,
+                'minimum_htlc_out_msat': 0, 'maximum_htlc_out_msat': rng.randrange(total),
+                'in_fulfilled_msat': 0, 'out_fulfilled_msat': 0,
+                'features': ["option_static_remotekey"], 'state_changes': [], 'status': [], 'htlcs': [],
+            })
+        self.by_channel_id = {c['channel_id']: c for c in self.peer_channels}
+        self.closed = [{
+            'peer_id': gossip.node_ids[(index + k + 2) % len(gossip.node_ids)],
+            'channel_id': hashlib.sha256(f"closed{index}-{k}".encode()).hexdigest(),
+            'short_channel_id': f"600000x{k}x{index}", 'opener': "local", 'closer': "remote",
+            'close_cause': ("remote", "protocol", "onchain", "user")[k % 4],
+            'total_msat': 1_000_000_000, 'final_to_us_msat': 400_000_000, 'last_stable_connection': 1690000000 + k,
+        } for k in range(20)]
+        self.forwards = forwards
+        self.lock = threading.Lock()
+
+    def add_forwards(self, n):
+        with self.lock:
+            self.forwards += n
+
+    def forward(self, i):
+        h = (i * 2654435761) & 0xffffffff
+        chans = self.peer_channels
+        a = chans[h % len(chans)]['short_channel_id']
+        b = chans[(h >> 8) % len(chans)]['short_channel_id']
+        out_msat = 1000 * (1 + (h >> 4) % 1_000_000)
+        fee = out_msat // 10000 + 1
+        status = "settled" if h % 10 < 8 else ("failed" if h % 10 == 8 else "local_failed")
+        received = 1700000000 + i * 2
+        f = {
+            'created_index': i + 1, 'updated_index': i + 1,
+            'in_channel': a, 'in_htlc_id': i, 'in_msat': out_msat + fee,
+            'status': status, 'received_time': received + 0.123, 'style': "tlv",
+        }
+        if status != "local_failed":
+            f.update(out_channel=b, out_htlc_id=i, out_msat=out_msat, fee_msat=fee, resolved_time=received + 1.5)
+        if status != "settled":
+            f.update(failcode=4103 if status == "local_failed" else 16399, failreason="WIRE_TEMPORARY_CHANNEL_FAILURE")
+        return f
+
+# -----------------------------
+# Mock lightningd
+# -----------------------------
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        decoder = json.JSONDecoder()
+        buf = ""
+        while True:
+            chunk = self.request.recv(65536)
+            if not chunk:
+                return
+            buf += chunk.decode()
+            while buf.strip():
+                try:
+                    request, end = decoder.raw_decode(buf.lstrip())
+                except ValueError:
+                    break
+                buf = buf.lstrip()[end:]
+                self.server.mock.dispatch(self.request, request)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class MockLightningd:
+    """
+    Unix-socket JSON-RPC server speaking the lightningd protocol (responses
+    end with a blank line) for the methods the scripts call.
+    """
+
+    def __init__(self, path, node, setchannel_latency=0.0):
+        self.path = path
+        self.node = node
+        self.gossip = node.gossip
+        self.setchannel_latency = setchannel_latency
+        self.calls = defaultdict(int)
+        self.rows = defaultdict(int)
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.server = _Server(path, _Handler)
+        self.server.mock = self
+        self.thread = threading.Thread(target=self.server.serve_forever, name=f"mock-{os.path.basename(os.path.dirname(os.path.dirname(path)))}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def counters(self):
+        with self.lock:
+            return dict(self.calls), dict(self.rows)
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.rows.clear()
+
+    def _count(self, method, rows):
+        with self.lock:
+            self.calls[method] += 1
+            self.rows[method] += rows
+
+    def dispatch(self, sock, request):
+        method = request.get("method")
+        params = request.get("params") or {}
+        if isinstance(params, list):
+            params = {}
+        head = ('{"jsonrpc":"2.0","id":%s,' % json.dumps(request.get("id"))).encode()
+        try:
+            handler = getattr(self, f"rpc_{method}", None)
+            if handler is None:
+                raise KeyError(method)
+            parts = handler(**params)
+        except Exception as e:
+            self._count(method, 0)
+            error = {'code': -32601 if isinstance(e, KeyError) else -1, 'message': f"{method}: {e}"}
+            sock.sendall(head + b'"error":' + json.dumps(error).encode() + b'}\n\n')
+            return
+        sock.sendall(head + b'"result":')
+        for part in parts:
+            sock.sendall(part)
+        sock.sendall(b'}\n\n')
+
+    # Each rpc_* returns an iterable of JSON byte strings forming the result
+
+    def rpc_getinfo(self, **_):
+        self._count("getinfo", 1)
+        return [json.dumps({
+            'id': self.node.id, 'alias': "mock", 'network': "bitcoin", 'version': "mock",
+            'blockheight': 900000, 'num_peers': len(self.node.peer_channels),
+        }).encode()]
+
+    def rpc_listchannels(self, short_channel_id=None, source=None, destination=None, **_):
+        if short_channel_id is None and source is None and destination is None:
+            self._count("listchannels", len(self.gossip.channels))
+            return [self.gossip.channels_json()]
+        chans = self.gossip.by_scid.get(short_channel_id, []) if short_channel_id else self.gossip.channels
+        chans = [c for c in chans if (source is None or c['source'] == source) and (destination is None or c['destination'] == destination)]
+        self._count("listchannels", len(chans))
+        return [json.dumps({'channels': chans}).encode()]
+
+    def rpc_listnodes(self, id=None, **_):
+        if id is None:
+            self._count("listnodes", len(self.gossip.nodes))
+            return [self.gossip.nodes_json()]
+        nodes = [n for n in self.gossip.nodes if n['nodeid'] == id]
+        self._count("listnodes", len(nodes))
+        return [json.dumps({'nodes': nodes}).encode()]
+
+    def rpc_listpeerchannels(self, id=None, **_):
+        chans = [c for c in self.node.peer_channels if id is None or c['peer_id'] == id]
+        self._count("listpeerchannels", len(chans))
+        return [json.dumps({'channels': chans}).encode()]
+
+    def rpc_listpeers(self, id=None, **_):
+        peers = [{
+            'id': c['peer_id'], 'connected': True, 'num_channels': 1, 'netaddr': [],
+            'features': "08a0000a0a69a2", 'channels': [c],
+        } for c in self.node.peer_channels if id is None or c['peer_id'] == id]
+        self._count("listpeers", len(peers))
+        return [json.dumps({'peers': peers}).encode()]
+
+    def rpc_listclosedchannels(self, id=None, **_):
+        closed = [c for c in self.node.closed if id is None or c['peer_id'] == id]
+        self._count("listclosedchannels", len(closed))
+        return [json.dumps({'closedchannels': closed}).encode()]
+
+    def rpc_listtransactions(self, **_):
+        self._count("listtransactions", 0)
+        return [b'{"transactions":[]}']
+
+    def rpc_listforwards(self, status=None, in_channel=None, out_channel=None, index=None, start=None, limit=None, **_):
+        total = self.node.forwards
+        first = max(int(start or 1), 1) - 1
+        last = total if limit is None else min(total, first + int(limit))
+
+        def stream():
+            yield b'{"forwards":['
+            sent = 0
+            for lo in range(first, last, CHUNK):
+                batch = [self.node.forward(i) for i in range(lo, min(lo + CHUNK, last))]
+                batch = [f for f in batch if (status is None or f['status'] == status)
+                         and (in_channel is None or f['in_channel'] == in_channel)
+                         and (out_channel is None or f.get('out_channel') == out_channel)]
+                if batch:
+                    yield (b',' if sent else b'') + json.dumps(batch)[1:-1].encode()
+                    sent += len(batch)
+            yield b']}'
+            self._count("listforwards", sent)
+        return stream()
+
+    def rpc_setchannel(self, id, feebase=None, feeppm=None, htlcmin=None, htlcmax=None, **_):
+        if self.setchannel_latency:
+            time.sleep(self.setchannel_latency)
+        chan = self.node.by_channel_id.get(id)
+        if chan is None:
+            raise ValueError(f"unknown channel {id}")
+        with self.node.lock:
+            if feebase is not None:
+                chan['fee_base_msat'] = int(feebase)
+            if feeppm is not None:
+                chan['fee_proportional_millionths'] = int(feeppm)
+            if htlcmin is not None:
+                chan['minimum_htlc_out_msat'] = int(htlcmin)
+            if htlcmax is not None:
+                chan['maximum_htlc_out_msat'] = int(htlcmax)
+        self._count("setchannel", 1)
+        return [json.dumps({'channels': [{
+            'peer_id': chan['peer_id'], 'channel_id': id, 'short_channel_id': chan['short_channel_id'],
+            'fee_base_msat': chan['fee_base_msat'], 'fee_proportional_millionths': chan['fee_proportional_millionths'],
+            'minimum_htlc_out_msat': chan['minimum_htlc_out_msat'], 'maximum_htlc_out_msat': chan['maximum_htlc_out_msat'],
+        }]}).encode()]
+
+# -----------------------------
+# Entry points
+# -----------------------------
+def _script(path):
+    return os.path.join(ROOT, path)
+
+
+ENTRY_POINTS = {
+    'sync-graph': lambda env: [_script("5satoshi/store-graph-data.py")],
+    'sync-forwards': lambda env: [_script("5satoshi/store-forwards.py")],
+    'sync-peers': lambda env: [_script("fee-updates/peer-updates.py"), env['peers_config']],
+    'update-fees': lambda env: [_script("5satoshi/fee-updates.py")],
+    'warehouse-sync': lambda env: [_script("5satoshi/forwards_warehouse.py"), "sync", "--root", os.path.join(env['HOME'], "data", "forwards")],
+    'aggregates-sync': lambda env: [_script("5satoshi/flow_aggregates.py"), "sync", "--path", os.path.join(env['HOME'], "data", "flow_aggregates.sqlite")],
+    'collect': lambda env: [_script("5satoshi/collector.py"), "--node", f"main={env['rpc_main']}", "--node", f"btc={env['rpc_btc']}",
+                            "--output", os.path.join(env['HOME'], "data", "collector")],
+    'closures': lambda env: [_script("5satoshi/analyse-closure.py")],
+}
+
+
+def prepare_home(home):
+    """
+    Directories, sinks and config files the scripts expect under HOME.
+    """
+    for d in ("logs", "data", "bq"):
+        os.makedirs(os.path.join(home, d), exist_ok=True)
+    peers_config = os.path.join(home, "peers.conf")
+    with open(peers_config, 'w') as f:
+        f.write("[logging]\npath = logs/peers.log\n\n")
+        f.write(f"[db]\ndatabase = sqlite\nurl = sqlite:///{os.path.join(home, 'data', 'peers.sqlite')}\n")
+    return {
+        'HOME': home,
+        'CLTOOLS_BQ_LOCAL_DIR': os.path.join(home, "bq"),
+        'CLTOOLS_CLOSURE_INDEX': os.path.join(home, "data", "closures.sqlite"),
+        'peers_config': peers_config,
+        'rpc_main': os.path.join(home, ".lightning", "bitcoin", "lightning-rpc"),
+        'rpc_btc': os.path.join(home, ".lightning-btc", "bitcoin", "lightning-rpc"),
+    }
+
+
+def run_entry(name, env, servers, timeout, python=sys.executable):
+    """
+    One subprocess run: exit code, wall time, peak RSS and the RPC calls
+    and rows it caused on every mock server.
+    """
+    for s in servers:
+        s.reset()
+    argv = [python] + ENTRY_POINTS[name](env)
+    proc_env = dict(os.environ, **{k: v for k, v in env.items() if k.isupper()})
+    start = time.time()
+    proc = subprocess.Popen(argv, cwd=os.path.dirname(argv[1]), env=proc_env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    timer = threading.Timer(timeout, proc.kill)
+    timer.start()
+    try:
+        # stderr is read in a thread so a chatty script cannot block on a full pipe
+        err = []
+        reader = threading.Thread(target=lambda: err.append(proc.stderr.read()), daemon=True)
+        reader.start()
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        reader.join()
+    finally:
+        timer.cancel()
+    elapsed = time.time() - start
+
+    calls, rows = defaultdict(int), defaultdict(int)
+    for s in servers:
+        c, r = s.counters()
+        for k, v in c.items():
+            calls[k] += v
+        for k, v in r.items():
+            rows[k] += v
+    result = {
+        'returncode': proc.returncode,
+        'seconds': elapsed,
+        'peak_rss_mb': usage.ru_maxrss / 1024,
+        'rpc_calls': dict(calls),
+        'rows': dict(rows),
+    }
+    if proc.returncode != 0:
+        result['stderr'] = (err[0] if err else b"").decode(errors="replace")[-2000:]
+    return result
+
+
+def summarize(runs):
+    ok = [r for r in runs if r['returncode'] == 0]
+    rows = sum(sum(r['rows'].values()) for r in ok)
+    seconds = sum(r['seconds'] for r in ok)
+    calls = defaultdict(int)
+    for r in runs:
+        for k, v in r['rpc_calls'].items():
+            calls[k] += v
+    summary = {
+        'runs': len(runs),
+        'failures': len(runs) - len(ok),
+        'seconds_mean': seconds / len(ok) if ok else None,
+        'seconds_max': max((r['seconds'] for r in ok), default=None),
+        'peak_rss_mb': max((r['peak_rss_mb'] for r in runs), default=None),
+        'rpc_calls': dict(calls),
+        'rows_per_second': rows / seconds if seconds else None,
+    }
+    failed = [r for r in runs if r['returncode'] != 0]
+    if failed:
+        summary['last_error'] = failed[-1].get('stderr', "")
+    return summary
+
+
+def soak(entries, env, nodes, servers, duration, min_runs, forwards_rate, timeout):
+    """
+    Round-robin over the entry points until duration passed and every entry
+    ran min_runs times; new forwards arrive at forwards_rate per second.
+    """
+    runs = {name: [] for name in entries}
+    start = last = time.time()
+    while True:
+        for name in entries:
+            now = time.time()
+            if forwards_rate:
+                for node in nodes:
+                    node.add_forwards(int(forwards_rate * (now - last)))
+            last = now
+            result = run_entry(name, env, servers, timeout)
+            runs[name].append(result)
+            logger.info(f"{name}: exit {result['returncode']} in {result['seconds']:.1f}s, "
+                        f"{result['peak_rss_mb']:.0f} MB, {sum(result['rpc_calls'].values())} RPC calls")
+        if time.time() - start >= duration and all(len(r) >= min_runs for r in runs.values()):
+            break
+    return runs, time.time() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load/soak harness with mock lightningd sockets")
+    parser.add_argument("entries", nargs="*", help=f"Entry points (default: all of {', '.join(ENTRY_POINTS)})")
+    parser.add_argument("--nodes", type=int, default=15000)
+    parser.add_argument("--channels", type=int, default=80000)
+    parser.add_argument("--peers", type=int, default=50, help="Channels of each own node")
+    parser.add_argument("--forwards", type=int, default=100000, help="Forwards already in the log at start")
+    parser.add_argument("--forwards-rate", type=float, default=0, help="New forwards per second during the soak")
+    parser.add_argument("--setchannel-latency", type=float, default=0.05, help="Seconds per setchannel")
+    parser.add_argument("--duration", type=float, default=0, help="Soak for at least this many seconds")
+    parser.add_argument("--runs", type=int, default=1, help="Minimum runs per entry point")
+    parser.add_argument("--timeout", type=float, default=1800, help="Kill a run after this many seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch HOME")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    entries = args.entries or list(ENTRY_POINTS)
+    unknown = [e for e in entries if e not in ENTRY_POINTS]
+    if unknown:
+        parser.error(f"unknown entry points: {', '.join(unknown)}")
+
+    home = tempfile.mkdtemp(prefix="cltools-soak-")
+    env = prepare_home(home)
+    started = time.time()
+    gossip = Gossip(args.nodes, args.channels, peers=args.peers, seed=args.seed)
+    nodes = [MockNode(gossip, 0, args.forwards, args.seed), MockNode(gossip, 1, args.forwards, args.seed)]
+    servers = [
+        MockLightningd(env['rpc_main'], nodes[0], args.setchannel_latency).start(),
+        MockLightningd(env['rpc_btc'], nodes[1], args.setchannel_latency).start(),
+    ]
+    setup = time.time() - started
+    logger.info(f"Mock network: {args.nodes} nodes, {len(gossip.channels)} channel directions, "
+                f"{args.forwards} forwards per node ({setup:.1f}s) in {home}")
+
+    try:
+        runs, elapsed = soak(entries, env, nodes, servers, args.duration, args.runs, args.forwards_rate, args.timeout)
+    finally:
+        for s in servers:
+            s.stop()
+        if not args.keep:
+            shutil.rmtree(home, ignore_errors=True)
+
+    report = {
+        'scale': {
+            'nodes': args.nodes, 'channels': args.channels, 'peers': args.peers,
+            'forwards': args.forwards, 'forwards_final': nodes[0].forwards,
+            'forwards_rate': args.forwards_rate, 'setchannel_latency': args.setchannel_latency,
+        },
+        'setup_seconds': setup,
+        'end_to_end_seconds': elapsed,
+        'entries': {name: summarize(r) for name, r in runs.items()},
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
@@ -2,7 +2,11 @@ import argparse
 from pyln.client import LightningRpc
 import pandas as pd
 import sys, os, logging
-from google.cloud import bigquery
+
+import tracing
+from flow_aggregates import FlowAggregates
+
+FORWARDINGS_TABLE = "lightning-fee-optimizer.version_1.forwardings"
 
 
 def main():
@@ -15,6 +19,12 @@ def main():
         action="store_true",
         help="Run script without uploading to BigQuery (dry run)"
     )
+    parser.add_argument(
+        "--aggregates",
+        default=None,
+        help="Also fold new forwards into the flow aggregates at this SQLite path"
+    )
+    tracing.add_arguments(parser)
     args = parser.parse_args()
     DRY_RUN = args.test
 
@@ -27,6 +37,7 @@ def main():
         handlers=[logging.StreamHandler(sys.stdout)]
     )
     logger = logging.getLogger(__name__)
+    tracing.configure_from_args("store-forwards", args)
 
     logger.info("Starting forwardings sync script.")
     if DRY_RUN:
@@ -35,10 +46,19 @@ def main():
     # -------------------------------------------------
     # Initialize Clients
     # -------------------------------------------------
+    # With CLTOOLS_BQ_LOCAL_DIR the forwardings table is a local bqload sink:
+    # the watermark is read from it and new versions are appended, no MERGE
+    local_dir = os.environ.get("CLTOOLS_BQ_LOCAL_DIR")
     try:
-        logger.info("Initializing BigQuery client...")
-        client = bigquery.Client()
-        logger.info("BigQuery client initialized.")
+        if local_dir:
+            import bqload
+            client = bqload.LocalClient(local_dir)
+            logger.info(f"Using the local BigQuery stand-in at {local_dir}")
+        else:
+            from google.cloud import bigquery
+            logger.info("Initializing BigQuery client...")
+            client = bigquery.Client()
+            logger.info("BigQuery client initialized.")
 
         logger.info("Initializing Lightning RPC client...")
         rpc_path = os.environ['HOME'] + "/.lightning/bitcoin/lightning-rpc"
@@ -49,18 +69,33 @@ def main():
         logger.exception("Failed to initialize clients.")
         sys.exit(1)
 
+    # -------------------------------------------------
+    # Flow Aggregates (independent watermark)
+    # -------------------------------------------------
+    if args.aggregates and DRY_RUN:
+        logger.info("DRY RUN: Skipping flow aggregates update.")
+    elif args.aggregates:
+        try:
+            FlowAggregates(args.aggregates, logger).sync(l1)
+        except Exception:
+            logger.exception("Failed to update flow aggregates.")
+
     # -------------------------------------------------
     # Forwardings Sync
     # -------------------------------------------------
     try:
         logger.info("Querying existing forwardings status from BigQuery...")
         
-        # Fetch max indexes from BigQuery
-        result = client.query("""
-            SELECT MAX(updated_index) AS max_updated
-            FROM `lightning-fee-optimizer.version_1.forwardings`
-        """).to_dataframe()
-        max_updated = result["max_updated"].iloc[0]
+        if local_dir:
+            result = client.read_table(FORWARDINGS_TABLE, columns=["updated_index"])
+            max_updated = result["updated_index"].max() if len(result) else None
+        else:
+            # Fetch max indexes from BigQuery
+            result = client.query(f"""
+                SELECT MAX(updated_index) AS max_updated
+                FROM `{FORWARDINGS_TABLE}`
+            """).to_dataframe()
+            max_updated = result["max_updated"].iloc[0]
         if pd.isna(max_updated):
             max_updated = 0
 
@@ -74,8 +109,11 @@ def main():
     try:
         start_index = int(max_updated) + 1
         logger.info(f"Fetching forwards from Lightning starting at updated_index {start_index}...")
-        forwards = l1.listforwards(index='updated', start=start_index)
-        dff = pd.DataFrame(forwards["forwards"])
+        with tracing.span("rpc.listforwards") as sp:
+            forwards = l1.listforwards(index='updated', start=start_index)
+            sp.set(rows=len(forwards["forwards"]))
+        with tracing.span("frame.build"):
+            dff = pd.DataFrame(forwards["forwards"])
         logger.info(f"Fetched {len(dff)} forward records.")
 
         if dff.empty:
@@ -92,44 +130,45 @@ def main():
     try:
         logger.info("Enforcing schema and data types...")
 
-        expected_columns = [
-            "created_index", "in_channel", "out_channel",
-            "in_msat", "out_msat", "fee_msat",
-            "status", "received_time", "resolved_time",
-            "in_htlc_id", "failcode", "failreason",
-            "out_htlc_id", "style", "updated_index"
-        ]
-
-        for col in expected_columns:
-            if col not in dff:
-                dff[col] = None
-
-        dff = dff[expected_columns]
-
-        # Float columns (nullable)
-        dff["out_msat"] = dff["out_msat"].astype("Float64")
-        dff["fee_msat"] = dff["fee_msat"].astype("Float64")
-
-        # Int columns
-        int_cols = [
-            "in_htlc_id", "failcode",
-            "out_htlc_id", "updated_index",
-            "in_msat","created_index"
-        ]
-        for col in int_cols:
-            dff[col] = dff[col].astype("Int64")
-
-        # String columns
-        string_cols = [
-            "in_channel", "out_channel",
-            "status", "failreason", "style"
-        ]
-        for col in string_cols:
-            dff[col] = dff[col].astype("string")
-
-        # Timestamp conversion
-        dff["received_time"] = pd.to_datetime(dff["received_time"], unit="s", errors="coerce", utc=True).dt.round("us")
-        dff["resolved_time"] = pd.to_datetime(dff["resolved_time"], unit="s", errors="coerce", utc=True).dt.round("us")
+        with tracing.span("coerce", rows=len(dff)):
+            expected_columns = [
+                "created_index", "in_channel", "out_channel",
+                "in_msat", "out_msat", "fee_msat",
+                "status", "received_time", "resolved_time",
+                "in_htlc_id", "failcode", "failreason",
+                "out_htlc_id", "style", "updated_index"
+            ]
+
+            for col in expected_columns:
+                if col not in dff:
+                    dff[col] = None
+
+            dff = dff[expected_columns]
+
+            # Float columns (nullable)
+            dff["out_msat"] = dff["out_msat"].astype("Float64")
+            dff["fee_msat"] = dff["fee_msat"].astype("Float64")
+
+            # Int columns
+            int_cols = [
+                "in_htlc_id", "failcode",
+                "out_htlc_id", "updated_index",
+                "in_msat","created_index"
+            ]
+            for col in int_cols:
+                dff[col] = dff[col].astype("Int64")
+
+            # String columns
+            string_cols = [
+                "in_channel", "out_channel",
+                "status", "failreason", "style"
+            ]
+            for col in string_cols:
+                dff[col] = dff[col].astype("string")
+
+            # Timestamp conversion
+            dff["received_time"] = pd.to_datetime(dff["received_time"], unit="s", errors="coerce", utc=True).dt.round("us")
+            dff["resolved_time"] = pd.to_datetime(dff["resolved_time"], unit="s", errors="coerce", utc=True).dt.round("us")
 
         logger.info("Schema enforcement complete.")
 
@@ -143,6 +182,12 @@ def main():
     try:
         if DRY_RUN:
             logger.info(f"DRY RUN: Skipping upload of {len(dff)} records to BigQuery.")
+        elif local_dir:
+            # Readers keep the highest updated_index per created_index, like the warehouse
+            with tracing.span("upload", table="forwardings", rows=len(dff)):
+                bqload.upload(dff, FORWARDINGS_TABLE, if_exists='append', client=client)
+            logger.info(f"Appended {len(dff)} forward records to the local forwardings table.")
+            return
         else:
             logger.info(f"Uploading {len(dff)} forwardings to BigQuery...")
 
@@ -169,12 +214,13 @@ def main():
                 write_disposition="WRITE_TRUNCATE"
             )
 
-            job = client.load_table_from_dataframe(
-                dff,
-                "lightning-fee-optimizer.version_1.temp_forwardings",
-                job_config=job_config
-            )
-            job.result()
+            with tracing.span("upload", table="temp_forwardings", rows=len(dff)):
+                job = client.load_table_from_dataframe(
+                    dff,
+                    "lightning-fee-optimizer.version_1.temp_forwardings",
+                    job_config=job_config
+                )
+                job.result()
             logger.info(f"Successfully uploaded {len(dff)} forward records.")
 
     except Exception:
@@ -193,7 +239,8 @@ def main():
             logger.info("Running MERGE into forwardings table...")
             
             # Fetch max indexes from BigQuery
-            job = client.query("""
+            with tracing.span("merge"):
+                job = client.query("""
                 MERGE `lightning-fee-optimizer.version_1.forwardings` T
                 USING `lightning-fee-optimizer.version_1.temp_forwardings` S
                 ON T.created_index = S.created_index
@@ -213,8 +260,8 @@ def main():
                     updated_index = S.updated_index
                 WHEN NOT MATCHED THEN
                 INSERT ROW;
-            """)
-            job.result()
+                """)
+                job.result()
 
     except Exception:
         logger.exception("Failed during BigQuery merge")
@@ -1,32 +1,61 @@
-from pyln.client import LightningRpc
-import pandas
-import sys, os, logging
-from datetime import datetime, date, timedelta
-from google.cloud import bigquery
+import os, logging
 
-client = bigquery.Client()
+import tracing
 
-l1 = LightningRpc(os.environ['HOME']+"/.lightning/bitcoin/lightning-rpc")
+RPC_PATH = os.environ['HOME']+"/.lightning/bitcoin/lightning-rpc"
 
-### Channels ---------------------------------------------
 
-channels = l1.listchannels()
+def main():
+    # The backends are imported per run so importing this module stays cheap
+    from pyln.client import LightningRpc
+    import pandas
+    import bqload
+    from gossip_history import GossipHistory
 
-dfc = pandas.DataFrame(channels["channels"])
-dfc['last_update'] = pandas.to_datetime(dfc['last_update'], unit='s')
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    tracing.configure("store-graph-data")
 
-dfc.to_gbq("lightning-fee-optimizer.version_1.channels",if_exists='replace')
+    l1 = LightningRpc(RPC_PATH)
+    pulled_at = pandas.Timestamp.now(tz="UTC")
 
-### Nodes ---------------------------------------------
+    # Channel and node uploads run concurrently
+    with bqload.BulkLoader() as loader:
 
-nodes = l1.listnodes()
+        ### Channels ---------------------------------------------
 
-dfn = pandas.DataFrame(nodes["nodes"])
-dfn['last_timestamp'] = pandas.to_datetime(dfn['last_timestamp'], unit='s')
+        with tracing.span("rpc.listchannels") as sp:
+            channels = l1.listchannels()
+            sp.set(rows=len(channels["channels"]))
 
-dfn.to_gbq("lightning-fee-optimizer.version_1.nodes",if_exists='replace')
+        with tracing.span("frame.channels"):
+            dfc = pandas.DataFrame(channels["channels"])
+            raw_channels = dfc.copy()
+            dfc['last_update'] = pandas.to_datetime(dfc['last_update'], unit='s')
 
+        loader.submit(dfc, "lightning-fee-optimizer.version_1.channels", if_exists='replace')
 
+        ### Nodes ---------------------------------------------
 
+        with tracing.span("rpc.listnodes") as sp:
+            nodes = l1.listnodes()
+            sp.set(rows=len(nodes["nodes"]))
 
+        with tracing.span("frame.nodes"):
+            dfn = pandas.DataFrame(nodes["nodes"])
+            raw_nodes = dfn.copy()
+            dfn['last_timestamp'] = pandas.to_datetime(dfn['last_timestamp'], unit='s')
 
+        loader.submit(dfn, "lightning-fee-optimizer.version_1.nodes", if_exists='replace')
+
+    ### History ---------------------------------------------
+
+    # BigQuery only keeps the latest snapshot; keep the changes locally
+    history_dir = os.environ.get("CLTOOLS_GOSSIP_HISTORY_DIR")
+    if history_dir:
+        history = GossipHistory(history_dir)
+        history.record("channels", raw_channels, pulled_at)
+        history.record("nodes", raw_nodes, pulled_at)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/python
+"""
+Betweenness of our own node and channels only, estimated from a sample
+of sources instead of a full Brandes run:
+
+    python targeted_centrality.py --node-id <our id> --amount 80000
+
+Each sampled source costs one Dijkstra; its dependency on every target
+(the SCC targets below it in the source's tree) is an unbiased sample of
+the target's betweenness divided by the number of sources. Sources are
+drawn in batches without replacement until every target's confidence
+interval is tight enough or the time budget runs out.
+"""
+
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csgraph
+
+import tracing
+from amount_sweep import AmountGraph, Trees, load_inputs, prepare, subtree_sizes
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+)
+logger = logging.getLogger("TargetedCentrality")
+
+BATCH = 64
+Z = {0.9: 1.645, 0.95: 1.960, 0.99: 2.576}
+
+# -----------------------------
+# Estimator
+# -----------------------------
+class TargetedEstimate:
+    """
+    Sampled node and edge betweenness of a few targets at one amount,
+    normalized like AmountSweep.node_curves / edge_curves.
+    """
+
+    def __init__(self, edges, amount_sat, node_ids, channel_ids=(), rng=None):
+        self.edges = edges
+        self.amount = amount_sat
+        self.graph = AmountGraph(edges, amount_sat)
+        self.rng = rng or np.random.default_rng()
+
+        index = edges['nodeids']
+        vertices = index.get_indexer(list(node_ids))
+        self.vertices = vertices[vertices >= 0]
+        # Outgoing channels of the target nodes plus any extra channels
+        own = np.isin(edges['src'], self.vertices) | np.isin(edges['short_channel_id'], list(channel_ids))
+        self.edge_targets = np.flatnonzero(own & self.graph.mask)
+
+        self.population = self.rng.permutation(np.flatnonzero(self.graph.in_scc))
+        self.sampled = 0
+        width = len(self.vertices) + len(self.edge_targets)
+        self.sum = np.zeros(width)
+        self.sum_sq = np.zeros(width)
+
+    @property
+    def exhausted(self):
+        return self.sampled >= len(self.population)
+
+    def dependencies(self, sources):
+        """
+        sources x targets matrix of pair counts through each target.
+        """
+        dist, pred = csgraph.dijkstra(self.graph.matrix, directed=True, indices=sources, return_predecessors=True)
+        trees = Trees(dist, pred, self.graph.tree_edges(pred))
+        rows = np.arange(len(sources))
+        reached, weight, size = subtree_sizes(trees, rows, self.graph)
+
+        v = self.vertices
+        node_dep = np.where(reached[:, v], size[:, v] - weight[:, v], 0)
+        heads = self.edges['dst'][self.edge_targets]
+        on_tree = trees.edges[:, heads] == self.edge_targets[None, :]
+        edge_dep = np.where(on_tree, size[:, heads], 0)
+        return np.hstack([node_dep, edge_dep])
+
+    def sample(self, k):
+        batch = self.population[self.sampled:self.sampled + k]
+        if not len(batch):
+            return 0
+        dep = self.dependencies(batch)
+        self.sum += dep.sum(axis=0)
+        self.sum_sq += (dep ** 2).sum(axis=0)
+        self.sampled += len(batch)
+        return len(batch)
+
+    def intervals(self, confidence=0.95):
+        """
+        (estimate, half width) of every target's pair count, with the finite
+        population correction for sampling without replacement.
+        """
+        k, n = self.sampled, len(self.population)
+        mean = self.sum / max(k, 1)
+        if k < 2:
+            return mean * n, np.full_like(mean, np.inf)
+        var = np.maximum(self.sum_sq - k * mean ** 2, 0) / (k - 1)
+        fpc = (n - k) / (n - 1) if n > 1 else 0
+        se = np.sqrt(var / k * fpc)
+        return mean * n, Z[confidence] * se * n
+
+    def norms(self):
+        n = float(self.graph.in_scc.sum())
+        node_norm = max((n - 1) * (n - 2), 1)
+        edge_norm = max(n * (n - 1), 1)
+        return np.r_[np.full(len(self.vertices), node_norm), np.full(len(self.edge_targets), edge_norm)]
+
+    def converged(self, rel_tol, abs_tol, confidence=0.95):
+        if self.exhausted:
+            return True
+        estimate, half = self.intervals(confidence)
+        norms = self.norms()
+        return bool(np.all((half <= rel_tol * estimate) | (half / norms <= abs_tol)))
+
+    def run(self, batch=BATCH, rel_tol=0.1, abs_tol=1e-4, max_seconds=10, max_sources=None, confidence=0.95):
+        start = time.time()
+        limit = len(self.population) if max_sources is None else min(max_sources, len(self.population))
+        with tracing.span("targeted.sample", amount=self.amount) as sp:
+            while self.sampled < limit:
+                self.sample(min(batch, limit - self.sampled))
+                if self.sampled >= 2 * batch and self.converged(rel_tol, abs_tol, confidence):
+                    break
+                if time.time() - start > max_seconds:
+                    logger.info(f"[{self.amount} sat] Time budget reached after {self.sampled} sources")
+                    break
+            sp.set(sources=self.sampled)
+        return self
+
+    def frame(self, confidence=0.95):
+        estimate, half = self.intervals(confidence)
+        norms = self.norms()
+        nodeids = self.edges['nodeids']
+        kind = ["node"] * len(self.vertices) + ["channel"] * len(self.edge_targets)
+        target = list(nodeids[self.vertices]) + list(self.edges['short_channel_id'][self.edge_targets])
+        direction = [None] * len(self.vertices) + list(self.edges['direction'][self.edge_targets])
+        share = estimate / norms
+        return pd.DataFrame({
+            'type': kind,
+            'target': target,
+            'direction': direction,
+            'amount_sat': self.amount,
+            'share': share,
+            'ci_low': np.maximum(share - half / norms, 0),
+            'ci_high': share + half / norms,
+            'sources': self.sampled,
+            'population': len(self.population),
+        })
+
+
+def estimate(edges, node_ids, amounts, channel_ids=(), seed=None, **run_args):
+    """
+    One frame for all amounts; for callers such as the fee updater.
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for amount in amounts:
+        est = TargetedEstimate(edges, amount, node_ids, channel_ids, rng).run(**run_args)
+        logger.info(f"[{amount} sat] {est.sampled}/{len(est.population)} sources")
+        frames.append(est.frame(run_args.get('confidence', 0.95)))
+    return pd.concat(frames, ignore_index=True)
+
+
+def own_node_id(rpc_path):
+    from pyln.client import LightningRpc
+    return LightningRpc(rpc_path).getinfo()["id"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sampled betweenness of our own node and channels")
+    parser.add_argument("--channels-file", help="Parquet/CSV of listchannels (default: BigQuery channels)")
+    parser.add_argument("--nodes-file", help="Parquet/CSV of listnodes (default: BigQuery nodes)")
+    parser.add_argument("--node-id", action="append", help="Target node (repeatable; default: getinfo of --rpc)")
+    parser.add_argument("--rpc", default="~/.lightning/bitcoin/lightning-rpc", help="Socket used when --node-id is missing")
+    parser.add_argument("--channel", action="append", default=[], help="Extra short_channel_id to estimate (repeatable)")
+    parser.add_argument("--amount", type=int, action="append", help="Amount in sat (repeatable; default: micro, common, macro)")
+    parser.add_argument("--batch", type=int, default=BATCH, help="Sources per Dijkstra batch")
+    parser.add_argument("--rel-tol", type=float, default=0.1, help="Stop when every CI half width is below this fraction of the estimate")
+    parser.add_argument("--abs-tol", type=float, default=1e-4, help="... or below this absolute share")
+    parser.add_argument("--confidence", type=float, default=0.95, choices=sorted(Z))
+    parser.add_argument("--max-seconds", type=float, default=10, help="Time budget per amount")
+    parser.add_argument("--max-sources", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the fee jitter")
+    parser.add_argument("--output", help="Write estimates to this Parquet file")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    tracing.configure_from_args("targeted_centrality", args)
+
+    node_ids = args.node_id or [own_node_id(os.path.expanduser(args.rpc))]
+    channels, nodes, latest_update = load_inputs(args)
+    edges = prepare(channels, nodes, args.seed)
+
+    start = time.time()
+    result = estimate(
+        edges, node_ids, args.amount or [200, 80000, 4000000], args.channel, seed=args.seed,
+        batch=args.batch, rel_tol=args.rel_tol, abs_tol=args.abs_tol, max_seconds=args.max_seconds,
+        max_sources=args.max_sources, confidence=args.confidence
+    )
+    logger.info(f"Estimated {len(result)} targets in {time.time() - start:.1f}s")
+    print(result.to_string(index=False))
+    if args.output:
+        result.to_parquet(args.output, index=False)
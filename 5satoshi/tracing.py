@@ -0,0 +1,269 @@
+#!/usr/bin/python
+
+import atexit
+import contextvars
+import cProfile
+import functools
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger("Tracing")
+
+# ru_maxrss is reported in KB on Linux and in bytes on macOS
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+# -----------------------------
+# Span
+# -----------------------------
+def _track_id():
+    """
+    Chrome trace track: the asyncio task if one is running (concurrent tasks
+    share a thread but their spans overlap), else the thread. asyncio is only
+    looked up, not imported, so scripts without it do not pay for it.
+    """
+    aio = sys.modules.get("asyncio")
+    if aio is not None:
+        try:
+            task = aio.current_task()
+        except RuntimeError:
+            task = None
+        if task is not None:
+            return id(task)
+    return threading.get_ident()
+
+
+class Span:
+    def __init__(self, name, parent=None, **attrs):
+        self.name = name
+        self.parent = parent
+        self.attrs = dict(attrs)
+        self.start = None
+        self.wall = None
+        self.cpu = None
+        self.rss_delta = None
+        self.error = None
+        self.tid = _track_id()
+
+    def set(self, **attrs):
+        """
+        Attach counts or other attributes, e.g. span.set(rows=len(df)).
+        """
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'parent': self.parent,
+            'start': self.start,
+            'wall_s': round(self.wall, 6),
+            'cpu_s': round(self.cpu, 6),
+            'peak_rss_delta_mb': round(self.rss_delta / 1024 ** 2, 3),
+            'error': self.error,
+            'tid': self.tid,
+            **self.attrs
+        }
+
+# -----------------------------
+# Tracer
+# -----------------------------
+class Tracer:
+    """
+    Collects spans for one script run and exports them as JSON lines and
+    as a Chrome trace (chrome://tracing, Perfetto) when the run exits.
+
+    The stack of open spans is a ContextVar, so threads and asyncio tasks
+    each nest their own spans. cpu is process CPU time, which overlaps for
+    spans running concurrently.
+    """
+
+    def __init__(self, name="cl-tools", trace_dir=None, profile=False, logger=logger):
+        self.name = name
+        self.trace_dir = trace_dir
+        self.profile = profile
+        self.logger = logger
+        self.spans = []
+        self.run_id = f"{name}-{datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}"
+        self._stack = contextvars.ContextVar(f"tracing-{self.run_id}", default=())
+        self._lock = threading.Lock()
+        self._profiling = False
+        self._flushed = False
+
+    @contextmanager
+    def span(self, name, **attrs):
+        stack = self._stack.get()
+        sp = Span(name, parent=stack[-1].name if stack else None, **attrs)
+        token = self._stack.set(stack + (sp,))
+
+        profiler = None
+        with self._lock:
+            if self.profile and not self._profiling:
+                # cProfile cannot nest, so only the outermost span is profiled
+                self._profiling = True
+                profiler = cProfile.Profile()
+
+        rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        cpu_start = time.process_time()
+        sp.start = time.time()
+        wall_start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield sp
+        except BaseException as e:
+            sp.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            sp.wall = time.perf_counter() - wall_start
+            sp.cpu = time.process_time() - cpu_start
+            sp.rss_delta = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_start) * RSS_UNIT
+            self._stack.reset(token)
+            with self._lock:
+                if self.trace_dir:
+                    self.spans.append(sp)
+                if profiler is not None:
+                    self._profiling = False
+            if profiler is not None:
+                self._dump_profile(profiler, sp)
+            # Nested spans log at DEBUG so only top-level timings show at INFO
+            counts = " ".join(f"{k}={v}" for k, v in sp.attrs.items())
+            self.logger.log(
+                logging.INFO if sp.parent is None else logging.DEBUG,
+                f"span {name}: wall {sp.wall:.2f}s, cpu {sp.cpu:.2f}s, "
+                f"peak rss +{sp.rss_delta / 1024 ** 2:.1f}MB {counts}".rstrip()
+            )
+
+    def _dump_profile(self, profiler, sp):
+        directory = self.trace_dir or "."
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.run_id}-{sp.name}.prof")
+        profiler.dump_stats(path)
+        self.logger.info(f"cProfile for {sp.name} written to {path}")
+
+    # -----------------------------
+    # Export
+    # -----------------------------
+    def _event(self, record, pid):
+        return {
+            'name': record['name'],
+            'cat': self.name,
+            'ph': 'X',
+            'ts': int(record['start'] * 1e6),
+            'dur': int(record['wall_s'] * 1e6),
+            'pid': pid,
+            'tid': record['tid'],
+            'args': {k: v for k, v in record.items() if k not in ('name', 'start', 'tid')}
+        }
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        events = [self._event(sp.to_dict(), pid) for sp in self.spans]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def flush(self):
+        """
+        Append the spans collected so far to the JSON lines file and drop
+        them, so long-running processes do not grow without bound.
+        """
+        with self._lock:
+            spans, self.spans = self.spans, []
+        if not self.trace_dir or not spans:
+            return
+        os.makedirs(self.trace_dir, exist_ok=True)
+        with open(os.path.join(self.trace_dir, self.run_id + ".jsonl"), 'a') as f:
+            for sp in spans:
+                f.write(json.dumps(sp.to_dict(), default=str) + "\n")
+        self._flushed = True
+
+    def export(self):
+        """
+        Write the remaining spans and the Chrome trace. Once spans were
+        flushed, the JSON lines file is the complete record, so the trace is
+        rebuilt from it one line at a time.
+        """
+        if not self.trace_dir or not (self.spans or self._flushed):
+            return
+        os.makedirs(self.trace_dir, exist_ok=True)
+        base = os.path.join(self.trace_dir, self.run_id)
+        if not self._flushed:
+            with open(base + ".jsonl", 'w') as f:
+                for sp in self.spans:
+                    f.write(json.dumps(sp.to_dict(), default=str) + "\n")
+            with open(base + ".trace.json", 'w') as f:
+                json.dump(self.chrome_trace(), f, default=str)
+        else:
+            self.flush()
+            pid = os.getpid()
+            with open(base + ".jsonl") as records, open(base + ".trace.json", 'w') as f:
+                f.write('{"displayTimeUnit": "ms", "traceEvents": [')
+                for i, line in enumerate(records):
+                    f.write((", " if i else "") + json.dumps(self._event(json.loads(line), pid), default=str))
+                f.write("]}")
+        self.logger.info(f"Trace written to {base}.jsonl and {base}.trace.json")
+
+# -----------------------------
+# Module-level tracer
+# -----------------------------
+_tracer = Tracer()
+
+
+def configure(name, trace_dir=None, profile=None):
+    """
+    Set up the process-wide tracer. Defaults come from CLTOOLS_TRACE_DIR
+    and CLTOOLS_PROFILE so scripts without argparse can be traced too.
+    """
+    global _tracer
+    if trace_dir is None:
+        trace_dir = os.environ.get("CLTOOLS_TRACE_DIR")
+    if profile is None:
+        profile = os.environ.get("CLTOOLS_PROFILE", "") not in ("", "0")
+    _tracer = Tracer(name, trace_dir, profile)
+    atexit.register(_tracer.export)
+    return _tracer
+
+
+def flush():
+    _tracer.flush()
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--trace-dir",
+        default=None,
+        help="Write spans as JSON lines and Chrome trace to this directory"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=None,
+        help="Dump a cProfile file per top-level stage"
+    )
+
+
+def configure_from_args(name, args):
+    return configure(name, args.trace_dir, args.profile)
+
+
+def span(name, **attrs):
+    return _tracer.span(name, **attrs)
+
+
+def traced(name=None):
+    """
+    Decorator form of span().
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
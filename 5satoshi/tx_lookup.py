@@ -0,0 +1,170 @@
+#!/usr/bin/python
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+
+DEFAULT_CACHE_PATH = os.path.join(os.environ.get('HOME', '.'), "data", "onchain_tx.sqlite")
+DEFAULT_ESPLORA_URL = "https://blockstream.info/api"
+
+logger = logging.getLogger("TxLookup")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS txs (
+    txid TEXT PRIMARY KEY,
+    block_height INTEGER,
+    data TEXT
+) WITHOUT ROWID;
+"""
+
+# -----------------------------
+# Explorer backends
+# -----------------------------
+class BloxplorerBackend:
+    """
+    The Blockstream explorer through bloxplorer (what onchaintx.py used).
+    """
+
+    def get(self, txid):
+        from bloxplorer import bitcoin_explorer
+        return bitcoin_explorer.tx.get(txid).data
+
+
+class EsploraBackend:
+    """
+    Any Esplora-compatible HTTP API, e.g. a self-hosted instance.
+    """
+
+    def __init__(self, url=DEFAULT_ESPLORA_URL, timeout=30):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def get(self, txid):
+        with urllib.request.urlopen(f"{self.url}/tx/{txid}", timeout=self.timeout) as response:
+            return json.load(response)
+
+
+class StubBackend:
+    """
+    Offline backend: <txid>.json files from a directory. Counts calls so a
+    rerun can be checked to hit the cache only.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.calls = 0
+
+    def get(self, txid):
+        self.calls += 1
+        with open(os.path.join(self.directory, f"{txid}.json")) as f:
+            return json.load(f)
+
+
+def get_backend(spec):
+    """
+    "bloxplorer", "esplora[:URL]" or "stub:DIRECTORY".
+    """
+    name, _, arg = spec.partition(":")
+    if name == "bloxplorer":
+        return BloxplorerBackend()
+    if name == "esplora":
+        return EsploraBackend(arg or DEFAULT_ESPLORA_URL)
+    if name == "stub":
+        return StubBackend(arg)
+    raise ValueError(f"Unknown explorer backend {spec!r}")
+
+# -----------------------------
+# Cache
+# -----------------------------
+def confirmed(data):
+    return bool((data or {}).get("status", {}).get("confirmed"))
+
+
+class TxCache:
+    """
+    Confirmed transactions by txid in SQLite. Confirmed data does not change,
+    so entries never expire; unconfirmed ones are never stored.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.db.close()
+
+    def get_many(self, txids):
+        found = {}
+        txids = list(txids)
+        with self.lock:
+            for start in range(0, len(txids), 500):
+                chunk = txids[start:start + 500]
+                rows = self.db.execute(
+                    f"SELECT txid, data FROM txs WHERE txid IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update((txid, json.loads(data)) for txid, data in rows)
+        return found
+
+    def put(self, txid, data):
+        if not confirmed(data):
+            return False
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO txs (txid, block_height, data) VALUES (?, ?, ?)",
+                (txid, data["status"].get("block_height"), json.dumps(data))
+            )
+        return True
+
+# -----------------------------
+# Lookup
+# -----------------------------
+def fetch(backend, txid, retries=3, backoff=1.0, logger=logger):
+    for attempt in range(1, retries + 1):
+        try:
+            return backend.get(txid)
+        except Exception:
+            if attempt == retries:
+                logger.exception(f"Lookup of {txid} failed after {attempt} attempts")
+                raise
+            delay = backoff * 2 ** (attempt - 1)
+            logger.warning(f"Lookup of {txid} failed (attempt {attempt}), retrying in {delay:.0f}s")
+            time.sleep(delay)
+
+
+def lookup(txids, cache, backend, workers=8, retries=3, backoff=1.0, logger=logger):
+    """
+    txid -> explorer data for the unique txids. Cached confirmed txs cost no
+    network call; misses are fetched by at most `workers` threads. Failed
+    lookups are logged and left out.
+    """
+    unique = list(dict.fromkeys(t for t in txids if t))
+    with tracing.span("txlookup.cache", txids=len(unique)) as sp:
+        result = cache.get_many(unique)
+        sp.set(hits=len(result))
+    misses = [t for t in unique if t not in result]
+    if not misses:
+        logger.info(f"{len(unique)} transactions, all from cache")
+        return result
+
+    stored = 0
+    with tracing.span("txlookup.fetch", txids=len(misses)):
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="txlookup") as pool:
+            futures = {pool.submit(fetch, backend, t, retries, backoff, logger): t for t in misses}
+            for future, txid in futures.items():
+                try:
+                    data = future.result()
+                except Exception:
+                    continue
+                result[txid] = data
+                stored += cache.put(txid, data)
+    logger.info(f"{len(unique)} transactions: {len(unique) - len(misses)} cached, {len(misses)} fetched, {stored} newly cached")
+    return result
@@ -0,0 +1,52 @@
+"""
+Single entry point for the cl-tools jobs:
+
+    python -m cltools <command> [args...]
+
+Each command runs one of the existing scripts; only the modules that
+script needs are imported, so cron jobs do not pay for the backends of
+the other ones.
+"""
+
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# command -> (script relative to the repository, help, script parses its own args)
+COMMANDS = {
+    'sync-graph': ("5satoshi/store-graph-data.py", "Upload listchannels/listnodes to BigQuery", False),
+    'sync-forwards': ("5satoshi/store-forwards.py", "Sync new forwards to BigQuery", True),
+    'sync-peers': ("fee-updates/peer-updates.py", "Store peer channels (BigQuery or MySQL)", True),
+    'update-fees': ("5satoshi/fee-updates.py", "Update channel fees from balances", False),
+    'centrality': ("5satoshi/betweenness_centrality.py", "Betweenness centrality pipeline", True),
+    'route-compete': ("fee-updates/compatative_route_finder.py", "Estimate routing competition", True),
+    'closures': ("5satoshi/analyse-closure.py", "Show recent channel closures", False),
+    'collect': ("5satoshi/collector.py", "Collect node-local data of several nodes, gossip once", True),
+}
+
+# Modules a command's script must not import (at import time for the scripts
+# with a main(), which load their own backends per run)
+FORBIDDEN_IMPORTS = {
+    'sync-graph': ["graph_tool", "networkx", "google.cloud", "sqlalchemy", "matplotlib", "mysql", "pandas", "pyln"],
+    'sync-forwards': ["graph_tool", "networkx", "sqlalchemy", "matplotlib", "mysql"],
+    'sync-peers': ["graph_tool", "networkx", "google.cloud", "sqlalchemy", "matplotlib", "mysql"],
+    'update-fees': ["graph_tool", "networkx", "google.cloud", "sqlalchemy", "matplotlib", "mysql", "pandas", "pyln"],
+    'centrality': ["networkx", "google.cloud", "sqlalchemy", "matplotlib", "mysql"],
+    'route-compete': ["graph_tool", "google.cloud", "sqlalchemy", "matplotlib", "mysql"],
+    'closures': ["graph_tool", "networkx", "google.cloud", "sqlalchemy", "matplotlib", "mysql", "pandas", "pyln"],
+    'collect': ["graph_tool", "networkx", "google.cloud", "sqlalchemy", "matplotlib", "mysql", "pyln"],
+}
+
+# Cumulative import time allowed for a command's script, in ms: `--help` for
+# scripts with their own argparse, a plain import (workload not run) for the others
+IMPORT_BUDGET_MS = {
+    None: 30,
+    'sync-graph': 80,
+    'update-fees': 80,
+    'closures': 80,
+    'sync-forwards': 1500,
+    'collect': 1500,
+    'sync-peers': 800,
+    'route-compete': 1500,
+    'centrality': 2500,
+}
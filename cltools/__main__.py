@@ -0,0 +1,45 @@
+import argparse
+import os
+import runpy
+import sys
+
+from cltools import COMMANDS, ROOT
+
+
+def run_script(command, args, run_name="__main__"):
+    """
+    Run the command's script as __main__ with its own directory on the
+    path (the scripts import their sibling modules). Any other run_name
+    only imports it, the workload being behind `if __name__ == "__main__"`.
+    """
+    script = os.path.join(ROOT, COMMANDS[command][0])
+    sys.path.insert(0, os.path.dirname(script))
+    sys.argv = [script] + list(args)
+    runpy.run_path(script, run_name=run_name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="cltools", description="cl-tools jobs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, (script, help_text, own_args) in COMMANDS.items():
+        # Scripts with their own argparse get every remaining argument, --help included
+        sub.add_parser(name, help=help_text, description=f"{help_text} ({script})", add_help=not own_args)
+
+    check = sub.add_parser("check-imports", help="Enforce the -X importtime budget of every command")
+    check.add_argument("commands", nargs="*", help="Commands to check (default: all)")
+    check.add_argument("--python", default=sys.executable, help="Interpreter to measure")
+
+    args, rest = parser.parse_known_args(argv)
+    if args.command == "check-imports":
+        if rest:
+            parser.error(f"unrecognized arguments: {' '.join(rest)}")
+        from cltools.importtime import check_all
+        return check_all(args.commands or list(COMMANDS), args.python)
+    if rest and not COMMANDS[args.command][2]:
+        parser.error(f"{args.command} takes no arguments")
+    run_script(args.command, rest)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
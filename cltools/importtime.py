@@ -0,0 +1,95 @@
+"""
+Import time budget of the cltools commands.
+
+Imports every command's script in a fresh `python -X importtime`
+interpreter and fails when the imports after the dispatcher starts exceed
+IMPORT_BUDGET_MS or include a FORBIDDEN_IMPORTS backend. Scripts with
+their own argparse are measured with `--help`; the others take no
+arguments, so the dispatcher would answer `--help` without loading them,
+and they are imported as a module instead (their workload is in main()).
+Run it in CI or before deploying new cron jobs:
+
+    python -m cltools check-imports
+"""
+
+import os
+import re
+import subprocess
+import sys
+
+from cltools import COMMANDS, FORBIDDEN_IMPORTS, IMPORT_BUDGET_MS, ROOT
+
+# Imports the script the way the dispatcher runs it, but not as __main__
+IMPORT_SCRIPT = ("import sys; from cltools.__main__ import run_script; "
+                 "run_script(sys.argv[1], [], run_name='__cltools_import__')")
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def parse(stderr):
+    """
+    (module, level, cumulative_us) for every line of -X importtime output.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        m = LINE.match(line)
+        if m:
+            rows.append((m.group(4), (len(m.group(3)) - 1) // 2, int(m.group(2))))
+    return rows
+
+
+def measure(command, python=sys.executable):
+    """
+    Modules imported and their top-level cumulative time (ms), counting
+    from the import of the cltools package (interpreter startup excluded).
+    """
+    argv = [python, "-X", "importtime"]
+    if command is None:
+        argv += ["-m", "cltools", "--help"]
+    elif COMMANDS[command][2]:
+        argv += ["-m", "cltools", command, "--help"]
+    else:
+        argv += ["-c", IMPORT_SCRIPT, command]
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proc = subprocess.run(argv, cwd=ROOT, env=env, capture_output=True, text=True, timeout=120)
+
+    rows = parse(proc.stderr)
+    start = next((i for i, (name, _, _) in enumerate(rows) if name == "cltools"), 0)
+    # Nested imports are reported before their parent, so look back to the
+    # first line of the block that ends with the cltools package
+    while start > 0 and rows[start - 1][1] > 0:
+        start -= 1
+    rows = rows[start:]
+    total_us = sum(us for _, level, us in rows if level == 0)
+    return [name for name, _, _ in rows], total_us / 1000, proc.returncode
+
+
+def check(command, python=sys.executable):
+    modules, total_ms, returncode = measure(command, python)
+    budget = IMPORT_BUDGET_MS.get(command, IMPORT_BUDGET_MS[None])
+    problems = []
+    if returncode != 0:
+        # e.g. a missing dependency; the import list would be incomplete
+        problems.append(f"import exited with {returncode}")
+    if total_ms > budget:
+        problems.append(f"imports took {total_ms:.0f} ms (budget {budget} ms)")
+    for forbidden in FORBIDDEN_IMPORTS.get(command, []):
+        hits = [m for m in modules if m == forbidden or m.startswith(forbidden + ".")]
+        if hits:
+            problems.append(f"imports {forbidden}")
+    return total_ms, budget, problems
+
+
+def check_all(commands, python=sys.executable):
+    failed = False
+    for command in [None] + list(commands):
+        total_ms, budget, problems = check(command, python)
+        name = command or "(dispatcher)"
+        status = "FAIL" if problems else "ok"
+        print(f"{status:4} {name:15} {total_ms:8.1f} ms / {budget} ms" + (f"  {'; '.join(problems)}" if problems else ""))
+        failed = failed or bool(problems)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(check_all(sys.argv[1:] or list(__import__("cltools").COMMANDS)))
@@ -1,24 +1,38 @@
 #!/usr/bin/python
 
 import sys, os, logging
+import argparse
 import pandas as pd
 from pyln.client import LightningRpc
 
 import helper
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "5satoshi"))
+import bqload
+import tracing
+
 if __name__ == "__main__":
     # execute only if run as a script
-    cfg_file = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Sync gossip channels to BigQuery")
+    parser.add_argument("config", help="Configuration file")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+
+    cfg_file = args.config
     #cfg_file = "channel-updates.conf" #sys.argv[1]
     log_config = helper.read_config("logging",cfg_file)
+    tracing.configure_from_args("channel-updates", args)
 
     rpc = os.environ['HOME']+"/.lightning/bitcoin/lightning-rpc"
     l1 = LightningRpc(rpc)
 
-    channels = l1.listchannels()
+    with tracing.span("rpc.listchannels") as sp:
+        channels = l1.listchannels()
+        sp.set(rows=len(channels["channels"]))
 
-    dfc = pd.DataFrame(channels["channels"])
-    dfc['last_update'] = pd.to_datetime(dfc['last_update'], unit='s')
+    with tracing.span("frame.channels"):
+        dfc = pd.DataFrame(channels["channels"])
+        dfc['last_update'] = pd.to_datetime(dfc['last_update'], unit='s')
 
-    dfc.to_gbq(helper.read_config("bigquery",cfg_file)["table"],if_exists='replace')
+    bqload.upload(dfc, helper.read_config("bigquery",cfg_file)["table"], if_exists='replace')
 
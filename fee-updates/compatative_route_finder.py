@@ -1,51 +1,78 @@
 #!/usr/bin/python
 
-import sys, math, os, random, logging
+import sys, os, random, logging
+import argparse
 import networkx as nx
 import pandas as pd
-import matplotlib.pyplot as plt
-from mysql.connector import MySQLConnection, Error
 from configparser import ConfigParser
 from pyln.client import LightningRpc
 from datetime import datetime
 
-from google.cloud import bigquery
-
 import helper
+import route_sampling
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "5satoshi"))
+import tracing
+from gossip_history import GossipHistory, graph_frame
 
 
-def get_graph_from_cli(rpc=".lightning/bitcoin/lightning-rpc",save=True):
+def graph_from_frame(dfc):
+    with tracing.span("graph.build") as sp:
+        DG = nx.from_pandas_edgelist(dfc,"source","destination",edge_attr=True, create_using=nx.MultiDiGraph())
+        sp.set(nodes=DG.number_of_nodes(), edges=DG.number_of_edges())
+    return DG
+
+
+def get_graph_from_cli(rpc=".lightning/bitcoin/lightning-rpc",save=True,history=None):
     
     l1 = LightningRpc(rpc)
     
-    channels = l1.listchannels()
+    with tracing.span("rpc.listchannels") as sp:
+        channels = l1.listchannels()
+        sp.set(rows=len(channels["channels"]))
     
     dfc = pd.DataFrame(channels["channels"])
-    
-    DG = nx.from_pandas_edgelist(dfc,"source","destination",edge_attr=True, create_using=nx.MultiDiGraph())
+    DG = graph_from_frame(dfc)
     
     if save:
         prefix = datetime.now()
-        nx.write_gpickle(DG,"fee-optimizer-data/" + prefix.strftime("%Y-%m-%dT%H:%M:%S")+'_lightning.pkl')
+        if history:
+            ### only changed channels are stored, see gossip_history.py
+            GossipHistory(history).record("channels", dfc, prefix.astimezone())
+        else:
+            nx.write_gpickle(DG,"fee-optimizer-data/" + prefix.strftime("%Y-%m-%dT%H:%M:%S")+'_lightning.pkl')
     
     return DG
 
 
-def run_route_finding(conf):
+def get_graph_from_history(history, at):
+    dfc = GossipHistory(history).state_at("channels", at)
+    if dfc is None:
+        raise ValueError(f"No gossip recorded in {history} before {at}")
+    return graph_from_frame(graph_frame(dfc))
+
+
+def run_route_finding(conf, G=None):
     version = "0.1"
     
     data_conf = helper.read_config("data",conf)
     storage = data_conf["storage"]
     
-    G = nx.MultiDiGraph()
     exec_time = datetime.now()
     
-    if data_conf['method'] == 'file':
-        G = nx.read_gpickle(data_conf['file'])
+    if G is not None:
+        ### graph handed over by the caller, e.g. the scheduler's snapshot
+        pass
+    elif data_conf['method'] == 'file':
         exec_time = datetime.strptime(data_conf['datetime'], "%Y-%m-%d %H:%M:%S")### override time of execution by time of data pull as defined in config
+        if data_conf.get('history'):
+            ### reconstruct the graph as it was at datetime (local time)
+            G = get_graph_from_history(data_conf['history'], exec_time.astimezone())
+        else:
+            G = nx.read_gpickle(data_conf['file'])
     elif data_conf['method'] == 'cli':
         rpc = os.environ['HOME']+"/.lightning/bitcoin/lightning-rpc"
-        G = get_graph_from_cli(rpc, data_conf['save'])
+        G = get_graph_from_cli(rpc, data_conf['save'], data_conf.get('history'))
     
     active_edges = (
         (source,dest,data)
@@ -54,10 +81,12 @@ def run_route_finding(conf):
         if data['active']==True
     )
     
-    wDG = nx.MultiDiGraph(active_edges)
-    
-    # clean for connected component of mynode
-    DG = wDG.subgraph(max(nx.strongly_connected_components(wDG),key=len))
+    with tracing.span("scc") as sp:
+        wDG = nx.MultiDiGraph(active_edges)
+        
+        # clean for connected component of mynode
+        DG = wDG.subgraph(max(nx.strongly_connected_components(wDG),key=len))
+        sp.set(nodes=DG.number_of_nodes(), edges=DG.number_of_edges())
     
     mynode = helper.read_config("node",conf)["id"]
     
@@ -69,6 +98,36 @@ def run_route_finding(conf):
         channels[dest] = DG[source][dest][key]['short_channel_id']
     
     
+    exec_date = exec_time.strftime('%Y-%m-%d %H:%M:%S')
+    
+    if data_conf.get('sampling', 'uniform') == 'stratified':
+        ### stratified sources/amounts with early stopping, see route_sampling.py
+        sampler = route_sampling.StratifiedSampler(DG, mynode, channels)
+        batch = int(data_conf.get('batch', 64))
+        val = []
+        for i_node, tx_sat, found in sampler.run(
+            batch=batch,
+            max_runs=int(data_conf.get('max_runs', 10 * int(data_conf['number_of_runs']))),
+            rel_tol=float(data_conf.get('precision', 0.05)),
+            abs_tol=float(data_conf.get('abs_precision', 100)),
+            min_routes=int(data_conf.get('min_routes', 30)),
+        ):
+            val.extend(rows(storage, i_node, mynode, tx_sat, found, exec_date, "0.2"))
+            if len(val) >= 1000:
+                submit(conf, storage, val)
+                val = []
+        submit(conf, storage, val)
+        
+        ### the per-sample rows above oversample the strata near mynode and carry no
+        ### weight; the weighted estimates are stored separately for aggregation
+        estimates = sampler.estimates()
+        hits = sum(s.hits for s in sampler.strata)
+        logging.info(f"{sampler.samples} samples, {hits} routed through {mynode}")
+        for row in estimates.itertuples():
+            logging.info(f"{row.type} {row.key}: advantage {row.advantage:.0f} msat [{row.ci_low:.0f}, {row.ci_high:.0f}] over {row.routes} routes")
+        submit_estimates(conf, storage, estimates, mynode, sampler.samples, exec_date, "0.2")
+        return estimates
+    
     nodes = list(DG.nodes())
     
     for i in range(int(data_conf['number_of_runs'])):
@@ -77,96 +136,105 @@ def run_route_finding(conf):
         
         tx_sat = random.randint(1,1000000)
         
-        i_DG = nx.MultiDiGraph(DG)
-        
-        for source, dest, key, data in i_DG.out_edges(i_node,keys=True,data=True):
-            i_DG[source][dest][key]['base_fee_millisatoshi'] = 0
-            i_DG[source][dest][key]['fee_per_millionth'] = 0
-        
         logging.info("---")
         logging.info("TX amount: " + str(tx_sat))
         
-        useless_edges = []
-        # calculate fee per tx size
-        for source, dest, key, data in i_DG.out_edges(keys=True,data=True):
-            if i_DG[source][dest][key]['satoshis'] < 2.5*tx_sat:
-                useless_edges.append((source, dest, key))
-            else:
-                a = i_DG[source][dest][key]['base_fee_millisatoshi']
-                b = i_DG[source][dest][key]['fee_per_millionth']/1000000
-                i_DG[source][dest][key]['fee'] = math.floor(a + tx_sat*b*1000)
-        
-        for s,d,k in useless_edges:
-            i_DG.remove_edge(s, d, k)
-        
-        found = False
-        destinations = []
-        
-        for i_nodes in nx.strongly_connected_components(i_DG):
-            if i_node in i_nodes:
-                break
-        
-        ii_DG = i_DG.subgraph(i_nodes)
+        with tracing.span("dijkstra", tx_sat=tx_sat):
+            found = route_sampling.compete(DG, mynode, channels, i_node, tx_sat)
         
-        fees, paths = nx.single_source_dijkstra(ii_DG,i_node,weight="fee")
-        for dest,path in paths.items():
-            if mynode in path and dest!=mynode:
-                found=True
-                channel = channels[path[path.index(mynode)+1]]
-                peer = path[path.index(mynode)-1]
-                destinations.append((dest,peer,channel))
-        
-        comp_path = comp_fees = {}
         if found:
-            i_DG2 = nx.MultiDiGraph(ii_DG)
-            i_DG2.remove_node(mynode)
-            comp_fees, comp_paths = nx.single_source_dijkstra(i_DG2,i_node,weight="fee")
-            
-            val = []
-            for to, peer, ch in destinations:
-                theirs = comp_fees.get(to)
-                if theirs:
-                    fee = theirs - fees[to]
-                    if storage=="bigquery":
-                        val.append({'source':i_node,'destination':to,'node':mynode,'peer':peer,'channel_id':ch,'tx':tx_sat,'fee':fee,'gossip_date':exec_time.strftime('%Y-%m-%d %H:%M:%S'),'version':version})
-                    elif storage=="mysql":
-                        val.append((i_node,to,mynode,peer,ch,tx_sat,fee,exec_time.strftime('%Y-%m-%d %H:%M:%S'),version))
-                    else:
-                        logging.info({'source':i_node,'destination':to,'node':mynode,'peer':peer,'channel_id':ch,'tx':tx_sat,'fee':fee,'gossip_date':exec_time.strftime('%Y-%m-%d %H:%M:%S'),'version':version})
-            
+            val = rows(storage, i_node, mynode, tx_sat, found, exec_date, version)
             if val==[]:
                 logging.info("No compatative route")
             else:
-                if storage=="bigquery":
-                    bq_client = bigquery.Client()
-                    table = bq_client.get_table(helper.read_config("bigquery",conf)["table"])  ###todo move into config
-                    errors = bq_client.insert_rows_json(table, val)
-                    if errors == []:
-                        logging.info("Data successfully submitted to bigquery")
-                    else:
-                        logging.error(errors)
-                        
-                elif storage=="mysql":
-                    db_config = helper.read_config("mysql",conf)
-                    conn = MySQLConnection(**db_config)
-                    
-                    mycursor = conn.cursor()
-                    
-                    sql = "INSERT INTO routing_competition (source, destination, node, peer, channel_id, tx, fee, gossip_date, version) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"
-                    mycursor.executemany(sql, val)
-                    
-                    conn.commit()
-                    
-                    mycursor.close()
-                    conn.close()
-
+                submit(conf, storage, val)
+
+
+def rows(storage, i_node, mynode, tx_sat, found, exec_date, version):
+    val = []
+    for to, peer, ch, fee in found:
+        if storage=="bigquery":
+            val.append({'source':i_node,'destination':to,'node':mynode,'peer':peer,'channel_id':ch,'tx':tx_sat,'fee':fee,'gossip_date':exec_date,'version':version})
+        elif storage=="mysql":
+            val.append((i_node,to,mynode,peer,ch,tx_sat,fee,exec_date,version))
+        else:
+            logging.info({'source':i_node,'destination':to,'node':mynode,'peer':peer,'channel_id':ch,'tx':tx_sat,'fee':fee,'gossip_date':exec_date,'version':version})
+    return val
+
+
+def submit(conf, storage, val):
+    if not val:
+        return
+    # Backends are imported on demand, only one of them is needed per run
+    if storage=="bigquery":
+        from google.cloud import bigquery
+        bq_client = bigquery.Client()
+        table = bq_client.get_table(helper.read_config("bigquery",conf)["table"])  ###todo move into config
+        with tracing.span("upload", rows=len(val)):
+            errors = bq_client.insert_rows_json(table, val)
+        if errors == []:
+            logging.info("Data successfully submitted to bigquery")
+        else:
+            logging.error(errors)
+            
+    elif storage=="mysql":
+        import mysqlbulk
+        # Pooled engine, reused across runs
+        engine = mysqlbulk.get_engine(helper.read_config("mysql",conf))
+        
+        sql = "INSERT INTO routing_competition (source, destination, node, peer, channel_id, tx, fee, gossip_date, version) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"
+        with tracing.span("upload.mysql", rows=len(val)):
+            with engine.begin() as conn:
+                conn.exec_driver_sql(sql, val)
+
+def submit_estimates(conf, storage, estimates, mynode, samples, exec_date, version):
+    """
+    Weighted fee advantage per peer/channel of a stratified run, one row per
+    key, to [bigquery] estimates_table (default <table>_estimates) or the
+    MySQL routing_competition_estimates table.
+    """
+    if estimates.empty:
+        return
+    val = [
+        {'node': mynode, 'type': row.type, 'target': row.key, 'advantage': float(row.advantage),
+         'ci_low': float(row.ci_low), 'ci_high': float(row.ci_high), 'routes': int(row.routes),
+         'route_share': float(row.route_share), 'samples': int(samples), 'gossip_date': exec_date, 'version': version}
+        for row in estimates.itertuples()
+    ]
+    if storage=="bigquery":
+        from google.cloud import bigquery
+        bq_config = helper.read_config("bigquery",conf)
+        bq_client = bigquery.Client()
+        table = bq_client.get_table(bq_config.get("estimates_table", bq_config["table"] + "_estimates"))
+        with tracing.span("upload.estimates", rows=len(val)):
+            errors = bq_client.insert_rows_json(table, val)
+        if errors == []:
+            logging.info("Estimates successfully submitted to bigquery")
+        else:
+            logging.error(errors)
+    elif storage=="mysql":
+        import mysqlbulk
+        engine = mysqlbulk.get_engine(helper.read_config("mysql",conf))
+        columns = list(val[0])
+        sql = f"INSERT INTO routing_competition_estimates ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+        with tracing.span("upload.mysql.estimates", rows=len(val)):
+            with engine.begin() as conn:
+                conn.exec_driver_sql(sql, [tuple(v[c] for c in columns) for v in val])
+    else:
+        for v in val:
+            logging.info(v)
 
 if __name__ == "__main__":
     # execute only if run as a script
-    cfg_file = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Estimate routing competition for our node")
+    parser.add_argument("config", help="Configuration file")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    cfg_file = args.config
     
     log_config = helper.read_config("logging",cfg_file)
     logging.basicConfig(filename=os.environ['HOME']+"/"+log_config["path"], level=logging.INFO,format='%(asctime)s - %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',filemode = 'a')
+    tracing.configure_from_args("compatative_route_finder", args)
 
     run_route_finding(cfg_file)
 
@@ -4,11 +4,17 @@ import math, time
 import sys, os, logging
 import random
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "5satoshi"))
+import tracing
+
 logging.basicConfig(filename=os.environ['HOME']+'/logs/fees.log', level=logging.INFO,format='%(asctime)s - %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',filemode = 'a')
+tracing.configure("fee-updates-legacy")
 
 l1 = LightningRpc(os.environ['HOME']+"/.lightning/bitcoin/lightning-rpc")
 
-peers = l1.listpeers()
+with tracing.span("rpc.listpeers") as sp:
+    peers = l1.listpeers()
+    sp.set(rows=len(peers["peers"]))
 
 dfp = pandas.DataFrame(peers["peers"])
 
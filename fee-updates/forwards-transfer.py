@@ -4,25 +4,50 @@ import pandas as pd
 import math, time
 import sys, os, logging
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from datetime import datetime, date, timedelta
 
+import argparse
+
 import helper
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "5satoshi"))
+import bqload
+import tracing
+from forwards_warehouse import ForwardsWarehouse, yesterday_range
+
 if __name__ == "__main__":
-    cfg_file = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Copy yesterday's forwards from MySQL to BigQuery")
+    parser.add_argument("config", help="Configuration file")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    tracing.configure_from_args("forwards-transfer", args)
+
+    cfg_file = args.config
     #cfg_file = "forwards-transfer.conf"
-    db_config = helper.read_config("mysql",cfg_file)
-    
-    engine = create_engine("mysql+pymysql://{user}:{pw}@{host}/{db}".format(host=db_config["host"], db=db_config["database"], user=db_config["user"], pw=db_config["password"]))
+    # One definition of yesterday for both sources: the UTC day, as stored
+    start, end = yesterday_range()
     
-    table_name = db_config["table"]
-    table_df = pd.read_sql_table(
-        table_name,
-        con=engine
-    )
+    if helper.has_config("warehouse",cfg_file):
+        # Read only yesterday's partition of the local forwards warehouse
+        wh = ForwardsWarehouse(helper.read_config("warehouse",cfg_file)["path"])
+        filtered_df = wh.query(start, end)
     
-    yesterday = date.today() - timedelta(days=1)
-    filtered_df = table_df.loc[(table_df["received_time"].dt.date == yesterday)]
+    else:
+        db_config = helper.read_config("mysql",cfg_file)
+        
+        engine = create_engine("mysql+pymysql://{user}:{pw}@{host}/{db}".format(host=db_config["host"], db=db_config["database"], user=db_config["user"], pw=db_config["password"]))
+        
+        # Filter in MySQL instead of reading the whole table
+        table_name = db_config["table"]
+        with tracing.span("fetch.mysql", table=table_name) as sp:
+            filtered_df = pd.read_sql(
+                text("SELECT * FROM `{0}` WHERE received_time >= :start AND received_time < :end".format(table_name)),
+                con=engine,
+                # received_time is a naive UTC datetime in MySQL (see forwards-updates.py)
+                params={'start': start.tz_localize(None).to_pydatetime(), 'end': end.tz_localize(None).to_pydatetime()},
+                parse_dates=["received_time", "resolved_time"]
+            )
+            sp.set(rows=len(filtered_df))
     
-    filtered_df.to_gbq(helper.read_config("bigquery",cfg_file)["table"],if_exists='append')
+    bqload.upload(filtered_df, helper.read_config("bigquery",cfg_file)["table"], if_exists='append')
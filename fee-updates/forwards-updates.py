@@ -2,34 +2,62 @@ from pyln.client import LightningRpc
 import pandas
 import math, time
 import sys, os, logging
-from sqlalchemy import create_engine
 from datetime import datetime, date, timedelta
 
+import argparse
+
 import helper
 
-cfg_file = sys.argv[1]
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "5satoshi"))
+import tracing
+
+parser = argparse.ArgumentParser(description="Store yesterday's forwards")
+parser.add_argument("config", help="Configuration file")
+tracing.add_arguments(parser)
+args = parser.parse_args()
+
+cfg_file = args.config
 #cfg_file = "forwardings.conf"
 
 log_config = helper.read_config("logging",cfg_file)
 logging.basicConfig(filename=os.environ['HOME']+'/'+log_config["path"], level=logging.INFO,format='%(asctime)s - %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',filemode = 'a')
+tracing.configure_from_args("forwards-updates", args)
 
 l1 = LightningRpc(os.environ['HOME']+"/.lightning/bitcoin/lightning-rpc")
 
-forwards = l1.listforwards(timelimit=str(int(time.time())-60*60*24*7)+"000000000")
-
-dfp = pandas.DataFrame(forwards["forwards"])
-dfp["received_time"] = pandas.to_datetime(dfp["received_time"], unit = 's')
-dfp["resolved_time"] = pandas.to_datetime(dfp["resolved_time"], unit = 's')
+if helper.has_config("warehouse",cfg_file):
+    # Incremental sync into the local warehouse, then read only yesterday's partition
+    from forwards_warehouse import ForwardsWarehouse, yesterday_range
+    wh = ForwardsWarehouse(helper.read_config("warehouse",cfg_file)["path"])
+    wh.sync(l1)
+    start, end = yesterday_range()
+    filtered_df = wh.query(start, end)
+    filtered_df["received_time"] = filtered_df["received_time"].dt.tz_localize(None)
+    filtered_df["resolved_time"] = filtered_df["resolved_time"].dt.tz_localize(None)
 
-yesterday = date.today() - timedelta(days=1)
-filtered_df = dfp.loc[(dfp["received_time"].dt.date == yesterday)]
+else:
+    with tracing.span("rpc.listforwards") as sp:
+        forwards = l1.listforwards(timelimit=str(int(time.time())-60*60*24*7)+"000000000")
+        sp.set(rows=len(forwards["forwards"]))
+    
+    with tracing.span("frame.forwards"):
+        dfp = pandas.DataFrame(forwards["forwards"])
+        dfp["received_time"] = pandas.to_datetime(dfp["received_time"], unit = 's')
+        dfp["resolved_time"] = pandas.to_datetime(dfp["resolved_time"], unit = 's')
+    
+    yesterday = date.today() - timedelta(days=1)
+    filtered_df = dfp.loc[(dfp["received_time"].dt.date == yesterday)]
 
 db_config = helper.read_config("db",cfg_file)
+# Backends are imported on demand, only one of them is needed per run
 if db_config["database"]=="bq":
-    filtered_df.to_gbq(db_config["table"],if_exists='append')
+    import bqload
+    bqload.upload(filtered_df, db_config["table"], if_exists='append')
     
 else:
-    # Create SQLAlchemy engine to connect to MySQL Database
-    engine = create_engine("mysql+pymysql://{user}:{pw}@{host}/{db}".format(host=db_config["host"], db=db_config["database"], user=db_config["user"], pw=db_config["password"]))
-    # Convert dataframe to sql table
-    filtered_df.to_sql('forwardings', engine, index=False, if_exists="append")
+    import mysqlbulk
+    # Pooled SQLAlchemy engine for the MySQL Database
+    engine = mysqlbulk.get_engine(db_config)
+    # Bulk append (LOAD DATA LOCAL INFILE, batched INSERT as fallback)
+    with tracing.span("upload.mysql", rows=len(filtered_df)):
+        mysqlbulk.write(filtered_df, 'forwardings', engine)
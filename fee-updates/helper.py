@@ -22,4 +22,14 @@ def read_config(section, filename):
     
     return d
 
+def has_config(section, filename):
+    """ Check whether the configuration file has a section
+    :param filename: name of the configuration file
+    :param section: section to look for
+    :return: True if the section exists
+    """
+    parser = ConfigParser()
+    parser.read(filename)
+    return parser.has_section(section)
+
 # ----------------
@@ -0,0 +1,273 @@
+#!/usr/bin/python
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.engine import URL
+
+logger = logging.getLogger("MySQLBulk")
+
+_engines = {}
+
+# -----------------------------
+# Engine
+# -----------------------------
+def get_engine(db_config, pool_size=5):
+    """
+    Pooled SQLAlchemy engine for a [mysql]/[db] config section, shared per
+    process. A `url` key (e.g. sqlite:///peers.db) overrides host/user/...
+    """
+    if 'url' in db_config:
+        url = db_config['url']
+    else:
+        url = URL.create(
+            "mysql+pymysql",
+            username=db_config["user"],
+            password=db_config["password"],
+            host=db_config["host"],
+            port=int(db_config["port"]) if "port" in db_config else None,
+            database=db_config["database"],
+        )
+
+    key = str(url)
+    if key not in _engines:
+        kwargs = {'pool_pre_ping': True}
+        if str(url).startswith("mysql"):
+            kwargs.update(
+                pool_size=pool_size,
+                pool_recycle=3600,
+                connect_args={'local_infile': True},
+            )
+        _engines[key] = create_engine(url, **kwargs)
+    return _engines[key]
+
+
+def is_mysql(engine):
+    return engine.dialect.name in ("mysql", "mariadb")
+
+
+def quote(engine, name):
+    return engine.dialect.identifier_preparer.quote(name)
+
+# -----------------------------
+# Rows
+# -----------------------------
+def _python_value(value):
+    if isinstance(value, (list, dict, tuple)):
+        return json.dumps(value, default=str)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def records(df):
+    """
+    Row tuples of plain Python values (None for missing) that any DB-API
+    driver can bind.
+    """
+    columns = []
+    for name in df.columns:
+        col = df[name]
+        if pd.api.types.is_datetime64_any_dtype(col):
+            values = [None if pd.isna(v) else v.to_pydatetime() for v in col]
+        else:
+            values = [_python_value(v) for v in col.astype(object).where(col.notna(), None)]
+        columns.append(values)
+    return list(zip(*columns))
+
+
+def _tsv_field(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+    if isinstance(value, date):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+# -----------------------------
+# Write paths
+# -----------------------------
+def ensure_table(df, table, engine):
+    if not inspect(engine).has_table(table):
+        df.head(0).to_sql(table, engine, index=False)
+
+
+def insert_batched(df, table, engine, batch_size=5000):
+    """
+    Multi-row INSERT in batches (pymysql rewrites executemany into
+    INSERT ... VALUES (...), (...)).
+    """
+    if df.empty:
+        return 0
+    placeholder = "%s" if engine.dialect.paramstyle in ("format", "pyformat") else "?"
+    cols = ", ".join(quote(engine, c) for c in df.columns)
+    sql = f"INSERT INTO {quote(engine, table)} ({cols}) VALUES ({', '.join([placeholder] * len(df.columns))})"
+
+    rows = records(df)
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        for i in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[i:i + batch_size])
+        conn.commit()
+        cursor.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return len(rows)
+
+
+def load_data_infile(df, table, engine, chunk_rows=50000):
+    """
+    Stream the frame as TSV into a temporary file and bulk load it with
+    LOAD DATA LOCAL INFILE. Needs local_infile enabled on the server.
+    """
+    if df.empty:
+        return 0
+    with tempfile.NamedTemporaryFile("w", suffix=".tsv", encoding="utf-8", delete=False) as f:
+        path = f.name
+        for start in range(0, len(df), chunk_rows):
+            for row in records(df.iloc[start:start + chunk_rows]):
+                f.write("\t".join(_tsv_field(v) for v in row))
+                f.write("\n")
+
+    cols = ", ".join(quote(engine, c) for c in df.columns)
+    sql = (
+        f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {quote(engine, table)} "
+        "CHARACTER SET utf8mb4 "
+        "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' "
+        f"LINES TERMINATED BY '\\n' ({cols})"
+    )
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql)
+        conn.commit()
+        cursor.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+        os.remove(path)
+    return len(df)
+
+
+def write(df, table, engine, method="auto", batch_size=5000):
+    """
+    Append df to table. method is "infile", "insert" or "auto" (LOAD DATA on
+    MySQL, falling back to batched INSERT if the server refuses it).
+    """
+    ensure_table(df, table, engine)
+    if method == "auto":
+        method = "infile" if is_mysql(engine) else "insert"
+
+    if method == "infile":
+        try:
+            return load_data_infile(df, table, engine)
+        except Exception:
+            logger.warning(f"LOAD DATA LOCAL INFILE into {table} failed, falling back to batched INSERT", exc_info=True)
+    return insert_batched(df, table, engine, batch_size)
+
+
+def swap_table(df, table, engine, method="auto"):
+    """
+    Replace table contents by loading into a staging table and renaming it
+    into place, so readers never see a missing or half-filled table.
+    """
+    staging = f"{table}_staging"
+    old = f"{table}_old"
+    q_table, q_staging, q_old = quote(engine, table), quote(engine, staging), quote(engine, old)
+
+    df.head(0).to_sql(staging, engine, index=False, if_exists="replace")
+    write(df, staging, engine, method)
+
+    exists = inspect(engine).has_table(table)
+    with engine.begin() as conn:
+        if is_mysql(engine):
+            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {q_old}")
+            if exists:
+                # Multi-table RENAME is atomic in MySQL
+                conn.exec_driver_sql(f"RENAME TABLE {q_table} TO {q_old}, {q_staging} TO {q_table}")
+                conn.exec_driver_sql(f"DROP TABLE {q_old}")
+            else:
+                conn.exec_driver_sql(f"RENAME TABLE {q_staging} TO {q_table}")
+        else:
+            # Transactional DDL (SQLite, PostgreSQL)
+            if exists:
+                conn.exec_driver_sql(f"DROP TABLE {q_table}")
+            conn.exec_driver_sql(f"ALTER TABLE {q_staging} RENAME TO {q_table}")
+    return len(df)
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+def sample_forwards(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    now = pd.Timestamp.now().floor("s")
+    return pd.DataFrame({
+        'created_index': np.arange(rows),
+        'in_channel': [f"{b}x{t}x0" for b, t in zip(rng.integers(700000, 900000, rows), rng.integers(0, 3000, rows))],
+        'out_channel': [f"{b}x{t}x1" for b, t in zip(rng.integers(700000, 900000, rows), rng.integers(0, 3000, rows))],
+        'in_msat': rng.integers(1000, 10 ** 10, rows),
+        'out_msat': rng.integers(1000, 10 ** 10, rows),
+        'fee_msat': rng.integers(0, 10 ** 6, rows),
+        'status': rng.choice(["settled", "failed", "local_failed"], rows),
+        'received_time': now - pd.to_timedelta(rng.integers(0, 86400, rows), unit="s"),
+        'resolved_time': now,
+    })
+
+
+def benchmark(url, rows, batch_size=5000):
+    engine = get_engine({'url': url})
+    df = sample_forwards(rows)
+    results = {}
+
+    def timed(name, func):
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {quote(engine, 'bench_forwards')}")
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        results[name] = {'seconds': round(elapsed, 3), 'rows_per_s': round(rows / elapsed)}
+        logger.info(f"{name}: {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s)")
+
+    timed("to_sql", lambda: df.to_sql("bench_forwards", engine, index=False, if_exists="append"))
+    timed("insert_batched", lambda: write(df, "bench_forwards", engine, "insert", batch_size))
+    if is_mysql(engine):
+        timed("load_data_infile", lambda: write(df, "bench_forwards", engine, "infile"))
+    timed("swap_table", lambda: swap_table(df, "bench_forwards", engine))
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {quote(engine, 'bench_forwards')}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark MySQL bulk writes against DataFrame.to_sql")
+    parser.add_argument("--url", default="sqlite:///bench_forwards.db", help="SQLAlchemy URL of the target database")
+    parser.add_argument("--rows", type=int, default=100000, help="Number of generated forwards")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows per INSERT batch")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    print(json.dumps(benchmark(args.url, args.rows, args.batch_size), indent=2))
@@ -1,24 +1,38 @@
 #!/usr/bin/python
 
 import sys, os, logging
+import argparse
 import pandas as pd
 from pyln.client import LightningRpc
 
 import helper
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "5satoshi"))
+import bqload
+import tracing
+
 if __name__ == "__main__":
     # execute only if run as a script
-    cfg_file = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Sync gossip nodes to BigQuery")
+    parser.add_argument("config", help="Configuration file")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+
+    cfg_file = args.config
     #cfg_file = "nodes-updates.conf"
     log_config = helper.read_config("logging",cfg_file)
+    tracing.configure_from_args("nodes-updates", args)
 
     rpc = os.environ['HOME']+"/.lightning/bitcoin/lightning-rpc"
     l1 = LightningRpc(rpc)
 
-    nodes = l1.listnodes()
+    with tracing.span("rpc.listnodes") as sp:
+        nodes = l1.listnodes()
+        sp.set(rows=len(nodes["nodes"]))
 
-    dfn = pd.DataFrame(nodes["nodes"])
-    dfn['last_timestamp'] = pd.to_datetime(dfn['last_timestamp'], unit='s')
+    with tracing.span("frame.nodes"):
+        dfn = pd.DataFrame(nodes["nodes"])
+        dfn['last_timestamp'] = pd.to_datetime(dfn['last_timestamp'], unit='s')
 
-    dfn.to_gbq(helper.read_config("bigquery",cfg_file)["table"],if_exists='replace')
+    bqload.upload(dfn, helper.read_config("bigquery",cfg_file)["table"], if_exists='replace')
 
@@ -2,32 +2,49 @@ from pyln.client import LightningRpc
 import pandas
 import math, time
 import sys, os, logging
-from sqlalchemy import create_engine
 from datetime import datetime, date, timedelta
 
+import argparse
+
 import helper
 
-cfg_file = sys.argv[1]
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "5satoshi"))
+import tracing
+
+parser = argparse.ArgumentParser(description="Store peer channels")
+parser.add_argument("config", help="Configuration file")
+tracing.add_arguments(parser)
+args = parser.parse_args()
+
+cfg_file = args.config
 #cfg_file = "peers.conf"
 
 log_config = helper.read_config("logging",cfg_file)
 logging.basicConfig(filename=os.environ['HOME']+'/'+log_config["path"], level=logging.INFO,format='%(asctime)s - %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',filemode = 'a')
+tracing.configure_from_args("peer-updates", args)
 
 
 l1 = LightningRpc(os.environ['HOME']+"/.lightning/bitcoin/lightning-rpc")
 
-peers = l1.listpeers()
+with tracing.span("rpc.listpeers") as sp:
+    peers = l1.listpeers()
+    sp.set(rows=len(peers["peers"]))
 
-dfp = pandas.json_normalize(peers["peers"],record_path=["channels"],meta=['id', 'connected'],sep="_")
-dfp = dfp.drop(columns=['features', 'state_changes','status','htlcs'])
+with tracing.span("frame.peers"):
+    dfp = pandas.json_normalize(peers["peers"],record_path=["channels"],meta=['id', 'connected'],sep="_")
+    dfp = dfp.drop(columns=['features', 'state_changes','status','htlcs'])
 
 db_config = helper.read_config("db",cfg_file)
+# Backends are imported on demand, only one of them is needed per run
 if db_config["database"]=="bq":
-    dfp.to_gbq(db_config["table"],if_exists='replace')
+    import bqload
+    bqload.upload(dfp, db_config["table"], if_exists='replace')
     
 else:
-    # Create SQLAlchemy engine to connect to MySQL Database
-    engine = create_engine("mysql+pymysql://{user}:{pw}@{host}/{db}".format(host=db_config["host"], db=db_config["database"], user=db_config["user"], pw=db_config["password"]))
-    # Convert dataframe to sql table
-    dfp.to_sql('peers', engine, index=False, if_exists="replace")
+    import mysqlbulk
+    # Pooled SQLAlchemy engine for the MySQL Database
+    engine = mysqlbulk.get_engine(db_config)
+    # Load into a staging table and swap it in atomically
+    with tracing.span("upload.mysql", rows=len(dfp)):
+        mysqlbulk.swap_table(dfp, 'peers', engine)
 
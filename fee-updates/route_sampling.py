@@ -0,0 +1,196 @@
+#!/usr/bin/python
+"""
+Stratified, adaptive sampling for compatative_route_finder.py.
+
+The uniform loop draws (source, tx_sat) pairs that mostly never route
+through our node. Here sources are stratified by their hop distance to
+our node and amounts by decade; every round puts more samples into the
+strata that route through us, and each sample is weighted back to the
+uniform draw so the estimates stay those of the original loop. Sampling
+stops once the mean fee advantage of every channel and peer is known to
+the requested precision.
+"""
+
+import logging
+import math
+import random
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+AMOUNT_BINS = [(1, 1000), (1001, 10000), (10001, 100000), (100001, 1000000)]
+DISTANCE_BINS = [1, 2, 3, 4]   # hops to our node; the last bin is "4 or more"
+Z = {0.9: 1.645, 0.95: 1.960, 0.99: 2.576}
+
+# -----------------------------
+# One sample
+# -----------------------------
+def fee_weight(source, tx_sat):
+    def weight(u, v, edges):
+        if u == source:
+            return 0
+        return min(
+            math.floor(d['base_fee_millisatoshi'] + tx_sat * d['fee_per_millionth'] / 1000000 * 1000)
+            for d in edges.values()
+        )
+    return weight
+
+
+def compete(DG, mynode, channels, source, tx_sat):
+    """
+    (destination, peer, channel, fee advantage) of every destination the
+    source reaches through our node, against the cheapest route avoiding
+    it. Works on views of DG: channels below 2.5 * tx_sat are hidden and
+    destinations are limited to the source's strongly connected component.
+    """
+    if source == mynode:
+        return []
+    view = nx.subgraph_view(DG, filter_edge=lambda u, v, k: DG[u][v][k]['satoshis'] >= 2.5 * tx_sat)
+    back = nx.ancestors(view, source)
+    weight = fee_weight(source, tx_sat)
+
+    fees, paths = nx.single_source_dijkstra(view, source, weight=weight)
+    destinations = []
+    for dest, path in paths.items():
+        if dest in back and mynode in path and dest != mynode:
+            at = path.index(mynode)
+            destinations.append((dest, path[at - 1], channels[path[at + 1]]))
+    if not destinations:
+        return []
+
+    others = nx.subgraph_view(view, filter_node=lambda n: n != mynode)
+    comp_fees, _ = nx.single_source_dijkstra(others, source, weight=weight)
+    found = []
+    for dest, peer, channel in destinations:
+        theirs = comp_fees.get(dest)
+        if theirs:
+            found.append((dest, peer, channel, theirs - fees[dest]))
+    return found
+
+# -----------------------------
+# Stratified sampler
+# -----------------------------
+class Stratum:
+    def __init__(self, sources, amounts, weight):
+        self.sources = sources
+        self.amounts = amounts
+        self.weight = weight
+        self.n = 0
+        self.hits = 0
+
+    def hit_rate(self):
+        # Beta(1, 1) prior so unexplored strata keep a chance
+        return (self.hits + 1) / (self.n + 2)
+
+
+class StratifiedSampler:
+    """
+    Per key (('channel', scid) or ('peer', node)) the stratified ratio
+    estimate of the mean fee advantage per routed destination, with its
+    linearized variance. Per stratum h and key the sums of x (destinations
+    through the key in one sample), y (their summed advantage), x², y², xy
+    are kept; samples without the key add zeros.
+    """
+
+    def __init__(self, DG, mynode, channels, rng=random, amount_bins=AMOUNT_BINS, distance_bins=DISTANCE_BINS):
+        self.DG = DG
+        self.mynode = mynode
+        self.channels = channels
+        self.rng = rng
+
+        hops = nx.single_source_shortest_path_length(DG.reverse(copy=False), mynode)
+        by_distance = {d: [] for d in distance_bins}
+        for node in DG.nodes():
+            if node == mynode:
+                continue
+            d = min(hops.get(node, distance_bins[-1]), distance_bins[-1])
+            by_distance[d].append(node)
+        total_nodes = sum(len(v) for v in by_distance.values())
+        total_amounts = amount_bins[-1][1] - amount_bins[0][0] + 1
+
+        self.strata = [
+            Stratum(nodes, (lo, hi), len(nodes) / total_nodes * (hi - lo + 1) / total_amounts)
+            for nodes in by_distance.values() if nodes
+            for lo, hi in amount_bins
+        ]
+        self.sums = {}
+
+    @property
+    def samples(self):
+        return sum(s.n for s in self.strata)
+
+    def allocate(self, batch):
+        """
+        Samples per stratum for the next round: proportional to the stratum's
+        weight times the square root of its hit rate, at least one each.
+        """
+        scores = np.array([s.weight * math.sqrt(s.hit_rate()) for s in self.strata])
+        return np.maximum(1, np.round(batch * scores / scores.sum())).astype(int)
+
+    def draw(self, h):
+        stratum = self.strata[h]
+        return self.rng.choice(stratum.sources), self.rng.randint(*stratum.amounts)
+
+    def add(self, h, found):
+        stratum = self.strata[h]
+        stratum.n += 1
+        stratum.hits += bool(found)
+        per_key = {}
+        for dest, peer, channel, advantage in found:
+            for key in (('channel', channel), ('peer', peer)):
+                x, y = per_key.get(key, (0, 0))
+                per_key[key] = (x + 1, y + advantage)
+        for key, (x, y) in per_key.items():
+            sums = self.sums.setdefault(key, np.zeros((len(self.strata), 5)))
+            sums[h] += (x, y, x * x, y * y, x * y)
+
+    def estimates(self, confidence=0.95):
+        n = np.array([s.n for s in self.strata], dtype=float)
+        w = np.array([s.weight for s in self.strata])
+        seen = n > 0
+        rows = []
+        for (kind, key), sums in self.sums.items():
+            sx, sy, sxx, syy, sxy = (sums[seen, i] for i in range(5))
+            nh, wh = n[seen], w[seen]
+            X = (wh * sx / nh).sum()
+            if X <= 0:
+                continue
+            R = (wh * sy / nh).sum() / X
+            var = 0.0
+            ok = nh > 1
+            if ok.any():
+                dev = syy - 2 * R * sxy + R * R * sxx - (sy - R * sx) ** 2 / nh
+                s2 = np.maximum(dev[ok], 0) / (nh[ok] - 1)
+                var = (wh[ok] ** 2 * s2 / nh[ok]).sum() / X ** 2
+            half = Z[confidence] * math.sqrt(var)
+            rows.append({
+                'type': kind, 'key': key, 'advantage': R,
+                'ci_low': R - half, 'ci_high': R + half,
+                'routes': int(sx.sum()), 'route_share': X,
+            })
+        return pd.DataFrame(rows, columns=['type', 'key', 'advantage', 'ci_low', 'ci_high', 'routes', 'route_share'])
+
+    def converged(self, rel_tol, abs_tol, min_routes, confidence=0.95):
+        est = self.estimates(confidence)
+        est = est[est['routes'] >= min_routes]
+        if est.empty:
+            return False
+        half = (est['ci_high'] - est['ci_low']) / 2
+        return bool((half <= np.maximum(rel_tol * est['advantage'].abs(), abs_tol)).all())
+
+    def run(self, batch=64, max_runs=10000, rel_tol=0.05, abs_tol=100, min_routes=30, confidence=0.95):
+        """
+        Yields (source, tx_sat, found) per sample until converged or max_runs.
+        """
+        while self.samples < max_runs:
+            for h, k in enumerate(self.allocate(batch)):
+                for _ in range(k):
+                    source, tx_sat = self.draw(h)
+                    found = compete(self.DG, self.mynode, self.channels, source, tx_sat)
+                    self.add(h, found)
+                    yield source, tx_sat, found
+            if self.converged(rel_tol, abs_tol, min_routes, confidence):
+                logging.info(f"Estimates converged after {self.samples} samples")
+                return
+        logging.info(f"Stopped at max_runs={max_runs} before reaching the target precision")
@@ -7,20 +7,34 @@ import sys, os, logging
 from sqlalchemy import create_engine
 from datetime import datetime, date, timedelta
 
+import argparse
+
 import helper
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "5satoshi"))
+import bqload
+import tracing
+
 if __name__ == "__main__":
-    cfg_file = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Copy a MySQL table to BigQuery")
+    parser.add_argument("config", help="Configuration file")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    tracing.configure_from_args("table-transfer", args)
+
+    cfg_file = args.config
     #cfg_file = "forwards-transfer.conf"
     db_config = helper.read_config("mysql",cfg_file)
     
     engine = create_engine("mysql+pymysql://{user}:{pw}@{host}/{db}".format(host=db_config["host"], db=db_config["database"], user=db_config["user"], pw=db_config["password"]))
     
     table_name = db_config["table"]
-    table_df = pd.read_sql_table(
-        table_name,
-        con=engine
-    )
+    with tracing.span("fetch.mysql", table=table_name) as sp:
+        table_df = pd.read_sql_table(
+            table_name,
+            con=engine
+        )
+        sp.set(rows=len(table_df))
     
     bqconf = helper.read_config("bigquery",cfg_file)
-    table_df.to_gbq(bqconf["table"],project_id=bqconf["project_id"],if_exists='replace')
+    bqload.upload(table_df, bqconf["table"], if_exists='replace', project_id=bqconf["project_id"])
@@ -1,37 +1,18 @@
-from pyln.client import LightningRpc
-import pandas
-import networkx as nx
-import matplotlib.pyplot as plt
+import os, sys
 
-l1 = LightningRpc(".lightning/bitcoin/lightning-rpc")
-info = l1.getinfo()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "5satoshi"))
+import graph_stats
+import tracing
 
-channels = l1.listchannels()
-channels.keys()
+tracing.configure("graph-explorer")
 
-dfc = pandas.DataFrame(channels["channels"])
+# Statistics are computed on the columnar listchannels/listnodes arrays,
+# no Python object graph is built (see graph_stats.py for the full report)
+channels, nodes = graph_stats.load_rpc(".lightning/bitcoin/lightning-rpc")
+snap = graph_stats.Snapshot(channels, nodes)
 
-nodes = l1.listnodes()
-nodes.keys()
-
-dfn = pandas.DataFrame(nodes["nodes"])
-
-
-# Create empty graph
-g = nx.Graph()
-
-# Add edges and edge attributes
-for i, elrow in dfc.iterrows():
-    g.add_edge(elrow[0], elrow[1], attr_dict=elrow[2:].to_dict())
-
-# Add node attributes
-for i, nlrow in dfn.iterrows():
-    g.add_node[nlrow['nodeid']] = nlrow[1:].to_dict()
-
-
-print('# of edges: {}'.format(g.number_of_edges()))
-print('# of nodes: {}'.format(g.number_of_nodes()))
+print('# of edges: {}'.format(len(snap.pair_lo)))
+print('# of nodes: {}'.format(snap.n))
 
 # Calculate list of nodes with odd degree
-nodes_odd_degree = [v for v, d in g.degree_iter() if d % 2 == 1]
-
+nodes_odd_degree = list(graph_stats.odd_degree_nodes(snap))